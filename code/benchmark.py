@@ -0,0 +1,281 @@
+"""
+Benchmark de ponta a ponta do ETL de CNPJ sobre dados sintéticos.
+
+Gera (ou reutiliza) um conjunto sintético com 'synthetic_data.py' e mede separadamente as
+etapas do pipeline: extração dos ZIPs ('extract_zip_files'), leitura em chunks
+('read_table_chunks', com o motor de parsing escolhido: pandas ou pyarrow) e carga ('bulk_insert_to_sql') em um destino
+local (SQLite ou DuckDB). Para cada etapa, registra o tempo de parede, a vazão e o pico de
+memória (RSS). O resultado pode ser salvo em JSON e comparado com uma execução anterior para
+detectar regressões de desempenho.
+
+Uso:
+    python code/benchmark.py --companies 100000 --sink duckdb --json resultado.json
+    python code/benchmark.py --companies 100000 --csv-engine pyarrow --baseline resultado.json
+    python code/benchmark.py --companies 100000 --baseline resultado.json --tolerance 0.2
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from cnpj_processor import (
+    CSV_ENGINES, CSV_OPTIONS, EMBEDDED_SINKS, bulk_insert_to_sql, classify_files, configure_csv_parser, create_sink,
+    extract_zip_files, get_table_schemas, read_table_chunks,
+)
+from synthetic_data import generate_synthetic_dataset
+
+RSS_SAMPLE_SECONDS = 0.05
+
+# =============================================================================
+# MEDIÇÃO DE MEMÓRIA
+# =============================================================================
+
+def get_current_rss():
+    """
+    Retorna o RSS atual do processo em bytes: via psutil, se instalado, ou /proc no Linux.
+    Retorna None se nenhuma das fontes estiver disponível.
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def get_max_rss():
+    """Pico de RSS do processo desde o início (resource.getrusage), em bytes; None no Windows."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS, em bytes
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+class StageTimer:
+    """
+    Mede uma etapa do benchmark: tempo de parede e pico de RSS, amostrado por uma thread em
+    segundo plano enquanto a etapa executa. Sem fonte de RSS atual, usa o pico do processo.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.peak_rss = None
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            self._update_peak(get_current_rss())
+
+    def _update_peak(self, rss):
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss or 0, rss)
+
+    def __enter__(self):
+        self._update_peak(get_current_rss())
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._start
+        self._stop.set()
+        self._sampler.join()
+        self._update_peak(get_current_rss())
+        if self.peak_rss is None:
+            self.peak_rss = get_max_rss()
+        return False
+
+# =============================================================================
+# ETAPAS DO BENCHMARK
+# =============================================================================
+
+def stage_result(timer, rows=None, size_bytes=None, **extra):
+    """Monta o resultado de uma etapa, com vazão em linhas/s e MB/s quando aplicável."""
+    result = {'seconds': round(timer.seconds, 3), 'peak_rss_mb': None}
+    if timer.peak_rss is not None:
+        result['peak_rss_mb'] = round(timer.peak_rss / 1024 ** 2, 1)
+    if rows is not None:
+        result['rows'] = rows
+        result['rows_per_second'] = round(rows / timer.seconds) if timer.seconds else 0
+    if size_bytes is not None:
+        result['mb'] = round(size_bytes / 1024 ** 2, 1)
+        result['mb_per_second'] = round(size_bytes / 1024 ** 2 / timer.seconds, 1) if timer.seconds else 0
+    result.update(extra)
+    return result
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path) if os.path.isfile(os.path.join(path, f)))
+
+def run_benchmark(zip_path, work_path, sink_name='sqlite', chunksize=100_000, expected_rows=None):
+    """
+    Executa as etapas de extração, leitura e carga sobre os ZIPs de 'zip_path', usando
+    'work_path' para os arquivos extraídos e o banco local. Retorna {etapa: métricas}.
+    """
+    extracted_path = os.path.join(work_path, 'extracted')
+    os.makedirs(extracted_path, exist_ok=True)
+    results = {}
+
+    logging.info("--- BENCHMARK: EXTRAÇÃO ---")
+    with StageTimer('extract') as timer:
+        extract_zip_files(zip_path, extracted_path)
+    results['extract'] = stage_result(timer, size_bytes=folder_size(extracted_path))
+
+    schemas = get_table_schemas()
+    file_mappings = classify_files(extracted_path)
+
+    # A leitura é medida isoladamente, descartando os chunks, para separar o custo do parse do da carga
+    logging.info(f"--- BENCHMARK: LEITURA (motor '{CSV_OPTIONS['engine']}', em chunks) ---")
+    parsed_rows = {}
+    with StageTimer('parse') as timer:
+        for table_name, files in file_mappings.items():
+            parsed_rows[table_name] = 0
+            for file_name in files:
+                for chunk in read_table_chunks(extracted_path, file_name, schemas[table_name], chunksize):
+                    parsed_rows[table_name] += len(chunk)
+    results['parse'] = stage_result(timer, rows=sum(parsed_rows.values()), size_bytes=folder_size(extracted_path))
+
+    if expected_rows is not None:
+        mismatched = {t: (parsed_rows.get(t, 0), n) for t, n in expected_rows.items() if parsed_rows.get(t, 0) != n}
+        if mismatched:
+            logging.warning(f"Linhas lidas diferem das geradas (lidas, geradas): {mismatched}")
+        results['parse']['row_count_ok'] = not mismatched
+
+    # A carga lê os arquivos novamente, mas cronometra apenas o 'bulk_insert_to_sql'
+    logging.info(f"--- BENCHMARK: CARGA (sink '{sink_name}') ---")
+    db_path = os.path.join(work_path, f'benchmark.{sink_name}')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    sink = create_sink(sink_name, config={'embedded_db_path': db_path})
+    sink.prepare_tables()
+    timer = StageTimer('load')
+    loaded_rows = 0
+    with StageTimer('load_total') as total_timer:
+        for table_name, files in file_mappings.items():
+            for file_name in files:
+                for chunk in read_table_chunks(extracted_path, file_name, schemas[table_name], chunksize):
+                    start = time.perf_counter()
+                    bulk_insert_to_sql(sink, chunk, table_name)
+                    timer.seconds += time.perf_counter() - start
+                    loaded_rows += len(chunk)
+        flush_start = time.perf_counter()
+        sink.close()
+        timer.seconds += time.perf_counter() - flush_start
+    timer.peak_rss = total_timer.peak_rss
+    results['load'] = stage_result(timer, rows=loaded_rows, size_bytes=os.path.getsize(db_path),
+                                   sink=sink_name, wall_seconds=round(total_timer.seconds, 3))
+    return results
+
+# =============================================================================
+# RELATÓRIO E COMPARAÇÃO
+# =============================================================================
+
+def log_results(results):
+    logging.info("--- RESULTADO DO BENCHMARK ---")
+    for stage, metrics in results['stages'].items():
+        parts = [f"{metrics['seconds']:.2f}s"]
+        if 'rows_per_second' in metrics:
+            parts.append(f"{metrics['rows']} linhas ({metrics['rows_per_second']:,} linhas/s)")
+        if 'mb_per_second' in metrics:
+            parts.append(f"{metrics['mb']} MB ({metrics['mb_per_second']} MB/s)")
+        if metrics['peak_rss_mb'] is not None:
+            parts.append(f"pico RSS {metrics['peak_rss_mb']} MB")
+        logging.info(f"  {stage:<8} " + ' | '.join(parts))
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Compara a vazão (linhas/s ou MB/s) de cada etapa com a de um resultado anterior.
+    Retorna a lista de etapas cuja vazão caiu mais que 'tolerance' (fração).
+    """
+    regressions = []
+    for stage, metrics in results['stages'].items():
+        previous = baseline.get('stages', {}).get(stage)
+        if not previous:
+            continue
+        key = 'rows_per_second' if 'rows_per_second' in metrics else 'mb_per_second'
+        if not previous.get(key):
+            continue
+        ratio = metrics[key] / previous[key]
+        logging.info(f"  {stage:<8} {key}: {previous[key]:,} -> {metrics[key]:,} ({ratio - 1:+.1%})")
+        if ratio < 1 - tolerance:
+            regressions.append(stage)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ponta a ponta do ETL de CNPJ com dados sintéticos.")
+    parser.add_argument('--companies', type=int, default=10_000, help="Escala do conjunto sintético (empresas).")
+    parser.add_argument('--data', help="Pasta com ZIPs já gerados; se omitida, gera um conjunto sintético.")
+    parser.add_argument('--sink', choices=sorted(EMBEDDED_SINKS), default='sqlite', help="Destino local da carga.")
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    parser.add_argument('--csv-engine', choices=CSV_ENGINES, default='pandas', help="Motor de parsing dos CSVs.")
+    parser.add_argument('--bad-line-rate', type=float, default=0.001)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workdir', help="Pasta de trabalho (padrão: temporária, removida ao final).")
+    parser.add_argument('--json', help="Grava o resultado neste arquivo JSON.")
+    parser.add_argument('--baseline', help="JSON de uma execução anterior para comparação.")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Queda de vazão tolerada frente ao baseline.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+
+    work_path = args.workdir or tempfile.mkdtemp(prefix='cnpj_benchmark_')
+    os.makedirs(work_path, exist_ok=True)
+    # As linhas malformadas vão para a quarentena, como no ETL
+    configure_csv_parser(args.csv_engine, os.path.join(work_path, 'quarantine'))
+    try:
+        stages = {}
+        expected_rows = None
+        zip_path = args.data
+        if zip_path is None:
+            zip_path = os.path.join(work_path, 'zips')
+            logging.info(f"--- BENCHMARK: GERAÇÃO DE {args.companies} EMPRESAS SINTÉTICAS ---")
+            with StageTimer('generate') as timer:
+                expected_rows = generate_synthetic_dataset(zip_path, args.companies, bad_line_rate=args.bad_line_rate, seed=args.seed)
+            stages['generate'] = stage_result(timer, rows=sum(expected_rows.values()), size_bytes=folder_size(zip_path))
+
+        stages.update(run_benchmark(zip_path, work_path, args.sink, args.chunksize, expected_rows))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(work_path, ignore_errors=True)
+
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'companies': args.companies if args.data is None else None,
+        'sink': args.sink,
+        'chunksize': args.chunksize,
+        'csv_engine': args.csv_engine,
+        'stages': stages,
+    }
+    log_results(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        logging.info(f"Resultado gravado em '{args.json}'.")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        logging.info(f"--- COMPARAÇÃO COM '{args.baseline}' (tolerância {args.tolerance:.0%}) ---")
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            logging.error(f"Regressão de desempenho nas etapas: {', '.join(regressions)}.")
+            sys.exit(1)
+        logging.info("Nenhuma regressão de desempenho acima da tolerância.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Consulta offline de CNPJs no índice gerado pelo ETL ('build_lookup_store'), sem banco de dados.
+
+O índice é um vetor ordenado de CNPJs (uint64) mapeado em memória e pesquisado por busca
+binária; os registros, com os mesmos campos da tabela 'cnpj_completo' (com os sócios em uma
+lista), ficam na mesma ordem em colunas Arrow, também mapeadas em memória. Uma consulta isolada
+leva microssegundos, e consultas em lote localizam milhões de CNPJs em uma única chamada
+vetorizada ('np.searchsorted') e extraem os registros de todas as posições de uma vez ('take'),
+sem decodificar registro a registro.
+
+Uso como biblioteca:
+    with CnpjLookup('../LOOKUP') as lookup:
+        lookup.get('00.000.000/0001-91')
+        lookup.get_many(lista_de_cnpjs)          # DataFrame
+
+Uso pela linha de comando:
+    python code/cnpj_lookup.py 00000000000191 33000167000101
+    python code/cnpj_lookup.py --input cnpjs.txt --output resultado.csv
+    python code/cnpj_lookup.py --build --cache ../PARQUET
+"""
+import argparse
+import json
+import logging
+import os
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from cnpj_processor import (
+    LOOKUP_FORMAT_VERSION, LOOKUP_KEYS_FILE, LOOKUP_RECORDS_FILE, build_lookup_store, import_pyarrow,
+    load_lookup_meta,
+)
+
+class CnpjLookup:
+    """Leitor do índice de consulta offline. Os arquivos são mapeados em memória, não carregados."""
+
+    def __init__(self, store_path):
+        self.meta = load_lookup_meta(store_path)
+        if self.meta is None:
+            raise FileNotFoundError(f"Índice de consulta não encontrado em '{store_path}'.")
+        if self.meta.get('version') != LOOKUP_FORMAT_VERSION:
+            raise ValueError(f"Índice em '{store_path}' tem a versão {self.meta.get('version')}; "
+                             f"esperada {LOOKUP_FORMAT_VERSION}. Gere o índice novamente.")
+        self.fields = self.meta['fields']
+        self.partner_fields = self.meta['partner_fields']
+        rows = self.meta['rows']
+        self.keys = np.memmap(os.path.join(store_path, LOOKUP_KEYS_FILE), dtype='<u8', mode='r', shape=(rows,)) \
+            if rows else np.empty(0, dtype='<u8')
+        self._pa, _ = import_pyarrow()
+        self._records_file = self._pa.memory_map(os.path.join(store_path, LOOKUP_RECORDS_FILE), 'r')
+        self.records = self._pa.ipc.open_file(self._records_file).read_all()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        self.records = None
+        self._records_file.close()
+
+    @staticmethod
+    def normalize(cnpj):
+        """Converte um CNPJ (com ou sem pontuação) na chave inteira; None se não tiver 14 dígitos."""
+        digits = ''.join(ch for ch in str(cnpj) if ch.isdigit())
+        return int(digits) if len(digits) == 14 else None
+
+    @staticmethod
+    def normalize_many(cnpjs):
+        """Versão vetorizada de 'normalize': retorna (chaves uint64, máscara de CNPJs válidos)."""
+        digits = pd.Series(cnpjs, dtype=object).astype(str).str.replace(r'\D', '', regex=True)
+        valid = digits.str.len().eq(14).to_numpy()
+        keys = np.zeros(len(digits), dtype='<u8')
+        keys[valid] = digits[valid].astype('uint64').to_numpy()
+        return keys, valid
+
+    def get(self, cnpj):
+        """Retorna o registro completo de um CNPJ (dicionário) ou None se ele não existir."""
+        key = self.normalize(cnpj)
+        if key is None or not len(self.keys):
+            return None
+        position = int(np.searchsorted(self.keys, np.uint64(key)))
+        if position < len(self.keys) and int(self.keys[position]) == key:
+            return self.records.slice(position, 1).to_pylist()[0]
+        return None
+
+    def get_company(self, cnpj_basico):
+        """Retorna os registros de todos os estabelecimentos de uma empresa (8 primeiros dígitos)."""
+        digits = ''.join(ch for ch in str(cnpj_basico) if ch.isdigit())[:8]
+        if len(digits) != 8:
+            return []
+        first = np.uint64(int(digits) * 1_000_000)
+        start, end = np.searchsorted(self.keys, [first, first + np.uint64(1_000_000)])
+        return self.records.slice(int(start), int(end - start)).to_pylist()
+
+    def locate(self, cnpjs):
+        """
+        Localiza vários CNPJs de uma vez. Retorna um vetor com a posição de cada CNPJ no índice
+        (-1 para os não encontrados ou inválidos), na ordem recebida.
+        """
+        keys, valid = self.normalize_many(cnpjs)
+        positions = np.full(len(keys), -1, dtype=np.int64)
+        if not len(self.keys):
+            return positions
+        found = np.searchsorted(self.keys, keys)
+        in_range = valid & (found < len(self.keys))
+        hit = np.zeros(len(keys), dtype=bool)
+        hit[in_range] = self.keys[found[in_range]] == keys[in_range]
+        positions[hit] = found[hit]
+        return positions
+
+    def get_many(self, cnpjs):
+        """
+        Consulta em lote: retorna um DataFrame com uma linha por CNPJ recebido (na mesma ordem)
+        e os campos do registro; os não encontrados ficam com os campos nulos. Os registros
+        encontrados são extraídos das colunas de uma vez, sem laço por registro em Python.
+        """
+        positions = self.locate(cnpjs)
+        found = np.flatnonzero(positions >= 0)
+        table = self.records.take(positions[found])
+        records = table.drop_columns(['socios']).to_pandas(types_mapper={self._pa.uint8(): pd.UInt8Dtype()}.get)
+        records['socios'] = table.column('socios').to_pylist()
+        records.index = found
+        result = records[self.fields].reindex(range(len(positions)))
+        result.insert(0, 'consulta', list(cnpjs))
+        return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Consulta offline de CNPJs no índice gerado pelo ETL.")
+    parser.add_argument('cnpjs', nargs='*', help="CNPJs a consultar (com ou sem pontuação).")
+    parser.add_argument('--store', default=None, help="Pasta do índice (padrão: LOOKUP_STORE_PATH do .env).")
+    parser.add_argument('--input', help="Arquivo com um CNPJ por linha, para consulta em lote.")
+    parser.add_argument('--output', help="Grava o resultado do lote em CSV (.csv) ou JSON lines (.jsonl).")
+    parser.add_argument('--company', action='store_true', help="Trata os argumentos como CNPJ básico (8 dígitos) "
+                                                               "e retorna todos os estabelecimentos.")
+    parser.add_argument('--build', action='store_true', help="Gera (ou atualiza) o índice a partir do cache Parquet.")
+    parser.add_argument('--cache', help="Pasta do cache Parquet usado no '--build' (padrão: PARQUET_CACHE_PATH do .env).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    # Os caminhos padrão vêm do mesmo .env do ETL, se ele existir
+    load_dotenv(dotenv_path=os.path.join(pathlib.Path(__file__).parent.resolve(), '.env'))
+    store_path = args.store or os.getenv('LOOKUP_STORE_PATH')
+    if not store_path:
+        logging.error("Informe a pasta do índice com '--store' ou defina LOOKUP_STORE_PATH no .env.")
+        sys.exit(1)
+
+    if args.build:
+        cache_path = args.cache or os.getenv('PARQUET_CACHE_PATH')
+        if not cache_path:
+            logging.error("Informe o cache Parquet com '--cache' ou defina PARQUET_CACHE_PATH no .env.")
+            sys.exit(1)
+        build_lookup_store(cache_path, store_path)
+        if not args.cnpjs and not args.input:
+            return
+
+    with CnpjLookup(store_path) as lookup:
+        if args.input:
+            with open(args.input, 'r', encoding='utf-8') as f:
+                cnpjs = [line.strip() for line in f if line.strip()]
+            result = lookup.get_many(cnpjs)
+            found = int(result['cnpj'].notna().sum())
+            logging.info(f"{found} de {len(cnpjs)} CNPJs encontrados.")
+            if args.output and args.output.endswith('.jsonl'):
+                result.to_json(args.output, orient='records', lines=True, force_ascii=False)
+            elif args.output:
+                result.assign(socios=result['socios'].map(lambda s: json.dumps(s, ensure_ascii=False), na_action='ignore')) \
+                      .to_csv(args.output, index=False, sep=';', encoding='utf-8')
+            else:
+                result.to_json(sys.stdout, orient='records', lines=True, force_ascii=False)
+            return
+
+        for cnpj in args.cnpjs:
+            if args.company:
+                records = lookup.get_company(cnpj)
+            else:
+                record = lookup.get(cnpj)
+                records = [record] if record else []
+            if not records:
+                logging.warning(f"CNPJ {cnpj} não encontrado.")
+            for record in records:
+                print(json.dumps(record, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,18 @@
+import argparse
+import asyncio
+import contextlib
+import cProfile
 import datetime
+import functools
 import gc
+import glob
+import hashlib
+import http.client
 import io
+import json
 import logging
+import multiprocessing
+import numpy as np
 import pathlib
 from dotenv import load_dotenv
 import bs4 as bs
@@ -11,13 +22,21 @@ import pyodbc
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import URL
 import re
+import shutil
+import socket
+import sqlite3
+import subprocess
 import sys
+import tempfile
+import threading
 import time
+import tracemalloc
+import warnings
 import requests
 import urllib.request
 import urllib.parse
-import wget
 import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 # =============================================================================
 # FUNÇÕES DE CONFIGURAÇÃO E AMBIENTE
@@ -71,6 +90,67 @@ def load_environment_variables():
         logging.error("Uma ou mais variáveis de ambiente não foram definidas no arquivo .env.")
         sys.exit(1)
 
+    # Configurações opcionais de desempenho (possuem valores padrão)
+    config.update({
+        "download_workers": get_env_int('DOWNLOAD_WORKERS', 4),
+        "download_segments": get_env_int('DOWNLOAD_SEGMENTS', 4),
+        "download_segment_min_mb": get_env_int('DOWNLOAD_SEGMENT_MIN_MB', 100),
+        "stream_from_zip": get_env_bool('STREAM_FROM_ZIP', False),
+        "csv_engine": os.getenv('CSV_ENGINE', 'pandas').strip().lower(),
+        "quarantine_path": os.getenv('QUARANTINE_PATH') or os.path.join(config["output_path"], 'quarantine'),
+        "bulk_sink": os.getenv('BULK_SINK', 'to_sql').strip().lower(),
+        "bcp_batch_rows": get_env_int('BCP_BATCH_ROWS', 1_000_000),
+        "bcp_trusted_connection": get_env_bool('BCP_TRUSTED_CONNECTION', False),
+        "embedded_db_path": os.getenv('EMBEDDED_DB_PATH'),
+        "parse_workers": get_env_int('PARSE_WORKERS', 1),
+        "db_writers": get_env_int('DB_WRITERS', 1),
+        "queue_max_chunks": get_env_int('QUEUE_MAX_CHUNKS', 8),
+        "parquet_cache_path": os.getenv('PARQUET_CACHE_PATH') or None,
+        "parquet_partition_digits": get_env_int('PARQUET_PARTITION_DIGITS', 1),
+        "lookup_store_path": os.getenv('LOOKUP_STORE_PATH') or None,
+        "name_index_path": os.getenv('NAME_INDEX_PATH') or None,
+        "denormalized_table": get_env_bool('DENORMALIZED_TABLE', False),
+        "pipeline_overlap": get_env_bool('PIPELINE_OVERLAP', False),
+        "pipeline_disk_tasks": get_env_int('PIPELINE_DISK_TASKS', 2),
+        "pipeline_cpu_tasks": get_env_int('PIPELINE_CPU_TASKS', 2),
+        "pipeline_db_tasks": get_env_int('PIPELINE_DB_TASKS', 2),
+        "index_columnstore": get_env_bool('INDEX_COLUMNSTORE', False),
+        "index_compression": os.getenv('INDEX_COMPRESSION', 'NONE').strip().upper(),
+        "metrics_jsonl_path": os.getenv('METRICS_JSONL_PATH') or None,
+        "metrics_prometheus_path": os.getenv('METRICS_PROMETHEUS_PATH') or None,
+        "profile_stages": [stage.strip().lower() for stage in os.getenv('PROFILE_STAGES', '').split(',') if stage.strip()],
+        "profile_path": os.getenv('PROFILE_PATH') or os.path.join(config["output_path"], 'profiles'),
+    })
+
+    invalid_stages = set(config["profile_stages"]) - set(METRIC_STAGES)
+    if invalid_stages:
+        logging.error(f"PROFILE_STAGES inválido: {', '.join(sorted(invalid_stages))}. Opções: {', '.join(METRIC_STAGES)}.")
+        sys.exit(1)
+
+    if config["index_compression"] not in INDEX_COMPRESSIONS:
+        logging.error(f"INDEX_COMPRESSION inválido: '{config['index_compression']}'. Opções: {', '.join(INDEX_COMPRESSIONS)}.")
+        sys.exit(1)
+
+    if config["lookup_store_path"] and not config["parquet_cache_path"]:
+        logging.error("LOOKUP_STORE_PATH requer o cache Parquet: defina também PARQUET_CACHE_PATH.")
+        sys.exit(1)
+
+    if config["name_index_path"] and not config["parquet_cache_path"]:
+        logging.error("NAME_INDEX_PATH requer o cache Parquet: defina também PARQUET_CACHE_PATH.")
+        sys.exit(1)
+
+    if config["denormalized_table"] and not config["parquet_cache_path"]:
+        logging.error("DENORMALIZED_TABLE requer o cache Parquet: defina também PARQUET_CACHE_PATH.")
+        sys.exit(1)
+
+    if config["csv_engine"] not in CSV_ENGINES:
+        logging.error(f"CSV_ENGINE inválido: '{config['csv_engine']}'. Opções: {', '.join(CSV_ENGINES)}.")
+        sys.exit(1)
+
+    if config["bulk_sink"] not in SINK_NAMES:
+        logging.error(f"BULK_SINK inválido: '{config['bulk_sink']}'. Opções: {', '.join(SINK_NAMES)}.")
+        sys.exit(1)
+
     makedirs(config["output_path"])
     makedirs(config["extracted_path"])
 
@@ -81,64 +161,601 @@ def load_environment_variables():
 
     return config, db_name
 
+def get_env_int(name, default):
+    """Lê uma variável de ambiente inteira opcional, retornando 'default' se ela não estiver definida."""
+    value = os.getenv(name)
+    if value is None or value.strip() == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logging.error(f"A variável de ambiente '{name}' deve ser um número inteiro (valor atual: '{value}').")
+        sys.exit(1)
+
+def get_env_bool(name, default):
+    """Lê uma variável de ambiente booleana opcional ('true'/'false', '1'/'0', 'sim'/'nao')."""
+    value = os.getenv(name)
+    if value is None or value.strip() == '':
+        return default
+    value = value.strip().lower()
+    if value in ('1', 'true', 'sim', 'yes', 's', 'y'):
+        return True
+    if value in ('0', 'false', 'nao', 'não', 'no', 'n'):
+        return False
+    logging.error(f"A variável de ambiente '{name}' deve ser 'true' ou 'false' (valor atual: '{value}').")
+    sys.exit(1)
+
 def makedirs(path):
-    """Cria um diretório se ele não existir."""
-    if not os.path.exists(path):
-        os.makedirs(path)
+    """Cria um diretório se ele não existir (seguro entre threads do pipeline sobreposto)."""
+    os.makedirs(path, exist_ok=True)
+
+# =============================================================================
+# MÉTRICAS E INSTRUMENTAÇÃO
+# =============================================================================
+
+METRIC_STAGES = ('download', 'extract', 'parse', 'convert', 'insert', 'join')
+# Limites (segundos) do histograma de latência por operação (arquivo baixado, chunk lido, chunk inserido...)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+METRIC_PREFIX = 'cnpj_etl'
+
+class MetricsRegistry:
+    """
+    Acumula métricas por etapa do pipeline ('METRIC_STAGES'): tempo, linhas, bytes, operações,
+    erros e um histograma da latência de cada operação. Cada operação pode ser gravada como uma
+    linha JSON ('jsonl_path') e o agregado como um textfile do Prometheus ('prometheus_path').
+    Para as etapas em 'profile_stages', as operações são perfiladas com cProfile e tracemalloc;
+    os perfis são gravados em 'profile_path' por 'write_profiles'.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jsonl_file = None
+        self.configure()
+
+    def configure(self, jsonl_path=None, prometheus_path=None, profile_stages=(), profile_path=None):
+        self.close()
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.profile_stages = set(profile_stages)
+        self.profile_path = profile_path
+        self._profilers = {}
+        self._profiling = set()
+        self.reset()
+        if self.profile_stages and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def config(self):
+        """Configuração atual, para reaplicá-la nos processos de parsing ('_init_parse_worker')."""
+        return {'jsonl_path': self.jsonl_path, 'prometheus_path': self.prometheus_path,
+                'profile_stages': sorted(self.profile_stages), 'profile_path': self.profile_path}
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.python_peak_bytes = {}
+
+    def _stage_totals(self, stage, table_name):
+        key = (stage, table_name or '')
+        if key not in self.stages:
+            self.stages[key] = {'seconds': 0.0, 'rows': 0, 'bytes': 0, 'operations': 0, 'errors': 0,
+                                'buckets': [0] * len(LATENCY_BUCKETS)}
+        return self.stages[key]
+
+    def record(self, stage, seconds, rows=0, size_bytes=0, table_name=None, **fields):
+        """Registra uma operação concluída de uma etapa (e a grava no JSON lines, se ativo)."""
+        with self._lock:
+            totals = self._stage_totals(stage, table_name)
+            totals['seconds'] += seconds
+            totals['rows'] += rows
+            totals['bytes'] += size_bytes
+            totals['operations'] += 1
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    totals['buckets'][i] += 1
+                    break
+        self.emit({'event': 'operation', 'stage': stage, 'table': table_name, 'seconds': round(seconds, 6),
+                   'rows': rows, 'bytes': size_bytes, **fields})
+
+    def record_error(self, stage, table_name=None, **fields):
+        with self._lock:
+            self._stage_totals(stage, table_name)['errors'] += 1
+        self.emit({'event': 'error', 'stage': stage, 'table': table_name, **fields})
+
+    @contextlib.contextmanager
+    def stage(self, stage, table_name=None, **fields):
+        """
+        Mede uma operação de uma etapa. O bloco pode preencher 'rows' e 'bytes' no dicionário
+        retornado. Só operações concluídas entram no tempo; exceções contam como erro, exceto
+        StopIteration (fim de um iterador de chunks), que é apenas repassada.
+        """
+        event = {'rows': 0, 'bytes': 0}
+        profiled = self._start_profile(stage)
+        start = time.perf_counter()
+        try:
+            yield event
+        except StopIteration:
+            raise
+        except Exception as e:
+            self.record_error(stage, table_name, error=str(e), **fields)
+            raise
+        else:
+            self.record(stage, time.perf_counter() - start, event['rows'], event['bytes'], table_name, **fields)
+        finally:
+            if profiled:
+                self._stop_profile(stage)
+
+    def _start_profile(self, stage):
+        """Ativa o cProfile da etapa, se ela for perfilada e o perfilador estiver livre."""
+        if stage not in self.profile_stages:
+            return False
+        with self._lock:
+            if self._profiling:
+                # Um perfilador por vez: operações concorrentes (outras threads) não são perfiladas
+                return False
+            self._profiling.add(stage)
+            profiler = self._profilers.setdefault(stage, cProfile.Profile())
+        tracemalloc.reset_peak()
+        try:
+            profiler.enable()
+        except ValueError:
+            with self._lock:
+                self._profiling.discard(stage)
+            return False
+        return True
+
+    def _stop_profile(self, stage):
+        self._profilers[stage].disable()
+        peak = tracemalloc.get_traced_memory()[1]
+        with self._lock:
+            self.python_peak_bytes[stage] = max(self.python_peak_bytes.get(stage, 0), peak)
+            self._profiling.discard(stage)
+
+    def emit(self, record):
+        """Grava um registro no arquivo JSON lines, se configurado."""
+        if not self.jsonl_path:
+            return
+        record = {'ts': round(time.time(), 3), 'pid': os.getpid(), **record}
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            if self._jsonl_file is None:
+                self._jsonl_file = open(self.jsonl_path, 'a', encoding='utf-8')
+            # Uma única escrita por linha: processos de parsing gravam no mesmo arquivo (modo append)
+            self._jsonl_file.write(line)
+            self._jsonl_file.flush()
+
+    def snapshot(self):
+        """Cópia dos agregados, enviada pelos processos de parsing ao processo principal."""
+        with self._lock:
+            return {'stages': {key: dict(totals, buckets=list(totals['buckets'])) for key, totals in self.stages.items()},
+                    'python_peak_bytes': dict(self.python_peak_bytes)}
+
+    def merge(self, snapshot):
+        """Soma ao registro os agregados de outro processo ('snapshot')."""
+        with self._lock:
+            for key, other in snapshot['stages'].items():
+                totals = self._stage_totals(*key)
+                for name in ('seconds', 'rows', 'bytes', 'operations', 'errors'):
+                    totals[name] += other[name]
+                totals['buckets'] = [a + b for a, b in zip(totals['buckets'], other['buckets'])]
+            for stage, peak in snapshot['python_peak_bytes'].items():
+                self.python_peak_bytes[stage] = max(self.python_peak_bytes.get(stage, 0), peak)
+
+    def write_prometheus(self):
+        """Grava os agregados no formato textfile do Prometheus (substituição atômica do arquivo)."""
+        if not self.prometheus_path:
+            return
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{prometheus_label_value(v)}"' for k, v in labels.items())
+                lines.append(f'{METRIC_PREFIX}_{name}{{{label_text}}} {value}' if label_text else f'{METRIC_PREFIX}_{name} {value}')
+
+        def labels(key):
+            return {'stage': key[0], 'table': key[1]}
+
+        items = sorted(snapshot['stages'].items())
+        metric('stage_seconds_total', 'counter', 'Tempo acumulado das operações da etapa.',
+               [(labels(key), round(t['seconds'], 6)) for key, t in items])
+        metric('stage_rows_total', 'counter', 'Linhas processadas pela etapa.', [(labels(key), t['rows']) for key, t in items])
+        metric('stage_bytes_total', 'counter', 'Bytes processados pela etapa.', [(labels(key), t['bytes']) for key, t in items])
+        metric('stage_errors_total', 'counter', 'Operações da etapa que falharam.', [(labels(key), t['errors']) for key, t in items])
+
+        # Histograma por etapa (somando as tabelas), com buckets cumulativos
+        histograms = {}
+        for (stage, _), t in items:
+            h = histograms.setdefault(stage, {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0})
+            h['buckets'] = [a + b for a, b in zip(h['buckets'], t['buckets'])]
+            h['sum'] += t['seconds']
+            h['count'] += t['operations']
+        samples = []
+        for stage, h in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, h['buckets']):
+                cumulative += count
+                samples.append(({'stage': stage, 'le': bound}, cumulative))
+            samples.append(({'stage': stage, 'le': '+Inf'}, h['count']))
+        lines.append(f'# HELP {METRIC_PREFIX}_operation_seconds Latência de cada operação (arquivo ou chunk) da etapa.')
+        lines.append(f'# TYPE {METRIC_PREFIX}_operation_seconds histogram')
+        for sample_labels, value in samples:
+            stage = prometheus_label_value(sample_labels['stage'])
+            lines.append(f'{METRIC_PREFIX}_operation_seconds_bucket{{stage="{stage}",le="{sample_labels["le"]}"}} {value}')
+        for stage, h in sorted(histograms.items()):
+            stage = prometheus_label_value(stage)
+            lines.append(f'{METRIC_PREFIX}_operation_seconds_sum{{stage="{stage}"}} {round(h["sum"], 6)}')
+            lines.append(f'{METRIC_PREFIX}_operation_seconds_count{{stage="{stage}"}} {h["count"]}')
+
+        peak_rss = get_peak_rss()
+        metric('peak_rss_bytes', 'gauge', 'Pico de memória residente (RSS) do processo principal e dos filhos.',
+               [({'process': name}, value) for name, value in peak_rss.items()])
+        metric('stage_python_peak_bytes', 'gauge', 'Pico de memória Python (tracemalloc) das etapas perfiladas.',
+               [({'stage': stage}, peak) for stage, peak in sorted(snapshot['python_peak_bytes'].items())])
+        metric('last_update_timestamp_seconds', 'gauge', 'Momento da última gravação das métricas.', [({}, round(time.time()))])
+
+        temp_path = self.prometheus_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temp_path, self.prometheus_path)
+
+    def write_profiles(self):
+        """Grava os perfis cProfile ('<etapa>-<pid>.prof') e as maiores alocações do tracemalloc."""
+        if not self._profilers or not self.profile_path:
+            return
+        makedirs(self.profile_path)
+        for stage, profiler in self._profilers.items():
+            profiler.dump_stats(os.path.join(self.profile_path, f'{stage}-{os.getpid()}.prof'))
+        if tracemalloc.is_tracing():
+            top_stats = tracemalloc.take_snapshot().statistics('lineno')[:30]
+            with open(os.path.join(self.profile_path, f'tracemalloc-{os.getpid()}.txt'), 'w', encoding='utf-8') as f:
+                f.write('\n'.join(str(stat) for stat in top_stats) + '\n')
+
+    def log_summary(self):
+        """Registra no log o tempo, as linhas e a vazão de cada etapa."""
+        totals = {}
+        for (stage, _), t in self.snapshot()['stages'].items():
+            s = totals.setdefault(stage, {'seconds': 0.0, 'rows': 0, 'bytes': 0, 'operations': 0, 'errors': 0})
+            for name in s:
+                s[name] += t[name]
+        if not totals:
+            return
+        logging.info("Métricas por etapa (tempo somado das operações):")
+        for stage in [s for s in METRIC_STAGES if s in totals] + sorted(set(totals) - set(METRIC_STAGES)):
+            s = totals[stage]
+            rate = f", {s['rows'] / s['seconds']:,.0f} linhas/s" if s['rows'] and s['seconds'] else ''
+            logging.info(f"  - {stage}: {s['operations']} operações em {s['seconds']:.1f}s, {s['rows']} linhas, "
+                         f"{s['bytes'] / 1024 / 1024:.1f} MB{rate}, {s['errors']} erros.")
+
+    def flush(self):
+        """Grava o textfile do Prometheus, os perfis e o resumo no log."""
+        self.emit({'event': 'summary', 'stages': {f'{k[0]}:{k[1]}': v for k, v in self.snapshot()['stages'].items()},
+                   'peak_rss_bytes': get_peak_rss()})
+        self.write_prometheus()
+        self.write_profiles()
+        self.log_summary()
+
+    def close(self):
+        with self._lock:
+            if self._jsonl_file is not None:
+                self._jsonl_file.close()
+                self._jsonl_file = None
+
+def prometheus_label_value(value):
+    """Escapa um valor de label do Prometheus (barra invertida, aspas e quebra de linha)."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def get_peak_rss():
+    """Pico de RSS (bytes) deste processo e dos processos filhos já encerrados; vazio no Windows."""
+    try:
+        import resource
+    except ImportError:
+        return {}
+    # Linux informa ru_maxrss em KB; macOS, em bytes
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'main': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+# Registro de métricas do processo (configurado em 'main' a partir do .env)
+METRICS = MetricsRegistry()
 
 # =============================================================================
 # FUNÇÕES DE DOWNLOAD E EXTRAÇÃO
 # =============================================================================
 
-def download_data_files(data_url, output_path):
+DOWNLOAD_BLOCK_SIZE = 1024 * 1024  # 1 MB por leitura/gravação
+ZIP_MEMBER_SEPARATOR = '::'        # Separa o nome do ZIP do nome do membro ('arquivo.zip::membro')
+
+def download_data_files(data_url, output_path, workers=4, segments=4, segment_min_bytes=100 * 1024 * 1024,
+                        known_remote=None):
     """
     Baixa todos os arquivos .zip do diretório de dados da Receita Federal.
+    Os arquivos são baixados em paralelo ('workers' simultâneos); arquivos grandes são divididos
+    em 'segments' intervalos HTTP Range e downloads interrompidos são retomados de onde pararam.
+    'known_remote' traz os metadados remotos registrados no manifesto (ver 'download_file').
+    Retorna um dicionário {arquivo: metadados remotos}.
     """
     logging.info("--- INICIANDO ETAPA DE DOWNLOAD ---")
 
+    data_url, files_to_download = list_remote_zip_files(data_url)
+    logging.info('Arquivos que serão baixados:')
+    for i, f in enumerate(files_to_download, 1):
+        logging.info(f'{i} - {f}')
+
+    remote_files, failed_files = download_files_parallel(data_url, files_to_download, output_path, workers,
+                                                         segments, segment_min_bytes, known_remote=known_remote)
+    if failed_files:
+        logging.error(f"{len(failed_files)} arquivo(s) não puderam ser baixados: {', '.join(sorted(failed_files))}")
+        logging.error("Execute o processo novamente para retomar os downloads incompletos.")
+        sys.exit(1)
+    return remote_files
+
+def list_remote_zip_files(data_url):
+    """
+    Lista os arquivos .zip disponíveis na URL de dados ou, se não houver nenhum, no
+    subdiretório mais recente dela. Retorna (URL efetiva, [arquivos]).
+    """
     try:
-        files_to_download = get_zip_files_from_url(data_url)
+        return data_url, get_zip_files_from_url(data_url)
     except (urllib.error.URLError, SystemExit):
         logging.warning("Não foi possível encontrar arquivos .zip na URL base, tentando encontrar subdiretório mais recente...")
         try:
             latest_data_url = get_latest_data_url(data_url)
-            files_to_download = get_zip_files_from_url(latest_data_url)
-            data_url = latest_data_url
+            return latest_data_url, get_zip_files_from_url(latest_data_url)
         except (urllib.error.URLError, SystemExit):
             sys.exit(1) # Erro já foi logado pelas funções filhas
 
-    logging.info('Arquivos que serão baixados:')
-    for i, f in enumerate(files_to_download, 1):
-        logging.info(f'{i} - {f}')
+def download_files_parallel(data_url, file_names, output_path, workers=4, segments=4,
+                            segment_min_bytes=100 * 1024 * 1024, max_retries=3, delay_seconds=10,
+                            known_remote=None):
+    """
+    Baixa vários arquivos de 'data_url' simultaneamente para 'output_path'.
+    Retorna uma tupla ({arquivo: metadados remotos}, [arquivos cujo download falhou]).
+    """
+    known_remote = known_remote or {}
+    remote_files, failed_files = {}, []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(
+                download_file,
+                urllib.parse.urljoin(data_url, file_name),
+                os.path.join(output_path, file_name),
+                segments, segment_min_bytes, max_retries, delay_seconds,
+                known_remote.get(file_name)
+            ): file_name
+            for file_name in file_names
+        }
+        for future in as_completed(futures):
+            file_name = futures[future]
+            try:
+                remote_files[file_name] = future.result()
+            except Exception as e:
+                logging.error(f"Falha ao baixar o arquivo {file_name}. Erro: {e}")
+                METRICS.record_error('download', file=file_name, error=str(e))
+                failed_files.append(file_name)
+    return remote_files, failed_files
+
+def download_file(url, local_path, segments=4, segment_min_bytes=100 * 1024 * 1024, max_retries=3, delay_seconds=10,
+                  known_remote=None):
+    """
+    Baixa um arquivo de forma retomável, gravando em '<arquivo>.part' até que o tamanho final
+    confira com o Content-Length do servidor. Só então o arquivo recebe o nome definitivo.
+    Se 'known_remote' (metadados do download anterior) indicar que o arquivo mudou no servidor
+    (ETag ou Last-Modified diferentes), a cópia local e os parciais são descartados.
+    Retorna os metadados remotos do arquivo ('get_remote_file_info').
+    """
+    file_name = os.path.basename(local_path)
+    info = get_remote_file_info(url, max_retries, delay_seconds)
+    total_size = info['size']
+    part_path = local_path + '.part'
+
+    if known_remote and remote_file_changed(known_remote, info):
+        logging.info(f"Arquivo {file_name} foi atualizado no servidor. Descartando a cópia local.")
+        for stale_path in [local_path, part_path] + glob.glob(glob.escape(part_path) + '.*-*'):
+            if os.path.isfile(stale_path):
+                os.remove(stale_path)
+
+    if os.path.isfile(local_path):
+        local_size = os.path.getsize(local_path)
+        if total_size is None or local_size == total_size:
+            logging.info(f"Arquivo {file_name} já existe localmente e está completo. Pulando download.")
+            return info
+        if local_size < total_size and not os.path.isfile(part_path):
+            logging.warning(f"Arquivo {file_name} incompleto ({local_size} de {total_size} bytes). Retomando download.")
+            os.replace(local_path, part_path)
+        else:
+            logging.warning(f"Arquivo {file_name} com tamanho inválido ({local_size} de {total_size} bytes). Baixando novamente.")
+            os.remove(local_path)
+
+    # Um .part sem segmentos é um download simples interrompido: continua no mesmo modo.
+    resuming_single = os.path.isfile(part_path) and not glob.glob(glob.escape(part_path) + '.*-*')
+    use_segments = (segments > 1 and info['accept_ranges'] and total_size is not None
+                    and total_size >= segment_min_bytes and not resuming_single)
+
+    logging.info(f"Baixando arquivo: {file_name} ({'desconhecido' if total_size is None else total_size} bytes"
+                 f"{f', {segments} segmentos' if use_segments else ''})")
+    download_start = time.time()
+    if use_segments:
+        download_segmented(url, part_path, total_size, segments, max_retries, delay_seconds)
+    else:
+        download_range(url, part_path, 0, total_size, max_retries, delay_seconds)
+
+    final_size = os.path.getsize(part_path)
+    if total_size is not None and final_size != total_size:
+        raise IOError(f"Tamanho final de {file_name} ({final_size} bytes) difere do Content-Length ({total_size} bytes).")
+    os.replace(part_path, local_path)
+
+    elapsed = max(time.time() - download_start, 1e-6)
+    logging.info(f"Arquivo {file_name} baixado em {round(elapsed)}s ({final_size / elapsed / 1024 / 1024:.1f} MB/s).")
+    METRICS.record('download', elapsed, size_bytes=final_size, file=file_name, segmented=use_segments)
+    return info
+
+def remote_file_changed(known_remote, info):
+    """Indica se o ETag ou o Last-Modified de um arquivo remoto diferem dos registrados anteriormente."""
+    for key in ('etag', 'last_modified'):
+        if known_remote.get(key) and info.get(key) and known_remote[key] != info[key]:
+            return True
+    return False
+
+def download_segmented(url, part_path, total_size, segments, max_retries=3, delay_seconds=10):
+    """
+    Baixa um arquivo em 'segments' intervalos HTTP Range paralelos. Cada intervalo é gravado em
+    '<part_path>.<i>-<n>' (o que permite retomá-lo isoladamente) e, ao final, os segmentos são
+    concatenados em 'part_path'.
+    """
+    segment_size = -(-total_size // segments)
+    bounds = [(start, min(start + segment_size, total_size)) for start in range(0, total_size, segment_size)]
+    segment_paths = [f"{part_path}.{i}-{len(bounds)}" for i in range(len(bounds))]
+
+    # Segmentos de uma execução com outra quantidade de partes não são reaproveitáveis.
+    for stale_path in glob.glob(glob.escape(part_path) + '.*-*'):
+        if stale_path not in segment_paths:
+            os.remove(stale_path)
+
+    with ThreadPoolExecutor(max_workers=len(bounds)) as executor:
+        futures = [
+            executor.submit(download_range, url, path, start, end, max_retries, delay_seconds)
+            for path, (start, end) in zip(segment_paths, bounds)
+        ]
+        for future in futures:
+            future.result()
+
+    for path, (start, end) in zip(segment_paths, bounds):
+        if os.path.getsize(path) != end - start:
+            raise IOError(f"Segmento {path} incompleto ({os.path.getsize(path)} de {end - start} bytes).")
+
+    with open(part_path, 'wb') as out_file:
+        for path in segment_paths:
+            with open(path, 'rb') as segment_file:
+                shutil.copyfileobj(segment_file, out_file, DOWNLOAD_BLOCK_SIZE)
+    for path in segment_paths:
+        os.remove(path)
+
+def download_range(url, path, start=0, end=None, max_retries=3, delay_seconds=10):
+    """
+    Baixa os bytes [start, end) de uma URL, anexando-os ao arquivo 'path' e retomando a partir do
+    que já foi gravado nele. Se 'end' é None, baixa até o fim do arquivo remoto.
+    Quedas de conexão no meio da transferência seguem as mesmas retentativas de 'urlopen_with_retry'.
+    """
+    for attempt in range(max_retries):
+        written = os.path.getsize(path) if os.path.isfile(path) else 0
+        offset = start + written
+        if end is not None and offset >= end:
+            return
 
-    for file_name in files_to_download:
-        url = urllib.parse.urljoin(data_url, file_name)
-        local_file_path = os.path.join(output_path, file_name)
+        request = urllib.request.Request(url)
+        if offset > 0 or start > 0:
+            request.add_header('Range', f"bytes={offset}-{'' if end is None else end - 1}")
 
-        logging.info(f'Baixando arquivo: {file_name}')
-        if not os.path.isfile(local_file_path):
-            wget.download(url, out=output_path, bar=bar_progress)
-        else:
-            logging.info("Arquivo já existe localmente. Pulando download.")
+        try:
+            with urlopen_with_retry(request, max_retries, delay_seconds) as response:
+                mode = 'ab'
+                if offset > 0 and response.status != 206:
+                    if start > 0:
+                        raise IOError(f"O servidor ignorou o cabeçalho Range ao baixar {url}.")
+                    # Servidor não suporta retomada: recomeça o arquivo do zero.
+                    mode, offset = 'wb', 0
+
+                remaining = None if end is None else end - offset
+                with open(path, mode) as f:
+                    while remaining is None or remaining > 0:
+                        block_size = DOWNLOAD_BLOCK_SIZE if remaining is None else min(DOWNLOAD_BLOCK_SIZE, remaining)
+                        block = response.read(block_size)
+                        if not block:
+                            break
+                        f.write(block)
+                        if remaining is not None:
+                            remaining -= len(block)
+
+            if end is None or os.path.getsize(path) >= end - start:
+                return
+            logging.warning(f"Conexão encerrada antes do fim ao baixar {url} ({os.path.getsize(path)} de {end - start} bytes).")
+        except urllib.error.URLError:
+            raise # As retentativas já foram esgotadas em 'urlopen_with_retry'
+        except (http.client.HTTPException, ConnectionError, socket.timeout) as e:
+            logging.warning(f"Transferência de {url} interrompida. Erro: {e}")
+
+        if attempt < max_retries - 1:
+            logging.info(f"Aguardando {delay_seconds}s para retomar o download...")
+            time.sleep(delay_seconds)
+
+    raise IOError(f"Download de {url} incompleto após {max_retries} tentativas.")
+
+def get_remote_file_info(url, max_retries=3, delay_seconds=10):
+    """
+    Consulta (HEAD) os metadados de um arquivo remoto: tamanho (Content-Length), suporte a
+    HTTP Range, Last-Modified e ETag.
+    """
+    request = urllib.request.Request(url, method='HEAD')
+    with urlopen_with_retry(request, max_retries, delay_seconds) as response:
+        headers = response.headers
+    size = headers.get('Content-Length')
+    return {
+        'size': int(size) if size is not None else None,
+        'accept_ranges': headers.get('Accept-Ranges', '').lower() == 'bytes',
+        'last_modified': headers.get('Last-Modified'),
+        'etag': headers.get('ETag'),
+    }
 
-def extract_zip_files(output_path, extracted_path):
+def extract_zip_files(output_path, extracted_path, zip_names=None):
     """
     Extrai todos os arquivos .zip da pasta de output para a pasta de extração.
+    Se 'zip_names' for informado, extrai apenas esses arquivos.
     """
     logging.info("--- INICIANDO ETAPA DE EXTRAÇÃO ---")
     zip_files = [f for f in os.listdir(output_path) if f.endswith('.zip')]
+    if zip_names is not None:
+        zip_files = [f for f in zip_files if f in zip_names]
 
     for i, file_name in enumerate(zip_files, 1):
         logging.info(f'Descompactando arquivo: {i}/{len(zip_files)} - {file_name}')
         full_path = os.path.join(output_path, file_name)
         try:
-            with zipfile.ZipFile(full_path, 'r') as zip_ref:
+            with METRICS.stage('extract', file=file_name) as event, zipfile.ZipFile(full_path, 'r') as zip_ref:
                 zip_ref.extractall(extracted_path)
+                event['bytes'] = sum(info.file_size for info in zip_ref.infolist())
         except zipfile.BadZipFile:
             logging.warning(f"O arquivo {file_name} não é um ZIP válido ou está corrompido. Ignorando.")
         except Exception as e:
             logging.warning(f"Erro inesperado ao descompactar {file_name}: {e}. Ignorando.")
 
+def list_zip_members(output_path, zip_names=None):
+    """
+    Lista os arquivos contidos em todos os ZIPs de 'output_path' (ou só nos de 'zip_names'),
+    no formato 'arquivo.zip::membro', sem extraí-los.
+    """
+    members = []
+    if zip_names is None:
+        zip_names = [f for f in os.listdir(output_path) if f.endswith('.zip')]
+    for zip_name in sorted(zip_names):
+        try:
+            with zipfile.ZipFile(os.path.join(output_path, zip_name), 'r') as zip_ref:
+                members.extend(
+                    f"{zip_name}{ZIP_MEMBER_SEPARATOR}{info.filename}"
+                    for info in zip_ref.infolist() if not info.is_dir()
+                )
+        except zipfile.BadZipFile:
+            logging.warning(f"O arquivo {zip_name} não é um ZIP válido ou está corrompido. Ignorando.")
+    return members
+
+@contextlib.contextmanager
+def open_data_file(data_path, file_name):
+    """
+    Abre um arquivo de dados para leitura binária. 'file_name' pode ser um CSV extraído em
+    'data_path' ou um membro 'arquivo.zip::membro', lido diretamente de dentro do ZIP.
+    """
+    if ZIP_MEMBER_SEPARATOR in file_name:
+        zip_name, member = file_name.split(ZIP_MEMBER_SEPARATOR, 1)
+        with zipfile.ZipFile(os.path.join(data_path, zip_name), 'r') as zip_ref:
+            with zip_ref.open(member) as stream:
+                yield stream
+    else:
+        with open(os.path.join(data_path, file_name), 'rb') as f:
+            yield f
+
 def get_latest_data_url(base_url):
     """Encontra o diretório de dados mais recente na URL base."""
     logging.info(f"Buscando diretórios em: {base_url}")
@@ -169,24 +786,921 @@ def get_zip_files_from_url(data_url):
     return zip_files
 
 def urlopen_with_retry(url, max_retries=3, delay_seconds=10):
-    """Tenta abrir uma URL com retentativas em caso de falha."""
+    """
+    Tenta abrir uma URL com retentativas em caso de falha.
+    'url' pode ser uma string ou um 'urllib.request.Request' (para HEAD ou cabeçalhos Range).
+    """
+    target = url.full_url if isinstance(url, urllib.request.Request) else url
     for attempt in range(max_retries):
         try:
             return urllib.request.urlopen(url, timeout=60)
         except urllib.error.URLError as e:
-            logging.warning(f"Falha ao acessar {url}. Erro: {e}")
+            logging.warning(f"Falha ao acessar {target}. Erro: {e}")
             if attempt < max_retries - 1:
                 logging.info(f"Aguardando {delay_seconds}s para nova tentativa...")
                 time.sleep(delay_seconds)
             else:
-                logging.error(f"Todas as tentativas de conexão com {url} falharam.")
+                logging.error(f"Todas as tentativas de conexão com {target} falharam.")
                 raise
 
-def bar_progress(current, total, width=80):
-    """Barra de progresso para o wget."""
-    progress_message = f"Baixando: {current / total * 100:.1f}% [{current} / {total}] bytes"
-    sys.stdout.write("\r" + progress_message)
-    sys.stdout.flush()
+# =============================================================================
+# FUNÇÕES DE CARGA INCREMENTAL (MANIFESTO)
+# =============================================================================
+
+MANIFEST_FILE_NAME = 'manifest.json'
+STAGING_SUFFIX = '_staging'
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+def load_manifest(output_path):
+    """
+    Lê o manifesto da última execução, que registra a impressão digital de cada arquivo
+    (metadados remotos e locais) e das entradas de cada tabela carregada.
+    """
+    manifest_path = os.path.join(output_path, MANIFEST_FILE_NAME)
+    if not os.path.isfile(manifest_path):
+        return {'files': {}, 'tables': {}}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Manifesto '{manifest_path}' ilegível ({e}). Todas as tabelas serão recarregadas.")
+        return {'files': {}, 'tables': {}}
+    manifest.setdefault('files', {})
+    manifest.setdefault('tables', {})
+    return manifest
+
+def save_manifest(output_path, manifest):
+    """Grava o manifesto de forma atômica (arquivo temporário + rename)."""
+    manifest_path = os.path.join(output_path, MANIFEST_FILE_NAME)
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+def compute_file_sha256(path):
+    """Calcula o hash SHA-256 do conteúdo de um arquivo."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def fingerprint_local_files(output_path, manifest):
+    """
+    Calcula a impressão digital (tamanho, data de modificação e SHA-256) de cada ZIP local.
+    O hash registrado no manifesto é reaproveitado quando o tamanho e a data não mudaram.
+    """
+    return {zip_name: fingerprint_local_file(output_path, zip_name, manifest)
+            for zip_name in sorted(f for f in os.listdir(output_path) if f.endswith('.zip'))}
+
+def fingerprint_local_file(output_path, zip_name, manifest):
+    """Impressão digital de um ZIP local (ver 'fingerprint_local_files')."""
+    stat = os.stat(os.path.join(output_path, zip_name))
+    previous = manifest['files'].get(zip_name, {}).get('local', {})
+    if previous.get('size') == stat.st_size and previous.get('mtime_ns') == stat.st_mtime_ns:
+        sha256 = previous['sha256']
+    else:
+        sha256 = compute_file_sha256(os.path.join(output_path, zip_name))
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+
+def get_table_fingerprints(output_path, local_files):
+    """
+    Retorna {tabela: impressão digital}, combinando os hashes dos ZIPs que alimentam cada tabela
+    e a assinatura do seu schema (uma mudança de tipos também exige recarregar a tabela).
+    A relação tabela -> ZIPs vem da classificação dos membros dos ZIPs ('classify_files').
+    """
+    file_mappings = classify_files(output_path, from_zip=True)
+    fingerprints = {}
+    for table_name, members in file_mappings.items():
+        zip_names = sorted({member.split(ZIP_MEMBER_SEPARATOR, 1)[0] for member in members})
+        if zip_names:
+            fingerprints[table_name] = get_table_fingerprint(table_name, zip_names, local_files)
+    return fingerprints
+
+def get_table_fingerprint(table_name, zip_names, local_files):
+    """
+    Impressão digital de uma tabela a partir dos seus ZIPs (ver 'get_table_fingerprints'). Os
+    schemas das suas tabelas-ponte entram junto: elas são criadas e carregadas com a tabela, e
+    uma ponte nova ou alterada exige recarregá-la também na carga incremental.
+    """
+    zip_names = sorted(zip_names)
+    digest = hashlib.sha256(get_schema_signature(table_name).encode('utf-8'))
+    for bridge_name in get_bridge_tables(table_name):
+        digest.update(f"{bridge_name}:{get_schema_signature(bridge_name)};".encode('utf-8'))
+    for zip_name in zip_names:
+        digest.update(f"{zip_name}:{local_files[zip_name]['sha256']};".encode('utf-8'))
+    return {'fingerprint': digest.hexdigest(), 'zip_files': zip_names}
+
+def get_changed_tables(table_fingerprints, manifest):
+    """Lista as tabelas cujas entradas mudaram desde a última carga registrada no manifesto."""
+    changed = []
+    for table_name, table_info in table_fingerprints.items():
+        previous = manifest['tables'].get(table_name, {})
+        if previous.get('fingerprint') != table_info['fingerprint']:
+            changed.append(table_name)
+    return changed
+
+def update_manifest_files(manifest, remote_files=None, local_files=None):
+    """Registra no manifesto os metadados remotos e/ou locais dos arquivos."""
+    for key, files in (('remote', remote_files), ('local', local_files)):
+        for file_name, info in (files or {}).items():
+            manifest['files'].setdefault(file_name, {})[key] = info
+
+def update_manifest_tables(manifest, table_fingerprints, loaded_tables):
+    """Registra no manifesto as impressões digitais das tabelas carregadas com sucesso."""
+    loaded_at = datetime.datetime.now().isoformat(timespec='seconds')
+    for table_name in loaded_tables:
+        if table_name in table_fingerprints:
+            manifest['tables'][table_name] = dict(table_fingerprints[table_name], loaded_at=loaded_at)
+
+# =============================================================================
+# JORNAL DE CARGA (CHECKPOINT E RETOMADA)
+# =============================================================================
+
+LOAD_JOURNAL_FILE = 'load_journal.jsonl'
+RETRY_QUEUE_DIR = 'retry_queue'
+
+class LoadJournal:
+    """
+    Jornal de progresso da carga, em JSON lines no OUTPUT_FILES_PATH. Cada execução começa com
+    um evento 'run' (tabelas, modo, sufixo de destino e impressões digitais das entradas); cada
+    chunk gera um evento 'pending' antes da escrita e 'committed' quando o sink confirma a
+    gravação, com tabela, arquivo, índice do chunk, linha inicial, bytes lidos do arquivo e
+    linhas. Chunks que falham são salvos na fila de retentativa ('failed') e reenviados ao final
+    da carga. Com '--resume', uma carga interrompida continua a partir dos chunks confirmados.
+    Cada evento é gravado com fsync; o registro é seguro entre threads (escritores paralelos).
+    """
+
+    def __init__(self, output_path):
+        self.path = os.path.join(output_path, LOAD_JOURNAL_FILE)
+        self.retry_path = os.path.join(output_path, RETRY_QUEUE_DIR)
+        self.run = None
+        self.chunks = {}  # (tabela, arquivo) -> {índice do chunk: último evento}
+        self.files = {}   # (tabela, arquivo) -> total de chunks do arquivo, ao fim da leitura
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self):
+        """Lê o jornal da última execução. Retorna True se ela foi interrompida antes do fim."""
+        if not os.path.isfile(self.path):
+            return False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # Última linha truncada por uma interrupção no meio da gravação
+                    continue
+                self._apply(event)
+        return self.run is not None and not self.run.get('finished')
+
+    def _apply(self, event):
+        kind = event['event']
+        if kind == 'run':
+            self.run, self.chunks, self.files = event, {}, {}
+        elif kind == 'finished':
+            self.run['finished'] = True
+        elif kind == 'file':
+            self.files[(event['table'], event['file'])] = event['chunks']
+        elif kind == 'table':
+            if event['table'] not in self.run['tables']:
+                self.run['tables'].append(event['table'])
+            self.run['fingerprints'][event['table']] = event['fingerprint']
+        else:
+            self.chunks.setdefault((event['table'], event['file']), {})[event['chunk']] = event
+
+    def _append(self, event):
+        with self._lock:
+            self._apply(event)
+            self._file.write(json.dumps(event, ensure_ascii=False) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def start(self, tables, incremental, suffix, fingerprints):
+        """Inicia o jornal de uma nova carga, descartando o anterior e a fila de retentativa."""
+        shutil.rmtree(self.retry_path, ignore_errors=True)
+        self.close()
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._append({'event': 'run', 'tables': list(tables), 'incremental': incremental, 'suffix': suffix,
+                      'fingerprints': fingerprints, 'started_at': datetime.datetime.now().isoformat(timespec='seconds')})
+
+    def resume(self):
+        """Reabre o jornal da carga interrompida para continuar registrando nele."""
+        self._file = open(self.path, 'a', encoding='utf-8')
+        pending = [event for event in self.iter_chunks() if event['event'] == 'pending']
+        for event in pending:
+            logging.warning(f"  Chunk {event['chunk']} de {event['file']} ({event['table']}) estava sendo gravado na "
+                            f"interrupção e será gravado novamente: se o sink chegou a confirmá-lo, pode haver até "
+                            f"{event['rows']} linhas duplicadas.")
+
+    def finish(self):
+        """Marca a carga como concluída: um '--resume' posterior não tem o que retomar."""
+        if self._file is not None:
+            self._append({'event': 'finished'})
+            self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def add_table(self, table_name, fingerprint):
+        """Registra uma tabela decidida durante a carga (pipeline sobreposto) e a sua impressão digital."""
+        self._append({'event': 'table', 'table': table_name, 'fingerprint': fingerprint})
+
+    def record_chunk(self, event, entry, **extra):
+        self._append(dict(entry, event=event, **extra))
+
+    def record_file(self, table_name, file_name, chunks):
+        self._append({'event': 'file', 'table': table_name, 'file': file_name, 'chunks': chunks})
+
+    def queue_retry(self, chunk, entry, error=None):
+        """Salva um chunk que falhou na fila de retentativa (pickle, preserva os tipos)."""
+        makedirs(self.retry_path)
+        file_hash = hashlib.sha256(entry['file'].encode('utf-8')).hexdigest()[:12]
+        retry_file = os.path.join(self.retry_path, f"{entry['table']}_{file_hash}_{entry['chunk']}.pkl")
+        chunk.to_pickle(retry_file)
+        self.record_chunk('failed', entry, retry_file=retry_file, error=str(error) if error else None)
+
+    def iter_chunks(self):
+        with self._lock:
+            return [event for chunks in self.chunks.values() for event in chunks.values()]
+
+    def skip_chunks(self, table_name, file_name):
+        """
+        Chunks que não devem ser lidos de novo: já gravados ou à espera na fila de retentativa,
+        tanto na tabela quanto nas suas tabelas-ponte.
+        """
+        skip = None
+        for target in with_bridge_tables([table_name]):
+            chunks = self.chunks.get((target, file_name), {})
+            done = {index for index, event in chunks.items() if event['event'] in ('committed', 'failed')}
+            skip = done if skip is None else skip & done
+        return skip
+
+    def is_chunk_done(self, table_name, file_name, index):
+        event = self.chunks.get((table_name, file_name), {}).get(index)
+        return event is not None and event['event'] in ('committed', 'failed')
+
+    def is_file_done(self, table_name, file_name):
+        """O arquivo foi lido até o fim e todos os seus chunks foram gravados ou enfileirados."""
+        total = self.files.get((table_name, file_name))
+        return total is not None and len(self.skip_chunks(table_name, file_name)) == total
+
+    def table_started(self, table_name):
+        return any(table == table_name for table, _ in self.chunks)
+
+    def check_complete(self, file_mappings):
+        """
+        Interrompe o ETL se algum arquivo não foi carregado por inteiro ou algum chunk continua na
+        fila de retentativa: a tabela ficaria incompleta sem que ninguém percebesse.
+        """
+        missing = [f for table_name, files in file_mappings.items() for f in files if not self.is_file_done(table_name, f)]
+        tables = with_bridge_tables(file_mappings)
+        failed = [event for event in self.iter_chunks() if event['event'] == 'failed' and event['table'] in tables]
+        if missing or failed:
+            raise RuntimeError(f"Carga incompleta: {len(missing)} arquivo(s) não carregado(s) por inteiro e "
+                               f"{len(failed)} chunk(s) na fila de retentativa ('{self.retry_path}'). "
+                               f"Corrija a causa e execute novamente com '--resume'.")
+
+def load_chunk(sink, chunk, table_name, file_name, index, position, target_suffix='', journal=None):
+    """
+    Insere um chunk ('bulk_insert_to_sql') registrando-o no jornal: 'pending' antes da escrita,
+    'committed' quando o sink confirma a gravação e, se falhar, o chunk vai para a fila de
+    retentativa. 'position' traz a linha inicial e os bytes lidos do arquivo ('iter_table_chunks').
+    As tabelas-ponte da tabela são montadas a partir do mesmo chunk e registradas no jornal com
+    o mesmo arquivo e índice; na retomada, só as partes ainda não gravadas são escritas.
+    """
+    loaded = True
+    for target in with_bridge_tables([table_name]):
+        if journal is not None and journal.is_chunk_done(target, file_name, index):
+            continue
+        frame = chunk if target == table_name else BRIDGE_TABLES[target]['build'](chunk)
+        loaded = load_table_chunk(sink, frame, target, file_name, index, position, target_suffix, journal) and loaded
+    return loaded
+
+def load_table_chunk(sink, chunk, table_name, file_name, index, position, target_suffix='', journal=None):
+    """Grava uma parte de 'load_chunk' (a tabela ou uma tabela-ponte) e a registra no jornal."""
+    entry = dict(position, table=table_name, file=file_name, chunk=index, rows=len(chunk))
+    if chunk.empty:
+        # Todas as linhas do chunk foram para a quarentena: não há o que gravar
+        if journal is not None:
+            journal.record_chunk('committed', entry)
+        return True
+    if journal is None:
+        return bulk_insert_to_sql(sink, chunk, table_name + target_suffix) is None
+    journal.record_chunk('pending', entry)
+    error = bulk_insert_to_sql(sink, chunk, table_name + target_suffix,
+                               on_commit=lambda: journal.record_chunk('committed', entry))
+    if error is None:
+        return True
+    journal.queue_retry(chunk, entry, error)
+    return False
+
+def replay_retry_queue(sink, journal, target_suffix='', tables=None):
+    """
+    Reenvia os chunks da fila de retentativa (das tabelas 'tables', se informadas); os que
+    forem gravados saem da fila.
+    """
+    tables = None if tables is None else with_bridge_tables(tables)
+    failed = [event for event in journal.iter_chunks()
+              if event['event'] == 'failed' and (tables is None or event['table'] in tables)]
+    if not failed:
+        return
+    logging.info(f"--- REENVIANDO {len(failed)} CHUNKS DA FILA DE RETENTATIVA ---")
+
+    def committed(event):
+        entry = {key: value for key, value in event.items() if key not in ('event', 'retry_file', 'error')}
+        journal.record_chunk('committed', entry)
+        os.remove(event['retry_file'])
+
+    for event in failed:
+        chunk = pd.read_pickle(event['retry_file'])
+        error = bulk_insert_to_sql(sink, chunk, event['table'] + target_suffix,
+                                   on_commit=lambda event=event: committed(event))
+        if error is not None:
+            logging.error(f"  Chunk {event['chunk']} de {event['file']} falhou novamente: {error}")
+    sink.flush()
+
+# =============================================================================
+# CACHE COLUNAR (PARQUET)
+# =============================================================================
+
+CACHE_METADATA_FILE = '_cache.json'
+
+def import_pyarrow():
+    """Importa o pyarrow sob demanda: o cache Parquet e o motor de parsing 'pyarrow' são opcionais."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        logging.error("O cache Parquet e o CSV_ENGINE=pyarrow requerem o pacote 'pyarrow' (pip install pyarrow).")
+        raise
+    return pyarrow, pyarrow.parquet
+
+def load_cache_metadata(cache_path, table_name):
+    """Lê os metadados ('_cache.json') do cache de uma tabela; dicionário vazio se não houver cache."""
+    metadata_path = os.path.join(cache_path, table_name, CACHE_METADATA_FILE)
+    if not os.path.isfile(metadata_path):
+        return {}
+    try:
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def get_cache_fingerprint(cache_path, table_name):
+    """Retorna a impressão digital dos ZIPs que geraram o cache da tabela, ou None se não houver cache."""
+    return load_cache_metadata(cache_path, table_name).get('fingerprint')
+
+def get_stale_cache_tables(cache_path, table_fingerprints, tables=None):
+    """Lista as tabelas cujo cache não existe ou foi gerado a partir de outros arquivos ZIP."""
+    tables = table_fingerprints if tables is None else tables
+    return [table_name for table_name in tables
+            if get_cache_fingerprint(cache_path, table_name) != table_fingerprints[table_name]['fingerprint']]
+
+def build_parquet_cache(data_path, cache_path, table_fingerprints, tables, from_zip=False,
+                        partition_digits=1, max_buffer_rows=500_000, zip_names=None):
+    """
+    Converte os CSVs das tabelas informadas em datasets Parquet (compressão zstd) em
+    '<cache_path>/<tabela>/'. As tabelas com 'cnpj_basico' são particionadas pelos primeiros
+    'partition_digits' dígitos dele ('prefix=NN/'), no formato hive. Com 'from_zip',
+    'zip_names' restringe a leitura a esses ZIPs ('classify_files').
+    """
+    if not tables:
+        return
+    logging.info("--- GERANDO CACHE PARQUET ---")
+    makedirs(cache_path)
+    file_mappings = classify_files(data_path, from_zip=from_zip, zip_names=zip_names)
+    schemas = get_table_schemas()
+    for table_name in tables:
+        files = file_mappings.get(table_name, [])
+        if files:
+            build_table_cache(table_name, files, schemas[table_name], data_path, cache_path,
+                              table_fingerprints[table_name]['fingerprint'], partition_digits, max_buffer_rows)
+
+def build_table_cache(table_name, files, schema, data_path, cache_path, fingerprint,
+                      partition_digits=1, max_buffer_rows=500_000):
+    """
+    Gera o cache Parquet de uma tabela. Os chunks são acumulados por partição e gravados como
+    row groups a cada 'max_buffer_rows' linhas, com um arquivo por partição. O cache é montado
+    em um diretório temporário e só substitui o anterior quando completo: um arquivo com erro
+    interrompe a geração, descarta o temporário e mantém o cache anterior (um cache parcial
+    com o fingerprint do conjunto completo nunca seria regerado).
+    """
+    pa, pq = import_pyarrow()
+    cache_start = time.time()
+    logging.info(f"Gerando cache da tabela: {table_name.upper()}")
+
+    table_dir = os.path.join(cache_path, table_name)
+    temp_dir = table_dir + '.tmp'
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+
+    arrow_schema = get_arrow_schema(schema)
+    partitioned = 'cnpj_basico' in schema['cols']
+    writers, buffers = {}, {}
+    buffered_rows, total_rows = 0, 0
+
+    def flush_buffers():
+        for key, frames in buffers.items():
+            if key not in writers:
+                part_dir = os.path.join(temp_dir, f'prefix={key}') if partitioned else temp_dir
+                os.makedirs(part_dir, exist_ok=True)
+                writers[key] = pq.ParquetWriter(os.path.join(part_dir, 'part-0.parquet'), arrow_schema, compression='zstd')
+            frame = pd.concat(frames, ignore_index=True)
+            writers[key].write_table(pa.Table.from_pandas(frame, schema=arrow_schema, preserve_index=False))
+        buffers.clear()
+
+    file_name = None
+    try:
+        try:
+            for file_name in files:
+                logging.info(f'  Convertendo o arquivo: {file_name}...')
+                for chunk in read_table_chunks(data_path, file_name, schema, table_name=table_name):
+                    if partitioned:
+                        keys = chunk['cnpj_basico'].str[:partition_digits].fillna('_')
+                        for key, part in chunk.groupby(keys, sort=False):
+                            buffers.setdefault(key, []).append(part)
+                    else:
+                        buffers.setdefault('', []).append(chunk)
+                    buffered_rows += len(chunk)
+                    total_rows += len(chunk)
+                    if buffered_rows >= max_buffer_rows:
+                        flush_buffers()
+                        buffered_rows = 0
+            flush_buffers()
+        finally:
+            for writer in writers.values():
+                writer.close()
+    except Exception as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        logging.error(f"Falha ao converter o arquivo {file_name}. Erro: {e}")
+        raise RuntimeError(f"Cache da tabela {table_name} não gerado: falha no arquivo {file_name}. "
+                           f"O cache anterior foi mantido.") from e
+
+    with open(os.path.join(temp_dir, CACHE_METADATA_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            'fingerprint': fingerprint,
+            'rows': total_rows,
+            'partition_digits': partition_digits if partitioned else None,
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        }, f, indent=2)
+    shutil.rmtree(table_dir, ignore_errors=True)
+    os.replace(temp_dir, table_dir)
+
+    tempo_cache = round(time.time() - cache_start)
+    logging.info(f"Cache da tabela {table_name.upper()} finalizado! {total_rows} linhas em {tempo_cache}s.")
+
+def classify_cache_files(cache_path, tables=None):
+    """
+    Lista os arquivos Parquet do cache de cada tabela (ou só das de 'tables'), com caminhos
+    relativos a 'cache_path'.
+    """
+    file_mappings = {}
+    for table_name in tables or get_table_schemas():
+        table_dir = os.path.join(cache_path, table_name)
+        if get_cache_fingerprint(cache_path, table_name) is None:
+            file_mappings[table_name] = []
+            continue
+        parquet_files = glob.glob(os.path.join(glob.escape(table_dir), '**', '*.parquet'), recursive=True)
+        file_mappings[table_name] = sorted(os.path.relpath(f, cache_path) for f in parquet_files)
+    return file_mappings
+
+def read_parquet_chunks(file_path, chunksize=100_000):
+    """Lê um arquivo Parquet do cache em DataFrames de até 'chunksize' linhas."""
+    _, pq = import_pyarrow()
+    parquet_file = pq.ParquetFile(file_path)
+    for batch in parquet_file.iter_batches(batch_size=chunksize):
+        yield parquet_batch_to_frame(batch)
+
+def parquet_batch_to_frame(batch):
+    """Converte um lote do cache em DataFrame."""
+    pa, _ = import_pyarrow()
+    # Inteiros com nulos voltam como 'UInt8' (e não float) e datas como datetime64
+    return batch.to_pandas(types_mapper={pa.uint8(): pd.UInt8Dtype()}.get, date_as_object=False)
+
+def open_parquet_dataset(cache_path, table_name):
+    """
+    Abre o cache de uma tabela como 'pyarrow.dataset.Dataset', para consumo colunar fora do
+    SQL Server (filtros e projeções são aplicados sem reler o CSV). Ex.:
+        open_parquet_dataset(cache, 'estabelecimento').to_table(columns=['cnpj_basico', 'uf'])
+    """
+    import_pyarrow()
+    import pyarrow.dataset
+    return pyarrow.dataset.dataset(os.path.join(cache_path, table_name), format='parquet', partitioning='hive')
+
+# =============================================================================
+# TABELA DESNORMALIZADA (UM REGISTRO POR ESTABELECIMENTO)
+# =============================================================================
+
+# Tabela derivada que substitui a 'view_completa_cnpj' sem o produto estabelecimentos x sócios:
+# uma linha por estabelecimento, com os sócios agregados em um array JSON. O schema fica em
+# DERIVED_TABLE_SCHEMAS, no registro de schemas.
+DENORMALIZED_TABLE = 'cnpj_completo'
+DENORMALIZED_SOURCE_TABLES = ('estabelecimento', 'empresa', 'simples', 'socios', 'natju', 'munic', 'cnae', 'quals')
+DENORMALIZED_PARTNER_FIELDS = ['nome_socio_razao_social', 'cpf_cnpj_socio', 'qualificacao_socio', 'data_entrada_sociedade']
+MATRIZ_FILIAL_LABELS = {1: 'MATRIZ', 2: 'FILIAL'}
+# Códigos mantidos na junção ao lado das descrições (usados em filtros e partições da exportação)
+DENORMALIZED_CODE_COLUMNS = [('codigo_municipio', 'varchar', 4), ('cnae_fiscal_principal', 'varchar', 7)]
+
+def get_denormalized_fields():
+    """Colunas da tabela desnormalizada, na ordem do registro (os sócios são a última)."""
+    return [col for col, _, _ in DERIVED_TABLE_SCHEMAS[DENORMALIZED_TABLE]]
+
+def get_denormalized_fingerprint(cache_path, version=1):
+    """
+    Impressão digital dos dados desnormalizados: combina as dos caches das tabelas de origem
+    e o schema da tabela derivada ('version' distingue os formatos que a consomem).
+    """
+    fingerprints = {table_name: get_cache_fingerprint(cache_path, table_name) for table_name in DENORMALIZED_SOURCE_TABLES}
+    missing = [table_name for table_name, fingerprint in fingerprints.items() if fingerprint is None]
+    if missing:
+        raise RuntimeError(f"Cache Parquet ausente para: {', '.join(missing)}. Gere o cache antes dos dados desnormalizados.")
+    payload = json.dumps({'version': version, 'schema': get_schema_signature(DENORMALIZED_TABLE), 'tables': fingerprints},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def read_cache_partition(cache_path, table_name, key, columns):
+    """Lê uma partição ('prefix=<key>') do cache de uma tabela; DataFrame vazio se ela não existir."""
+    path = os.path.join(cache_path, table_name, f'prefix={key}', 'part-0.parquet')
+    if not os.path.isfile(path):
+        return pd.DataFrame(columns=columns)
+    frames = list(read_parquet_chunks(path, chunksize=1_000_000))
+    return pd.concat(frames, ignore_index=True)[columns] if frames else pd.DataFrame(columns=columns)
+
+def load_code_labels(cache_path, table_name):
+    """Carrega uma tabela de domínio do cache como {código: descrição}."""
+    table = open_parquet_dataset(cache_path, table_name).to_table(columns=['codigo', 'descricao'])
+    df = table.to_pandas(types_mapper={import_pyarrow()[0].uint8(): pd.UInt8Dtype()}.get)
+    return dict(zip(df['codigo'], df['descricao']))
+
+def iter_denormalized_partitions(cache_path, partners=True):
+    """
+    Junção em fluxo (hash join) das tabelas do CNPJ, partição a partição do cache Parquet, na
+    ordem do 'cnpj_basico'. As tabelas de domínio (natju, munic, cnae, quals) ficam em memória;
+    das tabelas grandes, só uma partição por vez. Gera (chave da partição, DataFrame) com as
+    colunas de 'get_denormalized_fields' (sócios como listas; vazias se 'partners' for False)
+    e as de DENORMALIZED_CODE_COLUMNS.
+    """
+    partition_digits = {table_name: load_cache_metadata(cache_path, table_name).get('partition_digits')
+                        for table_name in ('estabelecimento', 'empresa', 'simples', 'socios')}
+    if len(set(partition_digits.values())) != 1:
+        raise RuntimeError(f"O cache das tabelas foi particionado com dígitos diferentes ({partition_digits}). "
+                           "Regere o cache com o mesmo PARQUET_PARTITION_DIGITS.")
+
+    labels = {table_name: load_code_labels(cache_path, table_name) for table_name in ('natju', 'munic', 'cnae', 'quals')}
+    estabelecimento_dir = os.path.join(cache_path, 'estabelecimento')
+    # As chaves têm a mesma quantidade de dígitos, então a ordem alfabética é a numérica
+    keys = sorted(name.split('=', 1)[1] for name in os.listdir(estabelecimento_dir)
+                  if name.startswith('prefix=') and name != 'prefix=_')
+    for key in keys:
+        with METRICS.stage('join', DENORMALIZED_TABLE, partition=key) as event:
+            df = build_denormalized_partition(cache_path, key, labels, partners)
+            event['rows'] = len(df)
+        yield key, df
+
+def build_denormalized_partition(cache_path, key, labels, partners=True):
+    """
+    Monta uma partição da tabela desnormalizada: junta estabelecimento, empresa e Simples por
+    'cnpj_basico', agrupa os sócios por empresa e resolve os códigos das tabelas de domínio.
+    Estabelecimentos sem CNPJ válido (14 dígitos) são descartados.
+    """
+    est = read_cache_partition(cache_path, 'estabelecimento', key, [
+        'cnpj_basico', 'cnpj_ordem', 'cnpj_dv', 'identificador_matriz_filial', 'nome_fantasia',
+        'situacao_cadastral', 'data_situacao_cadastral', 'data_inicio_atividade', 'correio_eletronico',
+        'tipo_logradouro', 'logradouro', 'numero', 'complemento', 'bairro', 'cep', 'municipio', 'uf',
+        'ddd_1', 'telefone_1', 'ddd_2', 'telefone_2', 'cnae_fiscal_principal',
+    ])
+    emp = read_cache_partition(cache_path, 'empresa', key, [
+        'cnpj_basico', 'razao_social', 'capital_social', 'porte_empresa', 'ente_federativo_responsavel',
+        'natureza_juridica',
+    ]).drop_duplicates('cnpj_basico')
+    smp = read_cache_partition(cache_path, 'simples', key, [
+        'cnpj_basico', 'opcao_pelo_simples', 'data_opcao_simples', 'data_exclusao_simples', 'opcao_mei',
+        'data_opcao_mei', 'data_exclusao_mei',
+    ]).drop_duplicates('cnpj_basico')
+    soc_columns = ['cnpj_basico'] + DENORMALIZED_PARTNER_FIELDS
+    soc = read_cache_partition(cache_path, 'socios', key, soc_columns) if partners else pd.DataFrame(columns=soc_columns)
+
+    df = est.merge(emp, on='cnpj_basico', how='left').merge(smp, on='cnpj_basico', how='left')
+    cnpj = df['cnpj_basico'].astype(str) + df['cnpj_ordem'].astype(str) + df['cnpj_dv'].astype(str)
+    df = df[cnpj.str.fullmatch(r'\d{14}').to_numpy()]
+
+    soc = soc.assign(qualificacao_socio=soc['qualificacao_socio'].astype(object).map(labels['quals']))
+    company_partners = {}
+    partner_rows = dataframe_to_rows(soc[DENORMALIZED_PARTNER_FIELDS], dates_as_text=True)
+    for basico, partner in zip(soc['cnpj_basico'], partner_rows):
+        company_partners.setdefault(basico, []).append(partner)
+
+    return df.assign(
+        cnpj=cnpj[df.index],
+        matriz_filial=df['identificador_matriz_filial'].astype(object).map(MATRIZ_FILIAL_LABELS).fillna('OUTRO'),
+        natureza_juridica=df['natureza_juridica'].astype(object).map(labels['natju']),
+        municipio=df['municipio'].astype(object).map(labels['munic']),
+        cnae_principal=df['cnae_fiscal_principal'].map(labels['cnae']),
+        socios=df['cnpj_basico'].map(lambda basico: company_partners.get(basico, [])),
+        codigo_municipio=df['municipio'],
+    )[get_denormalized_fields() + [col for col, _, _ in DENORMALIZED_CODE_COLUMNS]].reset_index(drop=True)
+
+def partners_to_json(partners):
+    """Serializa as listas de sócios de cada linha como arrays JSON de objetos."""
+    return [json.dumps([dict(zip(DENORMALIZED_PARTNER_FIELDS, partner)) for partner in row_partners],
+                       ensure_ascii=False, separators=(',', ':')) for row_partners in partners]
+
+def load_denormalized_table(sink, cache_path, target_suffix='', chunksize=100_000):
+    """
+    Carga da tabela desnormalizada ('cnpj_completo') pelo sink configurado, a partir da junção
+    em fluxo do cache ('iter_denormalized_partitions'). Os sócios são gravados como um array
+    JSON de objetos. Substitui uma junção SQL posterior sobre a base inteira.
+    """
+    logging.info(f"--- CARREGANDO TABELA DESNORMALIZADA ({DENORMALIZED_TABLE.upper()}) ---")
+    load_start = time.time()
+    sink.reset_stats()
+    total_rows = 0
+    for key, df in iter_denormalized_partitions(cache_path):
+        df = df[get_denormalized_fields()].assign(socios=lambda frame: partners_to_json(frame['socios']))
+        for start in range(0, len(df), chunksize):
+            bulk_insert_to_sql(sink, df.iloc[start:start + chunksize], DENORMALIZED_TABLE + target_suffix)
+        total_rows += len(df)
+        logging.info(f"  Partição {key}: {len(df)} estabelecimentos.")
+    sink.flush()
+    tempo_insert = round(time.time() - load_start)
+    logging.info(f"Tabela {DENORMALIZED_TABLE.upper()} finalizada! {total_rows} linhas inseridas em {tempo_insert}s.")
+    sink.report(DENORMALIZED_TABLE)
+
+# =============================================================================
+# ÍNDICE DE CONSULTA OFFLINE (LOOKUP)
+# =============================================================================
+
+# Arquivos do índice: chaves (CNPJ de 14 dígitos como uint64, ordenadas) e os registros, na
+# mesma ordem, em colunas Arrow (arquivo IPC sem compressão, mapeado em memória sem cópia),
+# com os campos da tabela desnormalizada ('get_denormalized_fields').
+# Versão 2: registros com os campos de 'cnpj_completo' (a versão 1 seguia a view antiga).
+# Versão 3: registros em colunas Arrow (a versão 2 guardava um JSON por registro).
+LOOKUP_FORMAT_VERSION = 3
+LOOKUP_META_FILE = 'meta.json'
+LOOKUP_KEYS_FILE = 'keys.u64'
+LOOKUP_RECORDS_FILE = 'records.arrow'
+
+def load_lookup_meta(store_path):
+    """Lê os metadados do índice de consulta ('meta.json'); retorna None se não houver índice."""
+    meta_path = os.path.join(store_path, LOOKUP_META_FILE)
+    if not os.path.isfile(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def get_lookup_arrow_schema():
+    """
+    Schema Arrow dos registros do índice: os tipos da tabela desnormalizada, com as datas em
+    texto ISO (como na saída JSON) e os sócios como uma lista de structs.
+    """
+    pa, _ = import_pyarrow()
+    types = {'varchar': pa.string(), 'tinyint': pa.uint8(), 'decimal': pa.float64(), 'date': pa.string(),
+             'json': pa.list_(pa.struct([(field, pa.string()) for field in DENORMALIZED_PARTNER_FIELDS]))}
+    return pa.schema([(col, types[col_type]) for col, col_type, _ in DERIVED_TABLE_SCHEMAS[DENORMALIZED_TABLE]])
+
+def denormalized_to_arrow(df, schema):
+    """Converte uma partição da tabela desnormalizada no lote Arrow do índice de consulta."""
+    pa, _ = import_pyarrow()
+    dates = {col: df[col].dt.strftime('%Y-%m-%d') for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])}
+    partners = [[dict(zip(DENORMALIZED_PARTNER_FIELDS, partner)) for partner in row] for row in df['socios']]
+    return pa.RecordBatch.from_pandas(df.assign(socios=partners, **dates), schema=schema, preserve_index=False)
+
+def build_lookup_store(cache_path, store_path):
+    """
+    Gera o índice de consulta offline a partir do cache Parquet: os registros da tabela
+    desnormalizada (um por estabelecimento, com os sócios e as descrições das tabelas de
+    domínio), ordenados pelo CNPJ para busca binária em um arquivo mapeado em memória, e
+    gravados em colunas Arrow, das quais um lote de posições é extraído de uma vez (ver
+    'cnpj_lookup.py'). As partições do cache são processadas uma a uma, em ordem, o que mantém
+    a memória limitada e as chaves ordenadas.
+    Não faz nada se o índice já foi gerado a partir do mesmo cache; um índice de outra versão
+    do formato (LOOKUP_FORMAT_VERSION) é sempre gerado novamente.
+    """
+    fingerprint = get_denormalized_fingerprint(cache_path, LOOKUP_FORMAT_VERSION)
+    meta = load_lookup_meta(store_path)
+    if meta and meta.get('version') != LOOKUP_FORMAT_VERSION:
+        logging.info(f"Índice de consulta em '{store_path}' tem a versão {meta.get('version')} "
+                     f"(atual: {LOOKUP_FORMAT_VERSION}); gerando novamente.")
+    elif meta and meta.get('fingerprint') == fingerprint:
+        logging.info("Índice de consulta offline já está atualizado. Pulando geração.")
+        return
+
+    logging.info("--- GERANDO ÍNDICE DE CONSULTA OFFLINE ---")
+    pa, _ = import_pyarrow()
+    build_start = time.time()
+    temp_dir = store_path.rstrip('/\\') + '.tmp'
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    schema = get_lookup_arrow_schema()
+    records_path = os.path.join(temp_dir, LOOKUP_RECORDS_FILE)
+    total_rows = 0
+    with open(os.path.join(temp_dir, LOOKUP_KEYS_FILE), 'wb') as keys_file, \
+         pa.ipc.new_file(records_path, schema) as records_writer:
+        for key, df in iter_denormalized_partitions(cache_path):
+            df = df[get_denormalized_fields()].sort_values('cnpj', kind='stable')
+            keys_file.write(df['cnpj'].astype('uint64').to_numpy().astype('<u8').tobytes())
+            records_writer.write_batch(denormalized_to_arrow(df, schema))
+            total_rows += len(df)
+            logging.info(f"  Partição {key}: {len(df)} estabelecimentos.")
+
+    with open(os.path.join(temp_dir, LOOKUP_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': LOOKUP_FORMAT_VERSION,
+            'fingerprint': fingerprint,
+            'rows': total_rows,
+            'fields': get_denormalized_fields(),
+            'partner_fields': DENORMALIZED_PARTNER_FIELDS,
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        }, f, indent=2)
+    records_size = os.path.getsize(records_path)
+    shutil.rmtree(store_path, ignore_errors=True)
+    os.replace(temp_dir, store_path)
+
+    tempo_build = round(time.time() - build_start)
+    logging.info(f"Índice de consulta gerado! {total_rows} estabelecimentos em {tempo_build}s "
+                 f"({records_size / 1024 / 1024:.0f} MB de registros).")
+
+# =============================================================================
+# ÍNDICE DE BUSCA POR NOME (TRIGRAMAS)
+# =============================================================================
+
+# Colunas indexadas por tabela de origem. Cada tabela tem um subíndice próprio em
+# '<index_path>/<tabela>/', refeito só quando o cache dela muda (carga incremental):
+# documentos (um por nome distinto de cada cnpj_basico), com o cnpj_basico (uint32), a
+# quantidade de trigramas e o nome original (UTF-8, com deslocamentos), e as listas invertidas:
+# para cada trigrama, os documentos que o contêm, em ordem, concatenados em 'postings.u32'
+# e delimitados por 'postings_offsets.u64' (NAME_TRIGRAMS + 1 valores).
+NAME_INDEX_FORMAT_VERSION = 1
+NAME_INDEX_SOURCES = {'empresa': 'razao_social', 'estabelecimento': 'nome_fantasia'}
+NAME_INDEX_META_FILE = 'meta.json'
+NAME_INDEX_CNPJ_FILE = 'cnpj_basico.u32'
+NAME_INDEX_GRAM_COUNTS_FILE = 'gram_counts.u16'
+NAME_INDEX_NAME_OFFSETS_FILE = 'name_offsets.u64'
+NAME_INDEX_NAMES_FILE = 'names.bin'
+NAME_INDEX_OFFSETS_FILE = 'postings_offsets.u64'
+NAME_INDEX_POSTINGS_FILE = 'postings.u32'
+# Alfabeto dos nomes normalizados ('fold_names'): espaço, letras sem acento e dígitos.
+# Cada trigrama vira um inteiro em [0, NAME_TRIGRAMS); os demais bytes separam os nomes.
+NAME_ALPHABET = ' abcdefghijklmnopqrstuvwxyz0123456789'
+NAME_TRIGRAMS = len(NAME_ALPHABET) ** 3
+_NAME_SYMBOLS = np.full(256, 255, dtype=np.uint8)
+_NAME_SYMBOLS[np.frombuffer(NAME_ALPHABET.encode('ascii'), dtype=np.uint8)] = np.arange(len(NAME_ALPHABET))
+
+def fold_names(names):
+    """
+    Normaliza nomes para a busca (vetorizado): sem acentos ('JOSÉ' -> 'jose'), minúsculos e
+    só com letras, dígitos e espaços simples. A mesma normalização vale para as consultas.
+    """
+    return (names.astype(str).str.normalize('NFKD').str.encode('ascii', errors='ignore').str.decode('ascii')
+            .str.lower().str.replace(r'[^a-z0-9]+', ' ', regex=True).str.strip())
+
+def sorted_unique(values):
+    """Valores distintos, em ordem. Ordena e descarta os repetidos; mais rápido que np.unique em vetores grandes."""
+    values = np.sort(values)
+    return values[np.concatenate(([True], values[1:] != values[:-1]))] if len(values) else values
+
+def name_trigrams(folded):
+    """
+    Trigramas distintos de cada nome normalizado, com um espaço antes e depois ('ab' -> ' ab',
+    'ab '). Retorna (posição do nome em 'folded', código do trigrama), ordenados por código e
+    posição. Os nomes são unidos em um único vetor de símbolos, e os trigramas de todos eles
+    saem de uma vez (numpy), sem laço por nome.
+    """
+    padded = [f' {name} ' for name in folded]
+    symbols = _NAME_SYMBOLS[np.frombuffer('\0'.join(padded).encode('ascii'), dtype=np.uint8)].astype(np.int64)
+    lengths = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+    owner = np.repeat(np.arange(len(padded), dtype=np.int64), lengths + 1)[:max(len(symbols) - 2, 0)]
+    first, second, third = symbols[:-2], symbols[1:-1], symbols[2:]
+    size = len(NAME_ALPHABET)
+    valid = (first < size) & (second < size) & (third < size)
+    keys = sorted_unique(((first * size + second) * size + third)[valid] << 32 | owner[valid])
+    return keys & 0xFFFFFFFF, keys >> 32
+
+def load_name_index_meta(table_dir):
+    """Lê os metadados de um subíndice de busca por nome; retorna None se ele não existir."""
+    meta_path = os.path.join(table_dir, NAME_INDEX_META_FILE)
+    if not os.path.isfile(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def get_name_index_fingerprint(cache_path, table_name):
+    """Impressão digital do subíndice: o cache da tabela de origem, a coluna e o formato."""
+    cache_fingerprint = get_cache_fingerprint(cache_path, table_name)
+    if cache_fingerprint is None:
+        raise RuntimeError(f"Cache Parquet ausente para: {table_name}. Gere o cache antes do índice de busca por nome.")
+    payload = json.dumps({'version': NAME_INDEX_FORMAT_VERSION, 'column': NAME_INDEX_SOURCES[table_name],
+                          'alphabet': NAME_ALPHABET, 'cache': cache_fingerprint}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def build_name_index(cache_path, index_path, tables=None, batch_rows=500_000):
+    """
+    Gera (ou atualiza) o índice de busca por nome a partir do cache Parquet: um subíndice por
+    tabela de NAME_INDEX_SOURCES (ou só as de 'tables'). Os subíndices cujo cache de origem não
+    mudou são mantidos; na carga incremental, só as tabelas alteradas são reindexadas.
+    A consulta fica em 'cnpj_search.py'.
+    """
+    cache_files = classify_cache_files(cache_path)
+    for table_name in NAME_INDEX_SOURCES:
+        if tables is not None and table_name not in tables:
+            continue
+        fingerprint = get_name_index_fingerprint(cache_path, table_name)
+        table_dir = os.path.join(index_path, table_name)
+        meta = load_name_index_meta(table_dir)
+        if meta and meta.get('fingerprint') == fingerprint:
+            logging.info(f"Índice de busca por nome de {table_name.upper()} já está atualizado. Pulando geração.")
+            continue
+        build_name_subindex(cache_path, cache_files[table_name], table_name, table_dir, fingerprint, batch_rows)
+
+def build_name_subindex(cache_path, files, table_name, table_dir, fingerprint, batch_rows=500_000):
+    """
+    Gera o subíndice de uma tabela em duas passadas, com a memória limitada a um lote: a
+    primeira lê o cache em lotes de 'batch_rows' linhas, grava os documentos e, para cada lote,
+    os documentos de cada trigrama (em ordem de trigrama) em um arquivo temporário; a segunda
+    soma as contagens por trigrama e distribui os lotes nas listas invertidas finais (um arquivo
+    mapeado em memória). Como os lotes estão na ordem dos documentos, cada lista fica ordenada.
+    O subíndice é montado em um diretório temporário e substitui o anterior só ao final.
+    """
+    _, pq = import_pyarrow()
+    column = NAME_INDEX_SOURCES[table_name]
+    logging.info(f"--- GERANDO ÍNDICE DE BUSCA POR NOME: {table_name.upper()}.{column} ---")
+    build_start = time.time()
+    temp_dir = table_dir.rstrip('/\\') + '.tmp'
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    makedirs(temp_dir)
+
+    runs, total_docs, name_bytes = [], 0, 0
+    with open(os.path.join(temp_dir, NAME_INDEX_CNPJ_FILE), 'wb') as cnpj_file, \
+         open(os.path.join(temp_dir, NAME_INDEX_GRAM_COUNTS_FILE), 'wb') as counts_file, \
+         open(os.path.join(temp_dir, NAME_INDEX_NAME_OFFSETS_FILE), 'wb') as name_offsets_file, \
+         open(os.path.join(temp_dir, NAME_INDEX_NAMES_FILE), 'wb') as names_file:
+        name_offsets_file.write(np.array([0], dtype='<u8').tobytes())
+        for file_name in files:
+            parquet_file = pq.ParquetFile(os.path.join(cache_path, file_name))
+            for batch in parquet_file.iter_batches(batch_size=batch_rows, columns=['cnpj_basico', column]):
+                df = batch.to_pandas()
+                df['cnpj_basico'] = pd.to_numeric(df['cnpj_basico'], errors='coerce')
+                df[column] = df[column].str.strip()
+                df = df[df['cnpj_basico'].notna() & (df[column].str.len() > 0)].drop_duplicates()
+                folded = fold_names(df[column])
+                df, folded = df[folded.str.len() > 0], folded[folded.str.len() > 0]
+                if df.empty:
+                    continue
+                positions, codes = name_trigrams(folded)
+                run_path = os.path.join(temp_dir, f'run-{len(runs)}.u32')
+                (positions + total_docs).astype('<u4').tofile(run_path)
+                runs.append((run_path, np.bincount(codes, minlength=NAME_TRIGRAMS)))
+
+                encoded = [name.encode('utf-8') for name in df[column]]
+                lengths = np.fromiter((len(name) for name in encoded), dtype='<u8', count=len(encoded))
+                cnpj_file.write(df['cnpj_basico'].to_numpy().astype('<u4').tobytes())
+                counts_file.write(np.bincount(positions, minlength=len(df)).astype('<u2').tobytes())
+                name_offsets_file.write((name_bytes + np.cumsum(lengths)).astype('<u8').tobytes())
+                names_file.write(b''.join(encoded))
+                name_bytes += int(lengths.sum())
+                total_docs += len(df)
+
+    counts = np.sum([run_counts for _, run_counts in runs], axis=0) if runs else np.zeros(NAME_TRIGRAMS, dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype('<u8')
+    offsets.tofile(os.path.join(temp_dir, NAME_INDEX_OFFSETS_FILE))
+    postings_path = os.path.join(temp_dir, NAME_INDEX_POSTINGS_FILE)
+    total_postings = int(offsets[-1])
+    if total_postings:
+        postings = np.memmap(postings_path, dtype='<u4', mode='w+', shape=(total_postings,))
+        written = offsets[:-1].astype(np.int64)
+        for run_path, run_counts in runs:
+            docs = np.fromfile(run_path, dtype='<u4')
+            # Posição final de cada documento do lote: início da lista do seu trigrama, mais os
+            # documentos já gravados nela pelos lotes anteriores, mais a ordem dentro do lote
+            run_starts = np.concatenate(([0], np.cumsum(run_counts)[:-1]))
+            postings[np.repeat(written - run_starts, run_counts) + np.arange(len(docs))] = docs
+            written += run_counts
+            os.remove(run_path)
+        postings.flush()
+        del postings
+    else:
+        open(postings_path, 'wb').close()
+
+    with open(os.path.join(temp_dir, NAME_INDEX_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': NAME_INDEX_FORMAT_VERSION,
+            'fingerprint': fingerprint,
+            'table': table_name,
+            'column': column,
+            'docs': total_docs,
+            'postings': total_postings,
+            'alphabet': NAME_ALPHABET,
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        }, f, indent=2)
+    shutil.rmtree(table_dir, ignore_errors=True)
+    os.replace(temp_dir, table_dir)
+
+    tempo_build = round(time.time() - build_start)
+    logging.info(f"Índice de busca de {table_name.upper()} gerado! {total_docs} nomes e {total_postings} "
+                 f"entradas de trigramas em {tempo_build}s ({total_postings * 4 / 1024 / 1024:.0f} MB).")
 
 # =============================================================================
 # FUNÇÕES DE BANCO DE DADOS
@@ -239,132 +1753,1213 @@ def prepare_database(master_engine, db_name):
             logging.error("Verifique as permissões do usuário no servidor SQL.")
             sys.exit(1)
 
-def setup_database_tables(engine):
+def ensure_database(master_engine, db_name):
+    """
+    Cria o banco de dados de destino apenas se ele ainda não existir (carga incremental).
+    Diferente de 'prepare_database', nunca remove dados existentes.
+    """
+    logging.info(f"Verificando se o banco de dados '{db_name}' existe...")
+    with master_engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            connection.execute(text(f"IF DB_ID('{db_name}') IS NULL CREATE DATABASE [{db_name}]"))
+        except Exception as e:
+            logging.error(f"Falha ao verificar/criar o banco de dados '{db_name}'. Erro: {e}")
+            logging.error("Verifique as permissões do usuário no servidor SQL.")
+            sys.exit(1)
+
+def setup_database_tables(engine, tables=None, suffix=''):
     """
     Cria ou recria todas as tabelas necessárias no banco de dados usando o engine do SQLAlchemy.
-    Lê os arquivos .sql do diretório 'sql/ddl'.
+    O DDL é gerado a partir do registro de schemas (TABLE_SCHEMAS), o mesmo usado no parsing;
+    os arquivos de 'sql/ddl' são uma cópia dele, regravada com '--write-ddl'.
+    Se 'tables' for informado, cria apenas essas tabelas (que podem incluir as derivadas,
+    de DERIVED_TABLE_SCHEMAS); 'suffix' é acrescentado ao nome de cada tabela (ex.: '_staging'
+    na carga incremental). As tabelas-ponte ('BRIDGE_TABLES') acompanham a tabela de origem.
     """
     logging.info("--- CONFIGURANDO TABELAS NO BANCO DE DADOS ---")
 
-    script_dir = pathlib.Path(__file__).parent.parent.resolve()
-    ddl_dir = os.path.join(script_dir, 'sql', 'ddl')
-
-    if not os.path.isdir(ddl_dir):
-        logging.error(f"Diretório de DDL '{ddl_dir}' não encontrado.")
-        sys.exit(1)
-
-    ddl_files = [f for f in os.listdir(ddl_dir) if f.endswith('.sql')]
-
     with engine.connect() as connection:
-        for ddl_file in sorted(ddl_files):
-            table_name = os.path.splitext(ddl_file)[0]
+        for base_name in sorted(with_bridge_tables(TABLE_SCHEMAS if tables is None else tables)):
+            table_name = base_name + suffix
             logging.info(f"  - Recriando tabela '{table_name}'...")
 
-            with open(os.path.join(ddl_dir, ddl_file), 'r', encoding='utf-8') as f:
-                ddl_content = f.read()
-
             connection.execute(text(f"IF OBJECT_ID('{table_name}', 'U') IS NOT NULL DROP TABLE {table_name};"))
-            connection.execute(text(ddl_content))
+            connection.execute(text(generate_table_ddl(base_name, table_name)))
 
         connection.commit()
     logging.info("Tabelas configuradas com sucesso.")
 
-def create_database_indexes(engine):
-    """Cria índices nas tabelas para otimizar as consultas."""
+# Plano declarativo de índices. As fases definem a ordem de construção após a carga em heap:
+# primeiro o índice clusterizado (que reordena a tabela), depois os secundários, que assim são
+# construídos uma única vez já sobre a chave clusterizada.
+# Os índices de cobertura atendem às views: junções com munic/cnae/quals/natju por 'codigo' e
+# filtros por município (view_empresas_indaiatuba) e por CNAE principal.
+INDEX_PLAN = [
+    {'name': 'cix_empresa', 'table': 'empresa', 'kind': 'clustered', 'columns': ['cnpj_basico']},
+    {'name': 'cix_estabelecimento', 'table': 'estabelecimento', 'kind': 'clustered',
+     'columns': ['cnpj_basico', 'cnpj_ordem', 'cnpj_dv']},
+    {'name': 'cix_socios', 'table': 'socios', 'kind': 'clustered', 'columns': ['cnpj_basico']},
+    {'name': 'cix_simples', 'table': 'simples', 'kind': 'clustered', 'columns': ['cnpj_basico']},
+    {'name': 'cix_cnae', 'table': 'cnae', 'kind': 'clustered', 'columns': ['codigo']},
+    {'name': 'cix_moti', 'table': 'moti', 'kind': 'clustered', 'columns': ['codigo']},
+    {'name': 'cix_munic', 'table': 'munic', 'kind': 'clustered', 'columns': ['codigo']},
+    {'name': 'cix_natju', 'table': 'natju', 'kind': 'clustered', 'columns': ['codigo']},
+    {'name': 'cix_pais', 'table': 'pais', 'kind': 'clustered', 'columns': ['codigo']},
+    {'name': 'cix_quals', 'table': 'quals', 'kind': 'clustered', 'columns': ['codigo']},
+    {'name': 'cix_cnpj_completo', 'table': 'cnpj_completo', 'kind': 'clustered',
+     'columns': ['cnpj_basico', 'cnpj_ordem', 'cnpj_dv']},
+    # Busca por atividade: um seek pelo CNAE já devolve os CNPJs (view_cnae_estabelecimento)
+    {'name': 'cix_estabelecimento_cnae_secundaria', 'table': 'estabelecimento_cnae_secundaria', 'kind': 'clustered',
+     'columns': ['cnae', 'cnpj_basico', 'cnpj_ordem', 'cnpj_dv']},
+    {'name': 'ix_estabelecimento_municipio', 'table': 'estabelecimento', 'kind': 'nonclustered',
+     'columns': ['municipio'],
+     'include': ['nome_fantasia', 'situacao_cadastral', 'logradouro', 'numero', 'complemento', 'bairro', 'uf',
+                 'cep', 'ddd_1', 'telefone_1', 'ddd_2', 'telefone_2', 'correio_eletronico', 'cnae_fiscal_principal']},
+    {'name': 'ix_estabelecimento_cnae', 'table': 'estabelecimento', 'kind': 'nonclustered',
+     'columns': ['cnae_fiscal_principal'], 'include': ['municipio', 'uf', 'situacao_cadastral']},
+]
+
+# Com INDEX_COLUMNSTORE=true, estabelecimento passa a ser um columnstore clusterizado (mais
+# compacto e rápido para varreduras analíticas) e a chave do CNPJ vira um índice secundário.
+COLUMNSTORE_INDEX_PLAN = {
+    'estabelecimento': [
+        {'name': 'ccix_estabelecimento', 'table': 'estabelecimento', 'kind': 'clustered columnstore', 'columns': []},
+        {'name': 'ix_estabelecimento_cnpj', 'table': 'estabelecimento', 'kind': 'nonclustered',
+         'columns': ['cnpj_basico', 'cnpj_ordem', 'cnpj_dv']},
+    ],
+}
+
+INDEX_PHASES = ('clustered', 'clustered columnstore', 'nonclustered')
+# Valores aceitos em DATA_COMPRESSION (INDEX_COMPRESSION)
+INDEX_COMPRESSIONS = ('NONE', 'ROW', 'PAGE')
+
+def get_index_plan(tables=None, columnstore=False):
+    """
+    Retorna o plano de índices das tabelas informadas, ordenado por fase de construção
+    (clusterizados, columnstore, secundários).
+    """
+    plan = []
+    for index in INDEX_PLAN:
+        if columnstore and index['table'] in COLUMNSTORE_INDEX_PLAN and index['kind'] == 'clustered':
+            plan.extend(COLUMNSTORE_INDEX_PLAN[index['table']])
+        else:
+            plan.append(index)
+    # Sem 'tables', o plano cobre as tabelas dos CSVs; as derivadas só quando pedidas e as
+    # tabelas-ponte junto com a tabela de origem
+    tables = with_bridge_tables(TABLE_SCHEMAS if tables is None else tables)
+    plan = [index for index in plan if index['table'] in tables]
+    return sorted(plan, key=lambda index: INDEX_PHASES.index(index['kind']))
+
+def build_index_statement(index, table_name, compression='NONE'):
+    """Gera o CREATE INDEX de um item do plano de índices."""
+    if compression not in INDEX_COMPRESSIONS:
+        raise ValueError(f"Compressão de índice inválida: '{compression}'. Opções: {', '.join(INDEX_COMPRESSIONS)}.")
+    if index['kind'] == 'clustered columnstore':
+        return f"CREATE CLUSTERED COLUMNSTORE INDEX {index['name']} ON {table_name};"
+    statement = (f"CREATE {'UNIQUE ' if index.get('unique') else ''}{index['kind'].upper()} INDEX {index['name']} "
+                 f"ON {table_name} ({', '.join(index['columns'])})")
+    if index.get('include'):
+        statement += f" INCLUDE ({', '.join(index['include'])})"
+    return statement + f" WITH (SORT_IN_TEMPDB = ON, DATA_COMPRESSION = {compression});"
+
+def create_database_indexes(engine, tables=None, suffix='', columnstore=False, compression='NONE'):
+    """
+    Constrói os índices do plano ('get_index_plan') na ordem das fases, registrando o tempo de
+    cada um. Índices que já existem são mantidos. Falhas são registradas e, ao final, geram uma
+    exceção: uma tabela sem os índices esperados não deve passar despercebida.
+    'tables' e 'suffix' restringem e renomeiam as tabelas como em 'setup_database_tables'.
+    """
     logging.info("--- CRIANDO ÍNDICES NO BANCO DE DADOS ---")
+    plan = get_index_plan(tables, columnstore)
+    if not plan:
+        return
+
+    logging.info("Plano de índices:")
+    for phase in INDEX_PHASES:
+        names = [index['name'] for index in plan if index['kind'] == phase]
+        if names:
+            logging.info(f"  - {phase}: {', '.join(names)}")
+
+    failures = []
+    indexes_start = time.time()
     with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        for index in plan:
+            table_name = index['table'] + suffix
+            exists = connection.execute(
+                text("SELECT 1 FROM sys.indexes WHERE name = :name AND object_id = OBJECT_ID(:table_name)"),
+                {'name': index['name'], 'table_name': table_name}
+            ).first()
+            if exists:
+                logging.info(f"  Índice {index['name']} já existe em {table_name}. Mantido.")
+                continue
+
+            index_start = time.time()
+            try:
+                connection.execute(text(build_index_statement(index, table_name, compression)))
+                logging.info(f"  Índice {index['name']} ({index['kind']}) criado em {table_name} "
+                             f"em {round(time.time() - index_start)}s.")
+            except Exception as e:
+                logging.error(f"Falha ao criar o índice {index['name']} em {table_name}. Erro: {e}")
+                failures.append(index['name'])
+
+    logging.info(f"Índices finalizados em {round(time.time() - indexes_start)}s.")
+    if failures:
+        raise RuntimeError(f"Não foi possível criar os índices: {', '.join(failures)}")
+
+def swap_staging_tables(engine, tables, suffix=STAGING_SUFFIX):
+    """
+    Substitui cada tabela pela sua versão de staging já carregada e indexada ('sp_rename').
+    Cada troca ocorre em uma transação: as consultas enxergam a tabela antiga até o commit e a
+    nova logo depois, sem período com a tabela vazia ou ausente.
+    """
+    logging.info("--- PUBLICANDO TABELAS ATUALIZADAS ---")
+    with engine.connect() as connection:
+        for table_name in with_bridge_tables(tables):
+            staging_name, old_name = f'{table_name}{suffix}', f'{table_name}_old'
+            try:
+                connection.execute(text(f"IF OBJECT_ID('{old_name}', 'U') IS NOT NULL DROP TABLE {old_name};"))
+                connection.execute(text(f"IF OBJECT_ID('{table_name}', 'U') IS NOT NULL EXEC sp_rename '{table_name}', '{old_name}';"))
+                connection.execute(text(f"EXEC sp_rename '{staging_name}', '{table_name}';"))
+                connection.execute(text(f"IF OBJECT_ID('{old_name}', 'U') IS NOT NULL DROP TABLE {old_name};"))
+                connection.commit()
+                logging.info(f"  - Tabela '{table_name}' atualizada.")
+            except Exception as e:
+                connection.rollback()
+                logging.error(f"Falha ao publicar a tabela '{table_name}'. A versão anterior foi mantida. Erro: {e}")
+                raise
+
+# =============================================================================
+# DESTINOS DE CARGA (SINKS)
+# =============================================================================
+
+SINK_NAMES = ('to_sql', 'fast_executemany', 'bcp', 'sqlite', 'duckdb')
+EMBEDDED_SINKS = ('sqlite', 'duckdb')
+BCP_FIELD_TERMINATOR = '|~|'
+
+class BulkSink:
+    """
+    Destino de carga de DataFrames. As subclasses implementam '_write' (e, se usarem buffer,
+    '_flush'); a classe base contabiliza linhas e tempo de escrita para o relatório de linhas/s.
+    Se 'fallback' estiver definido, 'bulk_insert_to_sql' reenvia por ele os chunks que falharem.
+    'on_commit' é chamado quando os dados do chunk estão de fato gravados no destino: ao fim do
+    '_write' ou, nos sinks com buffer, depois do flush que os contém ('_on_commit').
+    """
+    name = 'base'
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback
+        self.reset_stats()
+
+    def write(self, df, table_name, on_commit=None):
+        start = time.perf_counter()
+        self._write(df, table_name)
+        self.seconds += time.perf_counter() - start
+        self.rows += len(df)
+        if on_commit is not None:
+            self._on_commit(table_name, on_commit)
+
+    def flush(self):
+        """Grava no destino os dados que estiverem em buffer."""
+        start = time.perf_counter()
+        with METRICS.stage('insert', sink=self.name, operation='flush'):
+            self._flush()
+        self.seconds += time.perf_counter() - start
+
+    def close(self):
+        """Grava os dados pendentes e libera as conexões do sink."""
+        self.flush()
+        if self.fallback is not None:
+            self.fallback.close()
+
+    def reset_stats(self):
+        self.rows = 0
+        self.seconds = 0.0
+
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def report(self, table_name):
+        """Registra no log a vazão do sink desde o último 'reset_stats'."""
+        logging.info(f"  Sink '{self.name}' ({table_name}): {self.rows} linhas em {self.seconds:.1f}s de escrita "
+                     f"({self.rows_per_second():,.0f} linhas/s).")
+
+    def _write(self, df, table_name):
+        raise NotImplementedError
+
+    def _flush(self):
+        pass
+
+    def _on_commit(self, table_name, callback):
+        callback()
+
+class ToSqlSink(BulkSink):
+    """Carga via 'DataFrame.to_sql' com um INSERT por linha: mais lenta, porém a mais robusta."""
+    name = 'to_sql'
+
+    def __init__(self, engine):
+        super().__init__()
+        self.engine = engine
+
+    def _write(self, df, table_name):
+        # method=None é mais lento mas é a opção mais robusta contra erros de limite de parâmetros
+        df.to_sql(table_name, con=self.engine, if_exists='append', index=False, chunksize=10_000, method=None)
+
+class FastExecutemanySink(BulkSink):
+    """
+    Carga via pyodbc com 'fast_executemany': os parâmetros de todo o chunk são enviados ao
+    servidor em arrays, em uma única ida e volta por lote, em vez de um INSERT por linha.
+    """
+    name = 'fast_executemany'
+
+    def __init__(self, engine, fallback=None):
+        super().__init__(fallback)
+        self.engine = engine
+        self._connection = None
+
+    def _write(self, df, table_name):
+        if self._connection is None:
+            self._connection = self.engine.raw_connection()
+        columns = ', '.join(f'[{col}]' for col in df.columns)
+        placeholders = ', '.join('?' for _ in df.columns)
+        rows = dataframe_to_rows(df)
+
+        cursor = self._connection.cursor()
+        try:
+            cursor.fast_executemany = True
+            cursor.executemany(f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})", rows)
+            self._connection.commit()
+        except Exception:
+            self._connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def close(self):
+        super().close()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+class BcpSink(BulkSink):
+    """
+    Carga via utilitário 'bcp' (bulk copy): os chunks de cada tabela são gravados em um arquivo
+    de staging próprio e, a cada 'batch_rows' linhas (ou no flush), o arquivo é importado de uma
+    vez com a dica TABLOCK, que permite ao SQL Server usar log mínimo na carga.
+    O staging usa o formato caractere (-c, UTF-8): o formato nativo (-n) exigiria codificar
+    cada tipo de coluna em binário e acoplaria o sink ao DDL.
+    Cada importação é atômica: o arquivo vai para uma tabela de carga própria e só passa à tabela
+    de destino, em uma única transação, quando está completo. Se o bcp falhar (ou importar só
+    parte das linhas), a tabela de carga é esvaziada e o arquivo inteiro é reenviado pelo
+    fallback; os chunks só são confirmados ('_on_commit') depois da transação.
+    """
+    name = 'bcp'
+
+    def __init__(self, engine, config, db_name, staging_path, batch_rows=1_000_000, fallback=None):
+        super().__init__(fallback)
+        self.bcp_path = shutil.which('bcp')
+        if self.bcp_path is None:
+            raise RuntimeError("Utilitário 'bcp' não encontrado no PATH. Instale o mssql-tools ou escolha outro BULK_SINK.")
+        self.engine = engine
+        self.config = config
+        self.db_name = db_name
+        self.staging_path = staging_path
+        self.batch_rows = batch_rows
+        self._staging = {}  # tabela -> [arquivo aberto, caminho, linhas em buffer, callbacks de commit, colunas]
+
+    def _write(self, df, table_name):
+        if table_name not in self._staging:
+            # Nome único: vários sinks (escritores paralelos) podem carregar a mesma tabela
+            fd, file_path = tempfile.mkstemp(prefix=f'{table_name}_', suffix='.bcp', dir=self.staging_path)
+            self._staging[table_name] = [open(fd, 'w', encoding='utf-8', newline=''), file_path, 0, [], list(df.columns)]
+        staging = self._staging[table_name]
+
+        # Nulos viram campo vazio (que o bcp -c carrega como NULL); datas vão como AAAA-MM-DD;
+        # quebras de linha e o terminador de campo são neutralizados para não corromper o arquivo.
+        clean = pd.DataFrame(dataframe_to_rows(df, dates_as_text=True), columns=df.columns, dtype=object)
+        clean = clean.where(clean.notna(), '').astype(str)
+        clean = clean.replace({r'[\r\n]': ' ', re.escape(BCP_FIELD_TERMINATOR): ' '}, regex=True)
+        columns = list(clean.columns)
+        lines = clean[columns[0]].str.cat([clean[col] for col in columns[1:]], sep=BCP_FIELD_TERMINATOR)
+        staging[0].write('\n'.join(lines))
+        staging[0].write('\n')
+        staging[2] += len(df)
+
+        if staging[2] >= self.batch_rows:
+            self._flush_table(table_name)
+
+    def _flush(self):
+        for table_name in list(self._staging):
+            self._flush_table(table_name)
+
+    def _on_commit(self, table_name, callback):
+        # O chunk só está gravado depois do bcp do arquivo de staging que o contém; se o '_write'
+        # acabou de importar o arquivo (limite de 'batch_rows'), ele já está
+        if table_name in self._staging:
+            self._staging[table_name][3].append(callback)
+        else:
+            callback()
+
+    def _flush_table(self, table_name):
+        staging_file, file_path, buffered_rows, callbacks, columns = self._staging.pop(table_name)
+        staging_file.close()
         try:
-            connection.execute(text("CREATE INDEX idx_empresa_cnpj ON empresa(cnpj_basico);"))
-            connection.execute(text("CREATE INDEX idx_estabelecimento_cnpj ON estabelecimento(cnpj_basico);"))
-            connection.execute(text("CREATE INDEX idx_socios_cnpj ON socios(cnpj_basico);"))
-            connection.execute(text("CREATE INDEX idx_simples_cnpj ON simples(cnpj_basico);"))
+            if buffered_rows:
+                self._import(table_name, file_path, buffered_rows, columns)
+        finally:
+            os.remove(file_path)
+        for callback in callbacks:
+            callback()
+
+    def _import(self, table_name, file_path, expected_rows, columns):
+        # Tabela de carga com o nome (único) do arquivo de staging e as colunas do destino
+        load_table = os.path.splitext(os.path.basename(file_path))[0]
+        with self.engine.connect() as connection:
+            connection.execute(text(f"SELECT TOP 0 * INTO {load_table} FROM {table_name};"))
             connection.commit()
-            logging.info("Índices criados com sucesso para a coluna `cnpj_basico`.")
-        except Exception as e:
-            logging.warning(f"Não foi possível criar os índices. Eles podem já existir. Erro: {e}")
+        try:
+            try:
+                self._run_bcp(load_table, file_path, expected_rows)
+            except Exception as error:
+                if self.fallback is None:
+                    raise
+                logging.warning(f"bcp falhou na tabela {table_name} ({error}). Reenviando as {expected_rows} "
+                                f"linhas do arquivo de staging via '{self.fallback.name}'.")
+                # Descarta os lotes que o bcp tenha chegado a confirmar ('-b') antes de reenviar
+                with self.engine.connect() as connection:
+                    connection.execute(text(f"TRUNCATE TABLE {load_table};"))
+                    connection.commit()
+                self._replay(file_path, load_table, columns)
+            with self.engine.connect() as connection:
+                connection.execute(text(f"INSERT INTO {table_name} WITH (TABLOCK) SELECT * FROM {load_table};"))
+                connection.execute(text(f"DROP TABLE {load_table};"))
+                connection.commit()
+        except Exception:
+            with contextlib.suppress(Exception), self.engine.connect() as connection:
+                connection.execute(text(f"IF OBJECT_ID('{load_table}', 'U') IS NOT NULL DROP TABLE {load_table};"))
+                connection.commit()
+            raise
+
+    def _replay(self, file_path, table_name, columns, batch_bytes=64 * 1024 * 1024):
+        """Reenvia o arquivo de staging pelo fallback, em lotes; os campos vazios voltam como nulos."""
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:
+            while True:
+                lines = f.readlines(batch_bytes)
+                if not lines:
+                    break
+                frame = pd.DataFrame([line.rstrip('\n').split(BCP_FIELD_TERMINATOR) for line in lines],
+                                     columns=columns, dtype=object)
+                self.fallback.write(frame.where(frame != '', None), table_name)
+
+    def _run_bcp(self, table_name, file_path, expected_rows):
+        error_path = file_path + '.err'
+        command = [
+            self.bcp_path, table_name, 'in', file_path,
+            '-S', self.config['db_server'], '-d', self.db_name,
+            '-c', '-C', '65001', '-t', BCP_FIELD_TERMINATOR, '-r', '0x0a',
+            '-b', str(self.batch_rows), '-h', 'TABLOCK', '-e', error_path,
+        ]
+        # A senha não vai na linha de comando (visível no 'ps'): sem '-P', o bcp a pede e ela é
+        # enviada pela entrada padrão, em uma sessão sem terminal (para o pedido não ir ao console)
+        if self.config.get('bcp_trusted_connection'):
+            command.append('-T')
+            password = None
+        else:
+            command += ['-U', self.config['db_user']]
+            password = self.config['db_password'] + '\n'
+        result = subprocess.run(command, input=password, capture_output=True, text=True, start_new_session=True)
+        match = re.search(r'(\d+) rows copied', result.stdout)
+        copied_rows = int(match.group(1)) if match else 0
+        if result.returncode != 0 or copied_rows != expected_rows:
+            raise RuntimeError(f"bcp importou {copied_rows} de {expected_rows} linhas em {table_name} "
+                               f"(código {result.returncode}). Veja '{error_path}'. Saída: {result.stdout.strip()[-500:]}")
+        if os.path.isfile(error_path) and os.path.getsize(error_path) == 0:
+            os.remove(error_path)
+
+class SqliteSink(BulkSink):
+    """Carga em um arquivo SQLite local: substituto do SQL Server para testes e benchmarks."""
+    name = 'sqlite'
+
+    def __init__(self, db_path):
+        super().__init__()
+        self.db_path = db_path
+        # Usado por uma única thread de cada vez, mas não necessariamente a que o criou (carga paralela)
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=OFF')
+        self.connection.execute('PRAGMA synchronous=OFF')
+
+    def prepare_tables(self, tables=None):
+        """Recria as tabelas a partir do registro de schemas (datas são gravadas como texto ISO)."""
+        for table_name in with_bridge_tables(tables or TABLE_SCHEMAS):
+            self.connection.execute(f'DROP TABLE IF EXISTS {table_name}')
+            self.connection.execute(generate_table_ddl(table_name, dialect='sqlite'))
+        self.connection.commit()
+
+    def _write(self, df, table_name):
+        placeholders = ', '.join('?' for _ in df.columns)
+        rows = dataframe_to_rows(df, dates_as_text=True)
+        self.connection.executemany(f'INSERT INTO {table_name} VALUES ({placeholders})', rows)
+        self.connection.commit()
+
+    def close(self):
+        super().close()
+        self.connection.close()
+
+class DuckDBSink(BulkSink):
+    """
+    Carga em um arquivo DuckDB local: substituto colunar do SQL Server para testes e benchmarks.
+    Cada chunk é inserido de uma vez a partir do próprio DataFrame, sem conversão por linha.
+    """
+    name = 'duckdb'
+
+    def __init__(self, db_path):
+        super().__init__()
+        try:
+            import duckdb
+        except ImportError:
+            logging.error("O sink 'duckdb' requer o pacote 'duckdb' (pip install duckdb).")
+            raise
+        self.db_path = db_path
+        self.connection = duckdb.connect(db_path)
+
+    def prepare_tables(self, tables=None):
+        """Recria as tabelas a partir do registro de schemas."""
+        for table_name in with_bridge_tables(tables or TABLE_SCHEMAS):
+            self.connection.execute(f'DROP TABLE IF EXISTS {table_name}')
+            self.connection.execute(generate_table_ddl(table_name, dialect='duckdb'))
+
+    def _write(self, df, table_name):
+        self.connection.register('chunk_df', df)
+        try:
+            self.connection.execute(f'INSERT INTO {table_name} SELECT * FROM chunk_df')
+        finally:
+            self.connection.unregister('chunk_df')
+
+    def close(self):
+        super().close()
+        self.connection.close()
+
+def create_sink(sink_name, engine=None, config=None, db_name=None):
+    """
+    Cria o destino de carga configurado em BULK_SINK. Os sinks rápidos do SQL Server
+    ('fast_executemany' e 'bcp') usam o 'to_sql' como fallback para chunks que falharem.
+    """
+    config = config or {}
+    if sink_name == 'to_sql':
+        return ToSqlSink(engine)
+    if sink_name == 'fast_executemany':
+        return FastExecutemanySink(engine, fallback=ToSqlSink(engine))
+    if sink_name == 'bcp':
+        return BcpSink(engine, config, db_name, config.get('output_path') or '.',
+                       batch_rows=config.get('bcp_batch_rows', 1_000_000), fallback=ToSqlSink(engine))
+    if sink_name in EMBEDDED_SINKS:
+        db_path = config.get('embedded_db_path') or os.path.join(config.get('output_path') or '.', f'cnpj.{sink_name}')
+        logging.info(f"Usando banco embarcado '{sink_name}' em: {db_path}")
+        return SqliteSink(db_path) if sink_name == 'sqlite' else DuckDBSink(db_path)
+    raise ValueError(f"Sink desconhecido: '{sink_name}'. Opções: {', '.join(SINK_NAMES)}.")
+
+# =============================================================================
+# LEITURA DOS CSV (MOTORES DE PARSING E QUARENTENA)
+# =============================================================================
+
+# Motores de parsing dos CSVs: 'pandas' (leitor C do read_csv, um núcleo) ou 'pyarrow'
+# (leitor multithread do pyarrow.csv, requer pyarrow)
+CSV_ENGINES = ('pandas', 'pyarrow')
+# Bytes lidos do arquivo a cada chamada ao separar os blocos de linhas
+CSV_READ_SIZE = 16 * 1024 * 1024
+# Configuração da leitura no processo (definida em 'main' e reaplicada nos processos de parsing)
+CSV_OPTIONS = {'engine': 'pandas', 'quarantine_path': None}
+# O leitor C do pandas só informa as linhas rejeitadas por avisos (warnings), cuja captura
+# altera o estado global do módulo 'warnings': as leituras pelo pandas são serializadas no processo
+_pandas_parse_lock = threading.Lock()
+_PANDAS_BAD_LINE = re.compile(r'Skipping line (\d+): (expected \d+ fields, saw \d+)')
+
+def configure_csv_parser(engine='pandas', quarantine_path=None):
+    """Define o motor de parsing dos CSVs e a pasta da quarentena (None: só conta as linhas rejeitadas)."""
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Motor de parsing inválido: '{engine}'. Opções: {', '.join(CSV_ENGINES)}.")
+    if engine == 'pyarrow':
+        import_pyarrow()
+    CSV_OPTIONS.update(engine=engine, quarantine_path=quarantine_path)
+
+# Estados do tokenizador do read_csv (pandas/_libs/src/parser/tokenizer.c) usados para
+# localizar o fim dos registros: aspas '"', escape '\\', separador ';'
+(_START_RECORD, _START_FIELD, _IN_FIELD, _ESCAPED_CHAR, _IN_QUOTED_FIELD,
+ _ESCAPE_IN_QUOTED_FIELD, _QUOTE_IN_QUOTED_FIELD, _EAT_CRNL) = range(8)
+_NEWLINE, _CARRIAGE, _QUOTE, _BACKSLASH, _SEMICOLON = b'\n\r"\\;'
+_QUOTED_SPECIAL = re.compile(rb'["\\]')
+# Registro de uma linha só, com campos entre aspas (com escapes e aspas dobradas) ou sem
+# aspas: lido pelo tokenizador como um registro inteiro, sem percorrê-lo em Python
+_QUOTED_FIELD = rb'"(?:[^"\\\n]|\\[^\n]|"")*"'
+_PLAIN_FIELD = rb'[^";\\\n\r]*'
+_SINGLE_LINE_RECORD = re.compile(rb'(?:%s|%s)(?:;(?:%s|%s))*\n' % ((_QUOTED_FIELD, _PLAIN_FIELD) * 2))
+
+def scan_record(data, position, state=_START_RECORD):
+    """
+    Percorre 'data' a partir de 'position', caractere a caractere, com as regras do
+    tokenizador do pandas, até a quebra de linha que termina o registro. Retorna (posição
+    depois dela, _START_RECORD) ou, se o registro não termina em 'data', (len(data), estado).
+    """
+    size = len(data)
+    while position < size:
+        if state == _IN_QUOTED_FIELD:
+            match = _QUOTED_SPECIAL.search(data, position)
+            if match is None:
+                return size, state
+            position = match.start()
+            state = _ESCAPE_IN_QUOTED_FIELD if data[position] == _BACKSLASH else _QUOTE_IN_QUOTED_FIELD
+            position += 1
+            continue
+        char = data[position]
+        if state == _ESCAPE_IN_QUOTED_FIELD:
+            state = _IN_QUOTED_FIELD
+        elif state == _ESCAPED_CHAR:
+            state = _IN_FIELD
+        elif state == _EAT_CRNL and char != _NEWLINE:
+            state = _START_RECORD
+            continue
+        elif char == _NEWLINE:
+            return position + 1, _START_RECORD
+        elif char == _CARRIAGE:
+            state = _EAT_CRNL
+        elif state == _QUOTE_IN_QUOTED_FIELD:
+            state = _IN_QUOTED_FIELD if char == _QUOTE else _START_FIELD if char == _SEMICOLON else _IN_FIELD
+        elif char == _SEMICOLON:
+            state = _START_FIELD
+        elif char == _BACKSLASH:
+            state = _ESCAPED_CHAR
+        elif char == _QUOTE and state in (_START_RECORD, _START_FIELD):
+            state = _IN_QUOTED_FIELD
+        else:
+            state = _IN_FIELD
+        position += 1
+    return size, state
+
+def find_irregular_lines(array, newlines):
+    """
+    Linhas cujo fim não pode ser decidido só pelas aspas (vetorizado): as com '\\', com '\\r'
+    fora do fim, com quantidade ímpar de aspas ou com aspas que não abrem um campo (depois de
+    ';' ou no início) nem o fecham (antes de ';' ou do fim). Uma linha regular que começa um
+    registro termina nele; as irregulares vão para 'scan_record'. 'array' termina em '\\n'.
+    """
+    irregular = np.zeros(len(newlines), dtype=bool)
+    irregular[np.searchsorted(newlines, np.flatnonzero(array == _BACKSLASH))] = True
+    carriages = np.flatnonzero(array == _CARRIAGE)
+    irregular[np.searchsorted(newlines, carriages[array[carriages + 1] != _NEWLINE])] = True
+    quotes = np.flatnonzero(array == _QUOTE)
+    if len(quotes):
+        counts = np.diff(np.searchsorted(quotes, newlines), prepend=0)
+        odd = counts % 2 == 1
+        irregular |= odd
+        if odd.any():
+            quotes = quotes[np.repeat(~odd, counts)]
+        # Nas linhas restantes (com quantidade par), as aspas de ordem par abrem um campo e as de
+        # ordem ímpar o fecham. A aspa na posição 0 vê o '\\n' final em array[-1]
+        opening, closing = quotes[0::2], quotes[1::2]
+        before, after = array[opening - 1], array[closing + 1]
+        wrong = np.concatenate((opening[(before != _SEMICOLON) & (before != _NEWLINE)],
+                                closing[(after != _SEMICOLON) & (after != _NEWLINE) & (after != _CARRIAGE)]))
+        irregular[np.searchsorted(newlines, wrong)] = True
+    return np.flatnonzero(irregular)
+
+def find_record_ends(data, state=_START_RECORD):
+    """
+    Quebras de linha de 'data' (que termina em '\\n') que terminam registros, como o leitor
+    do pandas as veria: a quebra dentro de aspas ou escapada continua o registro. Nos arquivos
+    da Receita, o campo que termina em '\\' ('"RUA X\\"') escapa a própria aspa de fechamento,
+    e o registro segue pelas linhas seguintes. 'state' é o estado do tokenizador no início de
+    'data' (o retornado pela chamada anterior). Retorna (posições, estado no fim de 'data').
+    As linhas regulares são tratadas de uma vez, com o numpy; só as irregulares, e as que
+    continuam um registro, são percorridas caractere a caractere ('scan_record').
+    """
+    array = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(array == _NEWLINE)
+    line_starts = np.concatenate(([0], newlines[:-1] + 1))
+    inside = np.zeros(len(newlines), dtype=bool)
+    starts = find_irregular_lines(array, newlines)
+    position = 0
+    if state != _START_RECORD:
+        starts = np.concatenate(([-1], starts))
+    for line in starts.tolist():
+        start = 0 if line < 0 else int(line_starts[line])
+        if start < position:
+            continue
+        if line >= 0:
+            match = _SINGLE_LINE_RECORD.match(data, start)
+            if match and match.end() == newlines[line] + 1:
+                continue
+        position, state = scan_record(data, start, state)
+        if state != _START_RECORD:
+            inside[np.searchsorted(newlines, start):] = True
+            break
+        if line < 0 or position - 1 != newlines[line]:
+            inside[np.searchsorted(newlines, start):np.searchsorted(newlines, position - 1)] = True
+    return newlines[~inside], state
+
+def iter_line_blocks(stream, lines, read_size=CSV_READ_SIZE):
+    """
+    Separa um arquivo binário em blocos de exatamente 'lines' registros (o último pode ter
+    menos), sem decodificá-lo. Retorna (deslocamento do bloco no arquivo, bytes do bloco).
+    Os blocos terminam onde o leitor do pandas termina um registro ('find_record_ends'): um
+    registro que ocupa mais de uma linha física nunca é dividido entre dois blocos.
+    """
+    offset, parts, counted = 0, [], 0
+    state, tail = _START_RECORD, b''
+    while True:
+        data = stream.read(read_size)
+        if not data:
+            break
+        # Só as linhas completas são analisadas; o resto segue com a próxima leitura
+        cut = data.rfind(b'\n') + 1
+        if not cut:
+            tail += data
+            continue
+        data, tail = tail + data[:cut], data[cut:]
+        newlines, state = find_record_ends(data, state)
+        start, used = 0, 0
+        while len(newlines) - used >= lines - counted:
+            used += lines - counted
+            end = int(newlines[used - 1]) + 1
+            parts.append(data[start:end])
+            block = b''.join(parts)
+            yield offset, block
+            offset += len(block)
+            parts, counted, start = [], 0, end
+        parts.append(data[start:])
+        counted += len(newlines) - used
+    parts.append(tail)
+    block = b''.join(parts)
+    if block.strip():
+        yield offset, block
+
+def transcode_latin1(block):
+    """Converte um bloco latin-1 em UTF-8 de uma só vez (blocos só ASCII já são UTF-8 válido)."""
+    return block if block.isascii() else block.decode('latin-1').encode('utf-8')
+
+def parse_csv_block(block, schema, engine='pandas'):
+    """
+    Lê um bloco de linhas no formato dos CSVs da Receita Federal (';', campos entre aspas e '\\'
+    como escape dentro delas). Retorna (DataFrame com as colunas como texto, linhas rejeitadas),
+    em que cada rejeitada é (registro no bloco, a partir de 1, ou None; texto; motivo).
+    Os dois motores seguem a regra do leitor original: os registros com campos de menos são
+    mantidos, com os campos que faltam nulos (no pyarrow, eles são completados e lidos à parte,
+    no fim do chunk), e os com campos demais são rejeitados. Nos dois, a decodificação é feita no bloco
+    inteiro, não campo a campo: o pandas decodifica o latin-1 ao abrir o bloco, e para o
+    pyarrow (que lê UTF-8) o bloco é convertido antes ('transcode_latin1').
+    """
+    if engine == 'pyarrow':
+        pa, _ = import_pyarrow()
+        import pyarrow.csv as pa_csv
+        rejected, short_rows = [], []
+
+        def reject(row):
+            if row.actual_columns < row.expected_columns:
+                short_rows.append(row.text + ';' * (row.expected_columns - row.actual_columns))
+            else:
+                rejected.append((row.number, row.text, f'expected {row.expected_columns} fields, saw {row.actual_columns}'))
+            return 'skip'
+
+        def read(data):
+            return pa_csv.read_csv(
+                io.BytesIO(data),
+                read_options=pa_csv.ReadOptions(column_names=schema['cols'], use_threads=True),
+                parse_options=pa_csv.ParseOptions(delimiter=';', quote_char='"', escape_char='\\',
+                                                  newlines_in_values=True, invalid_row_handler=reject),
+                # Mesmos valores nulos do read_csv ('', 'NA', 'NULL'...), como no leitor do pandas
+                convert_options=pa_csv.ConvertOptions(column_types={col: pa.string() for col in schema['cols']},
+                                                      strings_can_be_null=True),
+            ).to_pandas()
+
+        chunk = read(transcode_latin1(block))
+        if short_rows:
+            chunk = pd.concat([chunk, read('\n'.join(short_rows).encode('utf-8'))], ignore_index=True)
+        return chunk, rejected
+
+    # Com o primeiro registro do bloco com um campo a mais, o read_csv o tomaria como índice
+    # (e deslocaria as colunas) em vez de rejeitá-lo: uma linha vazia com o número certo de
+    # campos vem antes do bloco e é descartada depois
+    with _pandas_parse_lock, warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', pd.errors.ParserWarning)
+        chunk = pd.read_csv(
+            io.BytesIO(b';' * (len(schema['cols']) - 1) + b'\n' + block),
+            sep=';',
+            header=None,
+            names=schema['cols'],
+            dtype=schema['dtype'],
+            encoding='latin-1',
+            quotechar='"',
+            escapechar='\\',
+            on_bad_lines='warn'
+        )
+    rejected = [(int(line) - 1, None, reason) for warning in caught
+                for line, reason in _PANDAS_BAD_LINE.findall(str(warning.message))]
+    return chunk.iloc[1:].reset_index(drop=True), rejected
+
+def locate_rejected_lines(block, rejected):
+    """
+    Localiza os registros rejeitados no bloco original: retorna (deslocamento no bloco, linha
+    física no bloco, bytes do registro, motivo). O pandas informa o número do registro (linha
+    lógica); quando o motor não o informa (pyarrow multithread), ele é encontrado pelo texto.
+    """
+    located, search_from = [], {}
+    if rejected:
+        record_ends, _ = find_record_ends(block if block.endswith(b'\n') else block + b'\n')
+    for line, text, reason in rejected:
+        if line is not None:
+            start = int(record_ends[line - 2]) + 1 if line > 1 else 0
+        else:
+            needle = text.encode('latin-1', errors='replace')
+            position = block.find(needle, search_from.get(needle, 0))
+            if position < 0:
+                located.append((None, None, needle, reason))
+                continue
+            search_from[needle] = position + 1
+            start = block.rfind(b'\n', 0, position) + 1
+        following = np.searchsorted(record_ends, start)
+        end = int(record_ends[following]) if following < len(record_ends) else len(block)
+        located.append((start, block.count(b'\n', 0, start) + 1, block[start:end].rstrip(b'\r'), reason))
+    return sorted(located, key=lambda item: (item[0] is None, item[0] or 0))
+
+class CsvQuarantine:
+    """
+    Quarentena das linhas rejeitadas de um arquivo de dados: um JSON lines em
+    '<quarantine_path>/<tabela>/<arquivo>.jsonl', com o deslocamento em bytes de cada linha no
+    arquivo (descomprimido), o número da linha física, o motivo e o texto original, para que
+    possam ser contadas e corrigidas sem reler o arquivo (nas linhas com um texto maior que a
+    coluna, a posição fica nula e o texto é remontado dos campos; 'loaded' indica se a linha foi
+    carregada com o valor anulado). Cada leitura completa do arquivo substitui a quarentena
+    anterior; na retomada, mantém as linhas dos chunks pulados ('keep_chunks').
+    """
+
+    def __init__(self, quarantine_path, table_name, file_name, keep_chunks=()):
+        self.file_name = file_name
+        self.rejected = 0
+        self.nulled = 0
+        self._file = None
+        self.path = None
+        if not quarantine_path:
+            return
+        safe_name = re.sub(r'[^\w.-]+', '_', file_name.replace(ZIP_MEMBER_SEPARATOR, '__'))
+        self.path = os.path.join(quarantine_path, table_name or '_', safe_name + '.jsonl')
+        kept = []
+        if keep_chunks and os.path.isfile(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                kept = [line for line in f if json.loads(line).get('chunk') in keep_chunks]
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+        if kept:
+            self._open().writelines(kept)
+            self.nulled = sum(json.loads(line).get('loaded', False) for line in kept)
+            self.rejected = len(kept) - self.nulled
+
+    def _open(self):
+        if self._file is None:
+            makedirs(os.path.dirname(self.path))
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def add(self, chunk_index, block_offset, first_line, located, loaded=False):
+        """
+        Registra as linhas rejeitadas de um bloco ('locate_rejected_lines') ou, com 'loaded',
+        as carregadas com algum valor anulado.
+        """
+        if loaded:
+            self.nulled += len(located)
+        else:
+            self.rejected += len(located)
+        if self.path is None:
+            return
+        f = self._open()
+        for start, line, text, reason in located:
+            f.write(json.dumps({
+                'file': self.file_name, 'chunk': chunk_index,
+                'offset': block_offset + start if start is not None else None,
+                'line': first_line + line - 1 if line is not None else None,
+                'length': len(text), 'reason': reason, 'loaded': loaded, 'text': text.decode('latin-1'),
+            }, ensure_ascii=False) + '\n')
+        f.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        destination = f" (quarentena: {self.path})" if self.path else ''
+        if self.rejected:
+            logging.warning(f"  {self.rejected} linhas rejeitadas no arquivo {self.file_name}{destination}.")
+        if self.nulled:
+            logging.warning(f"  {self.nulled} linhas carregadas com textos maiores que a coluna anulados "
+                            f"no arquivo {self.file_name}{destination}.")
+
+def iter_csv_chunks(stream, schema, chunksize=100_000, table_name=None, file_name=None, skip=()):
+    """
+    Lê um CSV da Receita Federal em chunks de 'chunksize' registros, com o motor de
+    'CSV_OPTIONS', e grava na quarentena as linhas rejeitadas pelo parsing e as com textos
+    maiores que a coluna ('split_oversized_values'). Retorna (índice do chunk,
+    posição, chunk convertido), como 'iter_table_chunks'. Os chunks de 'skip' não são lidos.
+    """
+    quarantine = CsvQuarantine(CSV_OPTIONS['quarantine_path'], table_name, file_name or '', keep_chunks=skip)
+    first_line = 1
+    try:
+        for index, (offset, block) in enumerate(iter_line_blocks(stream, chunksize)):
+            position = {'row': index * chunksize, 'offset': offset + len(block)}
+            block_line, first_line = first_line, first_line + block.count(b'\n')
+            if index in skip:
+                yield index, position, None
+                continue
+            with METRICS.stage('parse', table_name, file=file_name, engine=CSV_OPTIONS['engine']) as event:
+                chunk, rejected = parse_csv_block(block, schema, CSV_OPTIONS['engine'])
+                event['rows'], event['bytes'] = len(chunk), len(block)
+            if rejected:
+                quarantine.add(index, offset, block_line, locate_rejected_lines(block, rejected))
+            with METRICS.stage('convert', table_name, file=file_name) as event:
+                chunk, oversized, nulled = split_oversized_values(chunk, schema)
+                event['rows'] = len(chunk)
+                chunk = convert_chunk(chunk, schema)
+            if oversized:
+                quarantine.add(index, offset, block_line, oversized)
+            if nulled:
+                quarantine.add(index, offset, block_line, nulled, loaded=True)
+            yield index, position, chunk
+    finally:
+        quarantine.close()
 
 # =============================================================================
 # FUNÇÕES DE PROCESSAMENTO E CARGA DE DADOS
 # =============================================================================
 
-def process_and_load_data(engine, extracted_path):
+def process_and_load_data(sink, data_path, from_zip=False, parse_workers=1, db_writers=1,
+                          queue_chunks=8, sink_factory=None, tables=None, target_suffix='', from_cache=False,
+                          journal=None, zip_names=None):
     """
     Orquestra o processo de limpeza e carga de todos os arquivos CSV no banco de dados.
+    Se 'from_zip' é True, 'data_path' é a pasta dos ZIPs e os CSVs são lidos diretamente
+    de dentro deles, dispensando a etapa de extração. Se 'from_cache' é True, 'data_path' é
+    o cache Parquet ('build_parquet_cache') e os dados são lidos em lotes colunares.
+    Com 'parse_workers' ou 'db_writers' maiores que 1, usa a carga paralela
+    ('process_and_load_data_parallel'); 'sink_factory' cria os sinks dos escritores adicionais.
+    'tables' restringe a carga a essas tabelas e 'target_suffix' é acrescentado ao nome da
+    tabela de destino (ex.: '_staging'); com 'from_zip', 'zip_names' restringe a leitura a esses ZIPs.
+    Com 'journal' ('LoadJournal'), cada chunk é registrado no jornal de carga, os arquivos já
+    carregados por uma execução interrompida são pulados, os chunks que falharam são reenviados
+    ao final e a carga só termina sem erro se todos os arquivos foram gravados por inteiro.
     """
     logging.info("--- INICIANDO ETAPA DE PROCESSAMENTO E CARGA DE DADOS ---")
 
-    file_mappings = classify_files(extracted_path)
+    if from_cache:
+        file_mappings = classify_cache_files(data_path, tables)
+    else:
+        file_mappings = classify_files(data_path, from_zip=from_zip, zip_names=zip_names)
+    if tables is not None:
+        file_mappings = {table_name: files for table_name, files in file_mappings.items() if table_name in tables}
     schemas = get_table_schemas()
 
-    for table_name, files in file_mappings.items():
-        if files:
-            process_table_files(engine, table_name, files, schemas[table_name], extracted_path)
+    if parse_workers > 1 or (db_writers > 1 and sink_factory is not None):
+        process_and_load_data_parallel(sink, file_mappings, schemas, data_path, parse_workers,
+                                       db_writers, queue_chunks, sink_factory, target_suffix, journal)
+    else:
+        for table_name, files in file_mappings.items():
+            if files:
+                process_table_files(sink, table_name, files, schemas[table_name], data_path, target_suffix, journal)
+
+    if journal is not None:
+        replay_retry_queue(sink, journal, target_suffix, tables=file_mappings)
+        journal.check_complete(file_mappings)
 
-def process_table_files(engine, table_name, files, schema, extracted_path):
-    """Processa e carrega todos os arquivos de um tipo específico de tabela."""
+def process_table_files(sink, table_name, files, schema, data_path, target_suffix='', journal=None):
+    """
+    Processa e carrega todos os arquivos de um tipo específico de tabela. Com 'journal', os
+    arquivos e chunks já gravados por uma execução interrompida são pulados.
+    """
     insert_start = time.time()
     logging.info(f"Processando tabela: {table_name.upper()}")
+    sink.reset_stats()
 
-    total_rows_inserted = 0
+    total_rows_inserted, total_rows_failed = 0, 0
     for file_name in files:
+        if journal is not None and journal.is_file_done(table_name, file_name):
+            logging.info(f'  Arquivo {file_name} já carregado na execução interrompida. Pulando.')
+            continue
+        skip = journal.skip_chunks(table_name, file_name) if journal is not None else ()
+        if skip:
+            logging.info(f'  Retomando o arquivo {file_name}: {len(skip)} chunks já gravados serão pulados.')
         logging.info(f'  Trabalhando no arquivo: {file_name}...')
-        file_path = os.path.join(extracted_path, file_name)
 
         try:
-            reader = pd.read_csv(
-                file_path,
-                sep=';',
-                header=None,
-                names=schema['cols'],
-                dtype=schema['dtype'],
-                encoding='latin-1',
-                quotechar='"',
-                escapechar='\\',
-                chunksize=100_000,
-                on_bad_lines='skip' # Use 'skip' for compatibility with older pandas versions
-            )
-
-            for i, chunk in enumerate(reader):
-                bulk_insert_to_sql(engine, chunk, table_name)
-                total_rows_inserted += len(chunk)
-                # O \r foi removido para um log mais limpo. A verbosidade excessiva foi removida.
-                # logging.info(f'    Chunk {i+1} do arquivo {file_name} inserido com sucesso.')
-
+            chunks = 0
+            for i, position, chunk in iter_table_chunks(data_path, file_name, schema, table_name=table_name, skip=skip):
+                chunks = i + 1
+                if chunk is None:
+                    continue
+                if load_chunk(sink, chunk, table_name, file_name, i, position, target_suffix, journal):
+                    total_rows_inserted += len(chunk)
+                else:
+                    total_rows_failed += len(chunk)
+                # A latência de cada chunk fica nas métricas (METRICS_JSONL_PATH); o log só em nível DEBUG.
+                logging.debug(f'    Chunk {i+1} do arquivo {file_name} inserido ({len(chunk)} linhas).')
+
+            if journal is not None:
+                journal.record_file(table_name, file_name, chunks)
             logging.info(f'  Arquivo {file_name} finalizado.')
             gc.collect()
 
         except Exception as e:
             logging.error(f"Falha ao processar o arquivo {file_name}. Erro: {e}")
-            logging.warning(f"O arquivo {file_name} será ignorado.")
+            logging.warning(f"O restante do arquivo {file_name} será ignorado.")
             continue
 
+    try:
+        sink.flush()
+    except Exception as e:
+        logging.error(f"Falha ao descarregar os dados pendentes da tabela {table_name}. Erro: {e}")
+
     tempo_insert = round(time.time() - insert_start)
-    logging.info(f"Tabela {table_name.upper()} finalizada! {total_rows_inserted} linhas inseridas em {tempo_insert}s.")
+    logging.info(f"Tabela {table_name.upper()} finalizada! {total_rows_inserted} linhas inseridas em {tempo_insert}s"
+                 f"{describe_failed_rows(total_rows_failed, journal)}.")
+    sink.report(table_name)
+
+def describe_failed_rows(rows, journal=None):
+    """Complemento do log de fim de tabela com as linhas dos chunks que falharam na gravação."""
+    if not rows:
+        return ''
+    return f"; {rows} linhas na fila de retentativa" if journal is not None else f"; {rows} linhas com falha na gravação"
+
+def read_table_chunks(data_path, file_name, schema, chunksize=100_000, table_name=None):
+    """
+    Lê um arquivo de dados (CSV extraído, membro de ZIP ou Parquet do cache) em chunks,
+    segundo o schema da tabela. A leitura ('parse') e a conversão de tipos ('convert') de cada
+    chunk são medidas separadamente nas métricas, identificadas por 'table_name'.
+    """
+    for _, _, chunk in iter_table_chunks(data_path, file_name, schema, chunksize, table_name):
+        yield chunk
 
-def bulk_insert_to_sql(engine, df, table_name):
-    """Insere um DataFrame em uma tabela do SQL Server usando to_sql e um engine SQLAlchemy."""
+def iter_table_chunks(data_path, file_name, schema, chunksize=100_000, table_name=None, skip=()):
+    """
+    Como 'read_table_chunks', mas retorna (índice do chunk, posição, chunk), em que a posição é
+    {'row': linha inicial do chunk, 'offset': bytes do arquivo lidos até o fim do chunk}. No CSV,
+    cada chunk tem 'chunksize' registros ('iter_csv_chunks'), e a linha é o registro. Os
+    chunks de 'skip' (já gravados, na retomada) voltam como None: no CSV, nem chegam a ser lidos
+    pelo motor de parsing; no cache Parquet, nem chegam a ser convertidos para pandas.
+    """
+    row = 0
+    if file_name.endswith('.parquet'):
+        pa, pq = import_pyarrow()
+        batches = pq.ParquetFile(os.path.join(data_path, file_name)).iter_batches(batch_size=chunksize)
+        for index, batch in enumerate(batches):
+            position = {'row': row, 'offset': None}
+            row += batch.num_rows
+            if index in skip:
+                yield index, position, None
+                continue
+            with METRICS.stage('parse', table_name, file=file_name) as event:
+                event['rows'] = batch.num_rows
+                chunk = parquet_batch_to_frame(batch)
+            with METRICS.stage('convert', table_name, file=file_name) as event:
+                event['rows'] = len(chunk)
+                chunk = restore_categories(chunk, schema)
+            yield index, position, chunk
+        return
+
+    with open_data_file(data_path, file_name) as stream:
+        yield from iter_csv_chunks(stream, schema, chunksize, table_name, file_name, skip)
+
+# Fila dos processos de parsing, definida por '_init_parse_worker' em cada processo filho
+_parse_queue = None
+
+def _init_parse_worker(queue, metrics_config=None, csv_options=None):
+    global _parse_queue
+    _parse_queue = queue
+    METRICS.configure(**(metrics_config or {}))
+    CSV_OPTIONS.update(csv_options or {})
+
+def parse_file_worker(table_name, file_name, schema, data_path, skip=()):
+    """
+    Executado nos processos de parsing: lê o arquivo em chunks e os envia para a fila limitada.
+    Quando os escritores do banco não dão vazão, 'put' bloqueia (backpressure) e o parsing
+    aguarda, mantendo a memória limitada. Ao fim, envia uma mensagem 'done' com o total de
+    linhas lidas, o erro, se houver (o log fica a cargo do processo principal), as métricas
+    de parse/convert do arquivo, somadas às do processo principal, e o total de chunks do
+    arquivo (None se a leitura falhou), registrado no jornal de carga.
+    Os chunks de 'skip' (já gravados, na retomada) não são enviados.
+    """
+    rows, error, chunks = 0, None, 0
+    METRICS.reset()
     try:
-        # method=None é mais lento mas é a opção mais robusta contra erros de limite de parâmetros
-        df.to_sql(table_name, con=engine, if_exists='append', index=False, chunksize=10_000, method=None)
+        for index, position, chunk in iter_table_chunks(data_path, file_name, schema, table_name=table_name, skip=skip):
+            chunks = index + 1
+            if chunk is None:
+                continue
+            _parse_queue.put(('chunk', table_name, file_name, chunk, index, position))
+            rows += len(chunk)
+    except Exception as e:
+        error, chunks = str(e), None
+    METRICS.write_profiles()
+    _parse_queue.put(('done', table_name, file_name, rows, error, METRICS.snapshot(), chunks))
+
+def process_and_load_data_parallel(sink, file_mappings, schemas, data_path, parse_workers=4,
+                                   db_writers=2, queue_chunks=8, sink_factory=None, target_suffix='', journal=None):
+    """
+    Carga paralela: 'parse_workers' processos leem arquivos diferentes ao mesmo tempo e
+    publicam os chunks em uma fila limitada a 'queue_chunks' itens; 'db_writers' threads, cada
+    uma com seu próprio sink (conexão), consomem a fila e gravam no banco.
+    As contagens de linhas por tabela são acumuladas pelos escritores e só incluem os chunks
+    gravados; os que falharam são contados à parte.
+    Com 'journal', os escritores registram cada chunk e os arquivos já carregados são pulados.
+    Se um escritor falhar fora do sink (jornal, tabelas-ponte, métricas), ele e os demais passam
+    a descartar as mensagens da fila até o fim, para que o parsing não fique bloqueado na fila
+    cheia; os arquivos ainda não iniciados são cancelados e o primeiro erro é relançado ao final.
+    """
+    tasks = [(table_name, file_name) for table_name, files in file_mappings.items() for file_name in files
+             if journal is None or not journal.is_file_done(table_name, file_name)]
+    if not tasks:
+        return
+
+    writer_sinks = [sink]
+    if sink_factory is not None:
+        writer_sinks += [sink_factory() for _ in range(max(1, db_writers) - 1)]
+    logging.info(f"Carga paralela: {len(tasks)} arquivos, {parse_workers} processos de parsing, "
+                 f"{len(writer_sinks)} escritores no banco, fila de {queue_chunks} chunks.")
+
+    load_start = time.time()
+    queue = multiprocessing.Queue(maxsize=max(1, queue_chunks))
+    lock = threading.Lock()
+    table_rows = {table_name: 0 for table_name in file_mappings}
+    failed_rows = {table_name: 0 for table_name in file_mappings}
+    table_end = {}
+    writer_errors = []
+    for writer_sink in writer_sinks:
+        writer_sink.reset_stats()
+
+    def handle_message(writer_sink, message):
+        kind, table_name, file_name = message[:3]
+        if kind == 'chunk':
+            chunk, index, position = message[3:]
+            loaded = load_chunk(writer_sink, chunk, table_name, file_name, index, position, target_suffix, journal)
+            with lock:
+                (table_rows if loaded else failed_rows)[table_name] += len(chunk)
+                table_end[table_name] = time.time()
+        else:
+            rows, error, metrics, chunks = message[3:]
+            METRICS.merge(metrics)
+            if journal is not None and chunks is not None:
+                journal.record_file(table_name, file_name, chunks)
+            if error:
+                logging.error(f"Falha ao processar o arquivo {file_name}. Erro: {error}")
+                logging.warning(f"O restante do arquivo {file_name} será ignorado ({rows} linhas já lidas).")
+            else:
+                logging.info(f'  Arquivo {file_name} finalizado ({rows} linhas lidas).')
+
+    def writer(writer_sink):
+        while True:
+            message = queue.get()
+            if message is None:
+                break
+            # Depois de uma falha, a fila continua sendo esvaziada até o sinal de fim
+            if writer_errors:
+                continue
+            try:
+                handle_message(writer_sink, message)
+            except Exception as e:
+                logging.error(f"Falha no escritor '{threading.current_thread().name}' ao gravar {message[2]}. Erro: {e}")
+                with lock:
+                    writer_errors.append(e)
+        try:
+            writer_sink.flush()
+        except Exception as e:
+            logging.error(f"Falha ao descarregar os dados pendentes do sink '{writer_sink.name}'. Erro: {e}")
+
+    threads = [threading.Thread(target=writer, args=(writer_sink,), name=f'db-writer-{i}', daemon=True)
+               for i, writer_sink in enumerate(writer_sinks)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, parse_workers), initializer=_init_parse_worker,
+                                 initargs=(queue, METRICS.config(), dict(CSV_OPTIONS))) as executor:
+            futures = {
+                executor.submit(parse_file_worker, table_name, file_name, schemas[table_name], data_path,
+                                journal.skip_chunks(table_name, file_name) if journal is not None else ()): file_name
+                for table_name, file_name in tasks
+            }
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                future.result()
+                if writer_errors:
+                    for pending in futures:
+                        pending.cancel()
+    finally:
+        for _ in threads:
+            queue.put(None)
+        for thread in threads:
+            thread.join()
+        for writer_sink in writer_sinks[1:]:
+            writer_sink.close()
+    if writer_errors:
+        raise writer_errors[0]
+
+    for table_name, files in file_mappings.items():
+        if files:
+            tempo_insert = round(table_end.get(table_name, load_start) - load_start)
+            logging.info(f"Tabela {table_name.upper()} finalizada! {table_rows[table_name]} linhas inseridas em "
+                         f"{tempo_insert}s{describe_failed_rows(failed_rows[table_name], journal)}.")
+    for i, writer_sink in enumerate(writer_sinks):
+        writer_sink.report(f'escritor {i}')
+
+def bulk_insert_to_sql(sink, df, table_name, on_commit=None):
+    """
+    Insere um DataFrame em uma tabela usando o destino de carga (sink) configurado.
+    Se o sink falhar e possuir um fallback (o 'to_sql'), o chunk é reenviado por ele (no 'bcp',
+    os chunks anteriores do arquivo de staging já foram reenviados pelo próprio sink).
+    Retorna None se o chunk foi aceito ou o erro, caso contrário; 'on_commit' é repassado ao
+    sink que gravou o chunk.
+    """
+    try:
+        with METRICS.stage('insert', table_name, sink=sink.name) as event:
+            event['rows'] = len(df)
+            sink.write(df, table_name, on_commit)
     except Exception as error:
+        if sink.fallback is not None:
+            logging.warning(f"Sink '{sink.name}' falhou na tabela {table_name} ({error}). Reenviando o chunk via '{sink.fallback.name}'.")
+            try:
+                with METRICS.stage('insert', table_name, sink=sink.fallback.name) as event:
+                    event['rows'] = len(df)
+                    sink.fallback.write(df, table_name, on_commit)
+                return None
+            except Exception as fallback_error:
+                error = fallback_error
         logging.error(f"Erro ao inserir dados na tabela {table_name}: {error}")
-        # Decide-se não parar o processo inteiro, mas registrar o erro de inserção do chunk.
+        # Decide-se não parar o processo inteiro: o erro é registrado e devolvido, e quem chamou
+        # decide o destino do chunk (na carga principal, a fila de retentativa do jornal).
+        return error
+    return None
+
+def classify_files(data_path, from_zip=False, zip_names=None):
+    """
+    Classifica os arquivos extraídos em categorias de tabelas.
+    Se 'from_zip' é True, classifica os membros dos ZIPs de 'data_path' ('arquivo.zip::membro'),
+    ou só dos ZIPs de 'zip_names' (no pipeline sobreposto, os outros podem estar sendo baixados).
+    """
+    if from_zip:
+        all_files = list_zip_members(data_path, zip_names)
+    else:
+        all_files = [name for name in os.listdir(data_path) if os.path.isfile(os.path.join(data_path, name))]
 
-def classify_files(extracted_path):
-    """Classifica os arquivos extraídos em categorias de tabelas."""
-    all_files = [name for name in os.listdir(extracted_path) if os.path.isfile(os.path.join(extracted_path, name))]
+    # A classificação considera apenas o nome do CSV (sem o prefixo do ZIP, se houver)
+    def csv_name(f):
+        return f.split(ZIP_MEMBER_SEPARATOR)[-1].upper()
 
     file_mappings = {
-        'empresa': [f for f in all_files if 'EMPRECSV' in f.upper()],
-        'estabelecimento': [f for f in all_files if 'ESTABELE' in f.upper()],
-        'socios': [f for f in all_files if 'SOCIOCSV' in f.upper()],
-        'simples': [f for f in all_files if 'SIMPLES.CSV' in f.upper()],
-        'cnae': [f for f in all_files if 'CNAECSV' in f.upper()],
-        'moti': [f for f in all_files if 'MOTICSV' in f.upper()],
-        'munic': [f for f in all_files if 'MUNICCSV' in f.upper()],
-        'natju': [f for f in all_files if 'NATJUCSV' in f.upper()],
-        'pais': [f for f in all_files if 'PAISCSV' in f.upper()],
-        'quals': [f for f in all_files if 'QUALSCSV' in f.upper()]
+        'empresa': [f for f in all_files if 'EMPRECSV' in csv_name(f)],
+        'estabelecimento': [f for f in all_files if 'ESTABELE' in csv_name(f)],
+        'socios': [f for f in all_files if 'SOCIOCSV' in csv_name(f)],
+        'simples': [f for f in all_files if 'SIMPLES.CSV' in csv_name(f)],
+        'cnae': [f for f in all_files if 'CNAECSV' in csv_name(f)],
+        'moti': [f for f in all_files if 'MOTICSV' in csv_name(f)],
+        'munic': [f for f in all_files if 'MUNICCSV' in csv_name(f)],
+        'natju': [f for f in all_files if 'NATJUCSV' in csv_name(f)],
+        'pais': [f for f in all_files if 'PAISCSV' in csv_name(f)],
+        'quals': [f for f in all_files if 'QUALSCSV' in csv_name(f)]
     }
 
     # Reportar arquivos não classificados
@@ -377,76 +2972,827 @@ def classify_files(extracted_path):
 
     return file_mappings
 
+# =============================================================================
+# REGISTRO DE SCHEMAS E TIPOS
+# =============================================================================
+
+# Registro de schemas: (coluna, tipo, tamanho). É a fonte única dos tipos usados no parsing
+# ('convert_chunk'), no cache Parquet e no DDL ('generate_table_ddl').
+#   varchar  -> texto limitado a 'tamanho' caracteres (VARCHAR(n))
+#   category -> texto curto e repetitivo: 'category' no pandas, VARCHAR(n) no banco
+#   tinyint  -> código numérico de 0 a 255 ('UInt8' no pandas, TINYINT no banco)
+#   date     -> data no formato AAAAMMDD ('datetime64' no pandas, DATE no banco)
+#   decimal  -> número com vírgula decimal; 'tamanho' é (precisão, escala)
+#   json     -> documento JSON sem limite de tamanho (só em tabelas derivadas)
+TABLE_SCHEMAS = {
+    'empresa': [
+        ('cnpj_basico', 'varchar', 8), ('razao_social', 'varchar', 200), ('natureza_juridica', 'category', 4),
+        ('qualificacao_responsavel', 'tinyint', None), ('capital_social', 'decimal', (18, 2)),
+        ('porte_empresa', 'tinyint', None), ('ente_federativo_responsavel', 'varchar', 100),
+    ],
+    'estabelecimento': [
+        ('cnpj_basico', 'varchar', 8), ('cnpj_ordem', 'varchar', 4), ('cnpj_dv', 'varchar', 2),
+        ('identificador_matriz_filial', 'tinyint', None), ('nome_fantasia', 'varchar', 200),
+        ('situacao_cadastral', 'tinyint', None), ('data_situacao_cadastral', 'date', None),
+        ('motivo_situacao_cadastral', 'tinyint', None), ('nome_cidade_exterior', 'varchar', 100),
+        ('pais', 'category', 3), ('data_inicio_atividade', 'date', None), ('cnae_fiscal_principal', 'varchar', 7),
+        ('cnae_fiscal_secundaria', 'varchar', 2000), ('tipo_logradouro', 'category', 20), ('logradouro', 'varchar', 200),
+        ('numero', 'varchar', 20), ('complemento', 'varchar', 200), ('bairro', 'varchar', 100), ('cep', 'varchar', 8),
+        ('uf', 'category', 2), ('municipio', 'category', 4), ('ddd_1', 'varchar', 4), ('telefone_1', 'varchar', 9),
+        ('ddd_2', 'varchar', 4), ('telefone_2', 'varchar', 9), ('ddd_fax', 'varchar', 4), ('fax', 'varchar', 9),
+        ('correio_eletronico', 'varchar', 200), ('situacao_especial', 'varchar', 100), ('data_situacao_especial', 'date', None),
+    ],
+    'socios': [
+        ('cnpj_basico', 'varchar', 8), ('identificador_socio', 'tinyint', None), ('nome_socio_razao_social', 'varchar', 200),
+        ('cpf_cnpj_socio', 'varchar', 14), ('qualificacao_socio', 'tinyint', None), ('data_entrada_sociedade', 'date', None),
+        ('pais', 'category', 3), ('representante_legal', 'varchar', 14), ('nome_do_representante', 'varchar', 200),
+        ('qualificacao_representante_legal', 'tinyint', None), ('faixa_etaria', 'tinyint', None),
+    ],
+    'simples': [
+        ('cnpj_basico', 'varchar', 8), ('opcao_pelo_simples', 'category', 1), ('data_opcao_simples', 'date', None),
+        ('data_exclusao_simples', 'date', None), ('opcao_mei', 'category', 1), ('data_opcao_mei', 'date', None),
+        ('data_exclusao_mei', 'date', None),
+    ],
+    'cnae': [('codigo', 'varchar', 7), ('descricao', 'varchar', 250)],
+    'moti': [('codigo', 'tinyint', None), ('descricao', 'varchar', 250)],
+    'munic': [('codigo', 'varchar', 4), ('descricao', 'varchar', 250)],
+    'natju': [('codigo', 'varchar', 4), ('descricao', 'varchar', 250)],
+    'pais': [('codigo', 'varchar', 3), ('descricao', 'varchar', 250)],
+    'quals': [('codigo', 'tinyint', None), ('descricao', 'varchar', 250)],
+}
+
+# Tabelas derivadas: montadas pelo ETL a partir das tabelas acima (não vêm dos CSVs).
+# 'cnpj_completo' tem os campos da 'view_completa_cnpj', um registro por estabelecimento
+# (ver 'load_denormalized_table'); as descrições substituem os códigos das tabelas de domínio.
+# 'estabelecimento_cnae_secundaria' é a tabela-ponte dos CNAEs secundários (ver BRIDGE_TABLES).
+DERIVED_TABLE_SCHEMAS = {
+    'cnpj_completo': [
+        ('cnpj', 'varchar', 14), ('cnpj_basico', 'varchar', 8), ('razao_social', 'varchar', 200),
+        ('capital_social', 'decimal', (18, 2)), ('porte_empresa', 'tinyint', None),
+        ('ente_federativo_responsavel', 'varchar', 100), ('natureza_juridica', 'varchar', 250),
+        ('cnpj_ordem', 'varchar', 4), ('cnpj_dv', 'varchar', 2), ('matriz_filial', 'varchar', 6),
+        ('nome_fantasia', 'varchar', 200), ('situacao_cadastral', 'tinyint', None),
+        ('data_situacao_cadastral', 'date', None), ('data_inicio_atividade', 'date', None),
+        ('correio_eletronico', 'varchar', 200), ('tipo_logradouro', 'varchar', 20), ('logradouro', 'varchar', 200),
+        ('numero', 'varchar', 20), ('complemento', 'varchar', 200), ('bairro', 'varchar', 100), ('cep', 'varchar', 8),
+        ('municipio', 'varchar', 250), ('uf', 'varchar', 2), ('ddd_1', 'varchar', 4), ('telefone_1', 'varchar', 9),
+        ('ddd_2', 'varchar', 4), ('telefone_2', 'varchar', 9), ('cnae_principal', 'varchar', 250),
+        ('opcao_pelo_simples', 'varchar', 1), ('data_opcao_simples', 'date', None),
+        ('data_exclusao_simples', 'date', None), ('opcao_mei', 'varchar', 1), ('data_opcao_mei', 'date', None),
+        ('data_exclusao_mei', 'date', None), ('socios', 'json', None),
+    ],
+    'estabelecimento_cnae_secundaria': [
+        ('cnpj_basico', 'varchar', 8), ('cnpj_ordem', 'varchar', 4), ('cnpj_dv', 'varchar', 2), ('cnae', 'varchar', 7),
+    ],
+}
+
 def get_table_schemas():
     """
-    Retorna um dicionário com os schemas (colunas e dtypes) para cada tabela.
+    Retorna um dicionário com os schemas de cada tabela, montados a partir de TABLE_SCHEMAS:
+    'cols' (ordem das colunas no CSV), 'dtype' (todas lidas como texto pelo read_csv) e
+    'types' ({coluna: (tipo, tamanho)}, aplicados depois por 'convert_chunk').
     AVISO: Estes schemas são baseados na análise do layout anterior. Se o ETL falhar,
     verifique o documento 'NOVOLAYOUTDOSDADOSABERTOSDOCNPJ.pdf' para confirmar se as
     colunas e a ordem delas não foram alteradas pela Receita Federal.
     """
-    schemas = {
-        'empresa': {'cols': ['cnpj_basico', 'razao_social', 'natureza_juridica', 'qualificacao_responsavel', 'capital_social', 'porte_empresa', 'ente_federativo_responsavel']},
-        'estabelecimento': {'cols': ['cnpj_basico', 'cnpj_ordem', 'cnpj_dv', 'identificador_matriz_filial', 'nome_fantasia', 'situacao_cadastral', 'data_situacao_cadastral', 'motivo_situacao_cadastral', 'nome_cidade_exterior', 'pais', 'data_inicio_atividade', 'cnae_fiscal_principal', 'cnae_fiscal_secundaria', 'tipo_logradouro', 'logradouro', 'numero', 'complemento', 'bairro', 'cep', 'uf', 'municipio', 'ddd_1', 'telefone_1', 'ddd_2', 'telefone_2', 'ddd_fax', 'fax', 'correio_eletronico', 'situacao_especial', 'data_situacao_especial']},
-        'socios': {'cols': ['cnpj_basico', 'identificador_socio', 'nome_socio_razao_social', 'cpf_cnpj_socio', 'qualificacao_socio', 'data_entrada_sociedade', 'pais', 'representante_legal', 'nome_do_representante', 'qualificacao_representante_legal', 'faixa_etaria']},
-        'simples': {'cols': ['cnpj_basico', 'opcao_pelo_simples', 'data_opcao_simples', 'data_exclusao_simples', 'opcao_mei', 'data_opcao_mei', 'data_exclusao_mei']},
-        'cnae': {'cols': ['codigo', 'descricao']},
-        'moti': {'cols': ['codigo', 'descricao']},
-        'munic': {'cols': ['codigo', 'descricao']},
-        'natju': {'cols': ['codigo', 'descricao']},
-        'pais': {'cols': ['codigo', 'descricao']},
-        'quals': {'cols': ['codigo', 'descricao']}
-    }
-    # Adicionar dtypes como string para todas as colunas
-    for table in schemas:
-        schemas[table]['dtype'] = {col: str for col in schemas[table]['cols']}
+    schemas = {}
+    for table_name, columns in TABLE_SCHEMAS.items():
+        schemas[table_name] = {
+            'cols': [col for col, _, _ in columns],
+            # O read_csv lê tudo como texto (preserva zeros à esquerda); os tipos vêm depois
+            'dtype': {col: str for col, _, _ in columns},
+            'types': {col: (col_type, size) for col, col_type, size in columns},
+        }
     return schemas
 
+def get_schema_signature(table_name):
+    """Hash curto do schema da tabela: muda sempre que um tipo ou tamanho do registro muda."""
+    columns = TABLE_SCHEMAS.get(table_name) or DERIVED_TABLE_SCHEMAS[table_name]
+    return hashlib.sha256(repr(columns).encode('utf-8')).hexdigest()[:16]
+
+def _convert_text(series, size):
+    # Textos maiores que a coluna não chegam aqui: viram nulos ou rejeitam a linha, e vão para
+    # a quarentena ('split_oversized_values'), em vez de serem truncados
+    return series
+
+def _convert_category(series, size):
+    return _convert_text(series, size).astype('category')
+
+def _convert_tinyint(series, size):
+    values = pd.to_numeric(series, errors='coerce')
+    return values.where(values.between(0, 255) & (values % 1 == 0)).astype('UInt8')
+
+def _convert_date(series, size):
+    # Datas inválidas ou zeradas ('0', '00000000') viram nulas
+    return pd.to_datetime(series, format='%Y%m%d', errors='coerce')
+
+def _convert_decimal(series, size):
+    # Formato brasileiro: '1.234,56' -> 1234.56
+    text_values = series.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    return pd.to_numeric(text_values, errors='coerce').round(size[1])
+
+COLUMN_CONVERTERS = {
+    'varchar': _convert_text,
+    'category': _convert_category,
+    'tinyint': _convert_tinyint,
+    'date': _convert_date,
+    'decimal': _convert_decimal,
+}
+
+# Colunas que identificam o registro (chaves das junções e dos índices clusterizados): um
+# valor maior que a coluna em uma delas rejeita a linha inteira; nas demais, só o valor é anulado
+IDENTIFYING_COLUMNS = ('cnpj_basico', 'cnpj_ordem', 'cnpj_dv', 'codigo')
+
+def split_oversized_values(chunk, schema):
+    """
+    Trata os campos de um chunk (ainda como texto) maiores que o tamanho da coluna: eles não
+    cabem no banco e não são truncados, já que o corte pode cair no meio de um valor (ex.: um
+    CNAE da lista 'cnae_fiscal_secundaria'). Se o campo é de IDENTIFYING_COLUMNS, a linha é
+    rejeitada; senão, só o valor vira nulo e a linha segue para a carga. Retorna (chunk sem as
+    linhas rejeitadas, rejeitadas, linhas com valores anulados), as listas como em
+    'locate_rejected_lines', com o registro original remontado a partir dos campos e sem a
+    posição no arquivo, que o chunk não guarda.
+    """
+    oversized = {}
+    for col, (col_type, size) in schema['types'].items():
+        if col_type in ('varchar', 'category') and size:
+            over = (chunk[col].str.len() > size).to_numpy(dtype=bool, na_value=False)
+            if over.any():
+                oversized[col] = over
+    if not oversized:
+        return chunk, [], []
+    rejected_rows = np.logical_or.reduce([over for col, over in oversized.items() if col in IDENTIFYING_COLUMNS]
+                                         or [np.zeros(len(chunk), dtype=bool)])
+    rejected, nulled = [], []
+    for position in np.flatnonzero(np.logical_or.reduce(list(oversized.values()))):
+        row = chunk.iloc[position]
+        reason = '; '.join(f"{col}: {len(row[col])} characters, max {schema['types'][col][1]}"
+                           for col, over in oversized.items() if over[position])
+        text = ';'.join('' if pd.isna(value) else '"' + value.replace('"', '""') + '"' for value in row[schema['cols']])
+        if rejected_rows[position]:
+            rejected.append((None, None, text.encode('latin-1', errors='replace'), reason))
+        else:
+            nulled.append((None, None, text.encode('latin-1', errors='replace'), reason + ' (set to null)'))
+    for col, over in oversized.items():
+        if col not in IDENTIFYING_COLUMNS:
+            chunk.loc[over, col] = None
+    return chunk[~rejected_rows].reset_index(drop=True), rejected, nulled
+
+def convert_chunk(chunk, schema):
+    """Converte um chunk lido como texto para os tipos do registro, coluna a coluna (vetorizado)."""
+    for col, (col_type, size) in schema['types'].items():
+        chunk[col] = COLUMN_CONVERTERS[col_type](chunk[col], size)
+    return chunk
+
+def restore_categories(chunk, schema):
+    """Reaplica o dtype 'category' às colunas do registro (o Parquet as devolve como texto)."""
+    for col, (col_type, _) in schema['types'].items():
+        if col_type == 'category':
+            chunk[col] = chunk[col].astype('category')
+    return chunk
+
+def explode_secondary_cnaes(chunk):
+    """
+    Converte a lista 'cnae_fiscal_secundaria' ('4781400,4789099') de um chunk de
+    estabelecimentos em uma linha por CNAE: (cnpj_basico, cnpj_ordem, cnpj_dv, cnae).
+    Vetorizado (split + explode); códigos vazios e repetidos no mesmo estabelecimento são descartados.
+    Códigos que não têm exatamente 7 dígitos são rejeitados (contados no log), nunca cortados:
+    a lista original continua completa em 'estabelecimento.cnae_fiscal_secundaria'.
+    """
+    keys = ['cnpj_basico', 'cnpj_ordem', 'cnpj_dv']
+    listed = chunk['cnae_fiscal_secundaria'].notna()
+    bridge = chunk.loc[listed, keys].assign(cnae=chunk.loc[listed, 'cnae_fiscal_secundaria'].str.split(','))
+    bridge = bridge.explode('cnae', ignore_index=True)
+    bridge['cnae'] = bridge['cnae'].str.strip()
+    bridge = bridge[bridge['cnae'].str.len() > 0]
+    valid = bridge['cnae'].str.fullmatch(r'\d{7}')
+    if not valid.all():
+        invalid = bridge.loc[~valid, 'cnae']
+        logging.warning(f"  {len(invalid)} códigos de CNAE secundário inválidos rejeitados na tabela-ponte "
+                        f"(ex.: {', '.join(repr(code) for code in invalid.unique()[:5])}).")
+        bridge = bridge[valid]
+    return bridge.drop_duplicates(ignore_index=True)
+
+# Tabelas-ponte: montadas durante a carga a partir de cada chunk da tabela de origem. São
+# criadas, carregadas (como chunks próprios no jornal), indexadas e publicadas junto com ela.
+BRIDGE_TABLES = {
+    'estabelecimento_cnae_secundaria': {'source': 'estabelecimento', 'build': explode_secondary_cnaes},
+}
+
+def get_bridge_tables(table_name):
+    """Tabelas-ponte montadas a partir de 'table_name'."""
+    return [bridge for bridge, spec in BRIDGE_TABLES.items() if spec['source'] == table_name]
+
+def with_bridge_tables(tables):
+    """As tabelas informadas seguidas das suas tabelas-ponte."""
+    return [target for table_name in tables for target in [table_name] + get_bridge_tables(table_name)]
+
+SQL_TYPES = {
+    'mssql': {'varchar': 'VARCHAR({size})', 'category': 'VARCHAR({size})', 'tinyint': 'TINYINT',
+              'date': 'DATE', 'decimal': 'DECIMAL({precision},{scale})', 'json': 'VARCHAR(MAX)'},
+    'sqlite': {'varchar': 'TEXT', 'category': 'TEXT', 'tinyint': 'INTEGER', 'date': 'TEXT', 'decimal': 'REAL',
+               'json': 'TEXT'},
+    'duckdb': {'varchar': 'VARCHAR', 'category': 'VARCHAR', 'tinyint': 'UTINYINT',
+               'date': 'DATE', 'decimal': 'DECIMAL({precision},{scale})', 'json': 'VARCHAR'},
+}
+
+def get_sql_type(col_type, size, dialect='mssql'):
+    """Traduz um tipo do registro para o tipo SQL do dialeto ('mssql', 'sqlite' ou 'duckdb')."""
+    precision, scale = size if col_type == 'decimal' else (None, None)
+    return SQL_TYPES[dialect][col_type].format(size=size, precision=precision, scale=scale)
+
+def generate_table_ddl(table_name, target_name=None, dialect='mssql'):
+    """Gera o CREATE TABLE de uma tabela (ou tabela derivada) a partir do registro de schemas."""
+    columns = TABLE_SCHEMAS.get(table_name) or DERIVED_TABLE_SCHEMAS[table_name]
+    lines = [f"    {col} {get_sql_type(col_type, size, dialect)}" for col, col_type, size in columns]
+    return f"CREATE TABLE {target_name or table_name} (\n" + ',\n'.join(lines) + "\n);\n"
+
+def write_ddl_files(ddl_dir=None):
+    """Regrava os arquivos 'sql/ddl/*.sql' a partir do registro de schemas."""
+    if ddl_dir is None:
+        ddl_dir = os.path.join(pathlib.Path(__file__).parent.parent.resolve(), 'sql', 'ddl')
+    makedirs(ddl_dir)
+    for table_name in list(TABLE_SCHEMAS) + list(DERIVED_TABLE_SCHEMAS):
+        with open(os.path.join(ddl_dir, f'{table_name}.sql'), 'w', encoding='utf-8') as f:
+            f.write(generate_table_ddl(table_name))
+        logging.info(f"  - DDL gerado: {table_name}.sql")
+
+def get_arrow_schema(schema):
+    """Schema pyarrow equivalente ao registro (usado no cache Parquet e na exportação)."""
+    pa, _ = import_pyarrow()
+    arrow_types = {'varchar': pa.string(), 'category': pa.string(), 'tinyint': pa.uint8(),
+                   'date': pa.date32(), 'decimal': pa.float64(), 'json': pa.string()}
+    return pa.schema([(col, arrow_types[col_type]) for col, (col_type, _) in schema['types'].items()])
+
+def dataframe_to_rows(df, dates_as_text=False):
+    """
+    Converte um DataFrame tipado em lista de tuplas para drivers DB-API, com nulos como None
+    e datas como 'datetime.date' (ou texto ISO, se 'dates_as_text').
+    """
+    values = df.astype(object)
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            # O texto volta a 'object': no dtype 'str', os nulos seguiriam como NaN, e não None
+            values[col] = (df[col].dt.strftime('%Y-%m-%d') if dates_as_text else df[col].dt.date).astype(object)
+    return values.where(df.notna(), None).values.tolist()
+
+# =============================================================================
+# PIPELINE SOBREPOSTO (AGENDADOR ASYNCIO)
+# =============================================================================
+
+# Recursos do agendador: cada um tem um limite próprio de tarefas simultâneas
+PIPELINE_RESOURCES = ('network', 'disk', 'cpu', 'db')
+
+# Prefixo do nome de cada ZIP da Receita Federal (sem o número da parte) -> tabela que ele
+# alimenta. Permite planejar o pipeline antes dos downloads; um ZIP fora desta lista faz o ETL
+# voltar ao modo sequencial.
+ZIP_TABLE_PREFIXES = {
+    'empresas': 'empresa', 'estabelecimentos': 'estabelecimento', 'socios': 'socios', 'simples': 'simples',
+    'cnaes': 'cnae', 'motivos': 'moti', 'municipios': 'munic', 'naturezas': 'natju', 'paises': 'pais',
+    'qualificacoes': 'quals',
+}
+
+def get_zip_table(zip_name):
+    """Tabela alimentada por um ZIP, pelo nome dele ('Estabelecimentos3.zip' -> 'estabelecimento')."""
+    return ZIP_TABLE_PREFIXES.get(re.sub(r'\d*\.zip$', '', zip_name.lower()))
+
+class PipelineError(RuntimeError):
+    """Uma tarefa do pipeline não foi executada porque uma das suas dependências falhou."""
+
+class PipelineScheduler:
+    """
+    Agendador de tarefas com dependências sobre um laço asyncio. Cada tarefa declara o recurso
+    que ocupa (PIPELINE_RESOURCES) e as tarefas de que depende; ela começa assim que as
+    dependências terminam e há vaga no recurso (um semáforo por recurso), e a função bloqueante
+    roda em um pool de threads. Assim, rede, disco, CPU e banco trabalham ao mesmo tempo em
+    arquivos e tabelas diferentes, e o tempo total tende ao da etapa mais lenta, não à soma delas.
+    Tarefas sem recurso (None) são só de controle (decisões rápidas) e não esperam vaga.
+    Uma tarefa que falha não interrompe as independentes; as que dependem dela não são executadas.
+    """
+
+    def __init__(self, limits):
+        self.limits = {resource: max(1, limits.get(resource, 1)) for resource in PIPELINE_RESOURCES}
+        self.tasks = {}
+        self.busy = {resource: [] for resource in PIPELINE_RESOURCES}  # intervalos (início, fim) por recurso
+
+    def add(self, name, resource, func, *args, depends=()):
+        """Adiciona uma tarefa. As dependências precisam ter sido adicionadas antes."""
+        missing = [dep for dep in depends if dep not in self.tasks]
+        if missing:
+            raise ValueError(f"Tarefa '{name}' depende de tarefas inexistentes: {', '.join(missing)}.")
+        self.tasks[name] = {'resource': resource, 'func': func, 'args': args, 'depends': list(depends)}
+        return name
+
+    def run(self):
+        """Executa todas as tarefas. Retorna {tarefa: resultado}; se alguma falhar, levanta o primeiro erro."""
+        return asyncio.run(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        semaphores = {resource: asyncio.Semaphore(limit) for resource, limit in self.limits.items()}
+        # Uma thread a mais para as tarefas de controle, que não ocupam recurso
+        executor = ThreadPoolExecutor(max_workers=sum(self.limits.values()) + 1, thread_name_prefix='pipeline')
+        futures = {}
+
+        async def run_task(name):
+            task = self.tasks[name]
+            for dep in task['depends']:
+                try:
+                    await futures[dep]
+                except Exception:
+                    raise PipelineError(f"Dependência '{dep}' falhou.")
+            call = functools.partial(task['func'], *task['args'])
+            if task['resource'] is None:
+                return await loop.run_in_executor(executor, call)
+            async with semaphores[task['resource']]:
+                start = time.perf_counter()
+                try:
+                    return await loop.run_in_executor(executor, call)
+                finally:
+                    self.busy[task['resource']].append((start, time.perf_counter()))
+
+        pipeline_start = time.perf_counter()
+        try:
+            for name in self.tasks:
+                futures[name] = asyncio.ensure_future(run_task(name))
+            results = await asyncio.gather(*futures.values(), return_exceptions=True)
+        finally:
+            executor.shutdown(wait=True)
+        self.log_summary(time.perf_counter() - pipeline_start)
+
+        results = dict(zip(futures, results))
+        failures = {name: error for name, error in results.items()
+                    if isinstance(error, Exception) and not isinstance(error, PipelineError)}
+        for name, error in failures.items():
+            logging.error(f"Tarefa '{name}' do pipeline falhou. Erro: {error}")
+        if failures:
+            raise next(iter(failures.values()))
+        return results
+
+    def log_summary(self, wall_seconds):
+        """Registra o tempo total e o tempo ocupado de cada recurso (união dos intervalos)."""
+        parts = []
+        for resource in PIPELINE_RESOURCES:
+            busy, end = 0.0, None
+            for start, stop in sorted(self.busy[resource]):
+                if end is None or start > end:
+                    busy += stop - start
+                    end = stop
+                elif stop > end:
+                    busy += stop - end
+                    end = stop
+            parts.append(f"{resource} {busy:.0f}s")
+        logging.info(f"Pipeline finalizado em {wall_seconds:.0f}s. Tempo ocupado por recurso: {', '.join(parts)}.")
+
 # =============================================================================
 # FUNÇÃO PRINCIPAL
 # =============================================================================
 
+def parse_arguments(argv=None):
+    """Lê os argumentos de linha de comando."""
+    parser = argparse.ArgumentParser(description="ETL dos dados públicos de CNPJ da Receita Federal.")
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help="Recarrega apenas as tabelas cujos arquivos mudaram desde a última carga, "
+             "via tabelas de staging, sem recriar o banco de dados."
+    )
+    parser.add_argument(
+        '--resume', action='store_true',
+        help="Retoma a última carga interrompida a partir do jornal de carga (OUTPUT/load_journal.jsonl), "
+             "pulando os chunks já gravados, sem recriar o banco de dados."
+    )
+    parser.add_argument(
+        '--write-ddl', action='store_true',
+        help="Regrava os arquivos 'sql/ddl/*.sql' a partir do registro de schemas e encerra."
+    )
+    return parser.parse_args(argv)
+
 def main():
     """
     Função principal que orquestra todo o processo de ETL.
     """
+    args = parse_arguments()
     setup_logging()
+
+    if args.write_ddl:
+        logging.info("Gerando os arquivos de DDL a partir do registro de schemas...")
+        write_ddl_files()
+        return
     start_time = time.time()
 
     logging.info(">>> INICIANDO PROCESSO DE ETL DE DADOS DA RECEITA FEDERAL <<<")
 
     # 1. Carregar Configurações
     config, db_name = load_environment_variables()
+    METRICS.configure(
+        jsonl_path=config['metrics_jsonl_path'],
+        prometheus_path=config['metrics_prometheus_path'],
+        profile_stages=config['profile_stages'],
+        profile_path=config['profile_path'],
+    )
+    configure_csv_parser(config['csv_engine'], config['quarantine_path'])
+    try:
+        run_etl(config, db_name, args.incremental, start_time, resume=args.resume)
+    finally:
+        # As métricas são gravadas mesmo se o processo falhar no meio
+        METRICS.flush()
+        METRICS.close()
+
+def run_etl(config, db_name, incremental, start_time, resume=False):
+    """
+    Executa as etapas do ETL: download, extração, carga, índices e atualização do manifesto.
+    Com 'resume', continua a carga interrompida registrada no jornal de carga ('LoadJournal'),
+    com as mesmas tabelas e o mesmo modo (completo ou incremental) da execução original.
+    """
+    if incremental and config['bulk_sink'] in EMBEDDED_SINKS:
+        logging.warning("A carga incremental não é suportada em bancos embarcados. Executando carga completa.")
+        incremental = False
+    manifest = load_manifest(config['output_path'])
+
+    if config['pipeline_overlap']:
+        if resume:
+            logging.info("A retomada ('--resume') usa o modo sequencial.")
+        elif run_etl_pipeline(config, db_name, incremental, start_time, manifest):
+            return
 
     # 2. Download e Extração
-    download_data_files(config['data_url'], config['output_path'])
-    extract_zip_files(config['output_path'], config['extracted_path'])
+    known_remote = {name: info['remote'] for name, info in manifest['files'].items() if 'remote' in info}
+    remote_files = download_data_files(
+        config['data_url'], config['output_path'],
+        workers=config['download_workers'],
+        segments=config['download_segments'],
+        segment_min_bytes=config['download_segment_min_mb'] * 1024 * 1024,
+        known_remote=known_remote
+    )
+    update_manifest_files(manifest, remote_files=remote_files)
+    save_manifest(config['output_path'], manifest)
+
+    logging.info("Calculando as impressões digitais dos arquivos...")
+    local_files = fingerprint_local_files(config['output_path'], manifest)
+    table_fingerprints = get_table_fingerprints(config['output_path'], local_files)
+    update_manifest_files(manifest, local_files=local_files)
+
+    journal = LoadJournal(config['output_path'])
+    if resume and not journal.load():
+        logging.warning("Nenhuma carga interrompida no jornal de carga. Executando uma carga normal.")
+        resume = False
+    if resume:
+        # Tabelas sem impressão digital no jornal ainda não tinham sido planejadas (pipeline sobreposto)
+        changed = [t for t in journal.run['tables'] if t in journal.run['fingerprints']
+                   and table_fingerprints.get(t, {}).get('fingerprint') != journal.run['fingerprints'][t]]
+        if changed:
+            logging.error(f"Os arquivos das tabelas {', '.join(changed)} mudaram desde a carga interrompida. "
+                          f"Execute novamente sem '--resume'.")
+            sys.exit(1)
+        incremental = journal.run['incremental']
+        tables_to_load = journal.run['tables']
+        logging.info(f"Retomando a carga iniciada em {journal.run['started_at']} "
+                     f"({'incremental' if incremental else 'completa'}): {', '.join(tables_to_load)}")
+    elif incremental:
+        tables_to_load = get_changed_tables(table_fingerprints, manifest)
+        if not tables_to_load:
+            save_manifest(config['output_path'], manifest)
+            logging.info("Nenhum arquivo mudou desde a última carga. Nada a atualizar.")
+            return
+        logging.info(f"Tabelas com arquivos alterados: {', '.join(tables_to_load)}")
+    else:
+        tables_to_load = list(table_fingerprints)
+    # Na carga completa, todas as tabelas do DDL são (re)criadas, mesmo as sem arquivos
+    load_tables = tables_to_load if incremental else None
+    # Na carga incremental, as tabelas alteradas são carregadas em staging e publicadas ao final,
+    # de modo que as consultas continuam usando as versões anteriores durante a atualização.
+    suffix = STAGING_SUFFIX if incremental else ''
+
+    def tables_to_create(tables):
+        # Na retomada, só as tabelas sem nenhum chunk gravado são (re)criadas
+        return [t for t in tables if not journal.table_started(t)] if resume else list(tables)
+
+    # Com o cache Parquet, só as tabelas sem cache válido precisam ler (e extrair) os CSVs
+    cache_path = config['parquet_cache_path']
+    tables_to_parse = get_stale_cache_tables(cache_path, table_fingerprints, tables_to_load) if cache_path else tables_to_load
+    zips_to_use = sorted({z for t in tables_to_parse for z in table_fingerprints[t]['zip_files']})
+
+    if config['stream_from_zip']:
+        logging.info("Modo streaming ativo: os CSVs serão lidos diretamente dos arquivos ZIP (sem extração).")
+        data_path = config['output_path']
+    else:
+        if zips_to_use:
+            extract_zip_files(config['output_path'], config['extracted_path'], zip_names=zips_to_use)
+        data_path = config['extracted_path']
+
+    if cache_path:
+        build_parquet_cache(data_path, cache_path, table_fingerprints, tables_to_parse,
+                            from_zip=config['stream_from_zip'], partition_digits=config['parquet_partition_digits'])
+        data_path = cache_path
+
+    # Índices de consulta offline e de busca por nome, gerados a partir do cache (não dependem do banco de dados)
+    if config['lookup_store_path']:
+        build_lookup_store(cache_path, config['lookup_store_path'])
+    if config['name_index_path']:
+        build_name_index(cache_path, config['name_index_path'])
+
+    derived_tables, derived_fingerprints = get_derived_tables(config, manifest, incremental)
+
+    if resume:
+        journal.resume()
+    else:
+        journal.start(tables_to_load, incremental, suffix,
+                      {t: table_fingerprints[t]['fingerprint'] for t in tables_to_load})
+
+    # Banco embarcado (SQLite/DuckDB): substituto local do SQL Server, sem preparação de servidor
+    if config['bulk_sink'] in EMBEDDED_SINKS:
+        sink = create_sink(config['bulk_sink'], config=config)
+        try:
+            new_tables = tables_to_create(TABLE_SCHEMAS)
+            if new_tables:
+                sink.prepare_tables(new_tables)
+            # Bancos embarcados aceitam um único escritor; o parsing pode ser paralelo.
+            process_and_load_data(sink, data_path, from_zip=config['stream_from_zip'],
+                                  parse_workers=config['parse_workers'], queue_chunks=config['queue_max_chunks'],
+                                  from_cache=bool(cache_path), journal=journal)
+            if derived_tables:
+                sink.prepare_tables(derived_tables)
+                load_denormalized_table(sink, cache_path)
+        finally:
+            sink.close()
+        finish_etl(config, manifest, table_fingerprints, tables_to_load, derived_fingerprints, derived_tables,
+                   journal, start_time)
+        return
 
     # 3. Conexão e Configuração do Banco de Dados
-    logging.info("Iniciando preparação do banco de dados...")
-    master_engine = get_db_engine(config, db_name='master')
-    prepare_database(master_engine, db_name)
-    master_engine.dispose() # Descarta o engine do master
-    logging.info("Preparação do banco de dados finalizada.")
-
-    # Cria um novo engine conectado diretamente ao banco de dados de destino
-    logging.info(f"Criando nova conexão para o banco de dados '{db_name}'...")
-    target_engine = get_db_engine(config, db_name=db_name)
+    target_engine = open_target_database(config, db_name, recreate=not (incremental or resume))
 
     try:
-        setup_database_tables(target_engine)
+        setup_database_tables(target_engine, tables=tables_to_create(TABLE_SCHEMAS if load_tables is None else load_tables),
+                              suffix=suffix)
 
         # 4. Processamento e Carga dos Dados
-        process_and_load_data(target_engine, config['extracted_path'])
+        sink = create_sink(config['bulk_sink'], target_engine, config, db_name)
+        try:
+            process_and_load_data(
+                sink, data_path, from_zip=config['stream_from_zip'],
+                parse_workers=config['parse_workers'],
+                db_writers=config['db_writers'],
+                queue_chunks=config['queue_max_chunks'],
+                sink_factory=lambda: create_sink(config['bulk_sink'], target_engine, config, db_name),
+                tables=load_tables,
+                target_suffix=suffix,
+                from_cache=bool(cache_path),
+                journal=journal
+            )
+        finally:
+            sink.close()
 
         # 5. Otimização do Banco (Índices)
-        create_database_indexes(target_engine)
+        create_database_indexes(target_engine, tables=load_tables, suffix=suffix,
+                                columnstore=config['index_columnstore'],
+                                compression=config['index_compression'])
+
+        # Tabela desnormalizada, montada a partir do cache em vez de uma junção SQL após a carga
+        load_derived_tables(target_engine, config, db_name, derived_tables, suffix)
+
+        if incremental:
+            swap_staging_tables(target_engine, tables_to_load + derived_tables, suffix)
     finally:
         # Garante que a conexão final seja fechada
         logging.info("Fechando conexão com o banco de dados de destino.")
         target_engine.dispose()
 
+    finish_etl(config, manifest, table_fingerprints, tables_to_load, derived_fingerprints, derived_tables,
+               journal, start_time)
+
+def run_etl_pipeline(config, db_name, incremental, start_time, manifest):
+    """
+    Variante de 'run_etl' com as etapas sobrepostas (PIPELINE_OVERLAP=true), pelo
+    'PipelineScheduler': cada ZIP é baixado (rede), tem a impressão digital calculada e é
+    extraído (disco) assim que possível, e cada tabela gera o seu cache Parquet (CPU) e é
+    carregada e indexada (banco) assim que os seus ZIPs ficam prontos. As tabelas com menos
+    ZIPs vêm primeiro: na carga incremental (em tabelas de staging), as de domínio, o Simples e
+    as empresas são carregados enquanto os estabelecimentos ainda estão sendo baixados. A carga
+    completa, que recria o banco, só começa depois de todos os downloads; até lá, extração e
+    cache seguem sobrepostos aos downloads.
+    Retorna False, sem executar nada, se algum ZIP não puder ser associado a uma tabela pelo nome.
+    """
+    data_url, zip_names = list_remote_zip_files(config['data_url'])
+    unknown = [zip_name for zip_name in zip_names if get_zip_table(zip_name) is None]
+    if unknown:
+        logging.warning(f"ZIPs sem tabela conhecida ({', '.join(unknown)}). Usando o modo sequencial.")
+        return False
+    table_zips = {}
+    for zip_name in zip_names:
+        table_zips.setdefault(get_zip_table(zip_name), []).append(zip_name)
+
+    logging.info("--- INICIANDO PIPELINE SOBREPOSTO (DOWNLOAD, EXTRAÇÃO, CACHE E CARGA) ---")
+    output_path, cache_path = config['output_path'], config['parquet_cache_path']
+    embedded = config['bulk_sink'] in EMBEDDED_SINKS
+    suffix = STAGING_SUFFIX if incremental else ''
+    # Origem dos CSVs (ZIPs, no modo streaming, ou a pasta de extração) e origem da carga
+    source_path = output_path if config['stream_from_zip'] else config['extracted_path']
+    data_path = cache_path or source_path
+    known_remote = {name: info['remote'] for name, info in manifest['files'].items() if 'remote' in info}
+    remote_files, local_files, table_fingerprints, plans = {}, {}, {}, {}
+    database = {}  # sink do banco embarcado ou engine do SQL Server, criado pela tarefa 'prepare_db'
+    lock = threading.Lock()
+
+    # Na carga incremental, as tabelas entram no jornal à medida que são planejadas
+    journal = LoadJournal(output_path)
+    journal.start([] if incremental else sorted(table_zips), incremental, suffix, {})
+
+    def prepare_db():
+        if embedded:
+            database['sink'] = create_sink(config['bulk_sink'], config=config)
+            database['sink'].prepare_tables()
+            return
+        database['engine'] = open_target_database(config, db_name, recreate=not incremental)
+        if not incremental:
+            setup_database_tables(database['engine'])
+
+    def download(zip_name):
+        try:
+            info = download_file(urllib.parse.urljoin(data_url, zip_name), os.path.join(output_path, zip_name),
+                                 config['download_segments'], config['download_segment_min_mb'] * 1024 * 1024,
+                                 known_remote=known_remote.get(zip_name))
+        except Exception as e:
+            METRICS.record_error('download', file=zip_name, error=str(e))
+            raise
+        with lock:
+            remote_files[zip_name] = info
+
+    def fingerprint(zip_name):
+        info = fingerprint_local_file(output_path, zip_name, manifest)
+        with lock:
+            local_files[zip_name] = info
+
+    def plan(table_name):
+        # Decide se a tabela é carregada (carga completa ou entradas alteradas) e se os CSVs
+        # precisam ser lidos (sem cache válido), como 'run_etl' faz para todas de uma vez
+        with lock:
+            table_fingerprints[table_name] = get_table_fingerprint(table_name, table_zips[table_name], local_files)
+        table_fingerprint = table_fingerprints[table_name]['fingerprint']
+        load = not incremental or manifest['tables'].get(table_name, {}).get('fingerprint') != table_fingerprint
+        parse = load and (not cache_path or get_cache_fingerprint(cache_path, table_name) != table_fingerprint)
+        plans[table_name] = {'load': load, 'parse': parse}
+        if load:
+            journal.add_table(table_name, table_fingerprint)
+        else:
+            logging.info(f"Tabela {table_name.upper()} sem alterações desde a última carga. Mantida.")
+
+    def extract(zip_name, table_name):
+        if plans[table_name]['parse'] and not config['stream_from_zip']:
+            extract_zip_files(output_path, config['extracted_path'], zip_names=[zip_name])
+
+    def build_cache(table_name):
+        if cache_path and plans[table_name]['parse']:
+            build_parquet_cache(source_path, cache_path, table_fingerprints, [table_name],
+                                from_zip=config['stream_from_zip'], partition_digits=config['parquet_partition_digits'],
+                                zip_names=table_zips[table_name])
+
+    def load(table_name):
+        if not plans[table_name]['load']:
+            return
+        if embedded:
+            process_and_load_data(database['sink'], data_path, from_zip=config['stream_from_zip'],
+                                  parse_workers=config['parse_workers'], queue_chunks=config['queue_max_chunks'],
+                                  tables=[table_name], from_cache=bool(cache_path), journal=journal,
+                                  zip_names=table_zips[table_name])
+            return
+        engine = database['engine']
+        if incremental:
+            setup_database_tables(engine, tables=[table_name], suffix=suffix)
+        sink = create_sink(config['bulk_sink'], engine, config, db_name)
+        try:
+            process_and_load_data(
+                sink, data_path, from_zip=config['stream_from_zip'],
+                parse_workers=config['parse_workers'],
+                db_writers=config['db_writers'],
+                queue_chunks=config['queue_max_chunks'],
+                sink_factory=lambda: create_sink(config['bulk_sink'], engine, config, db_name),
+                tables=[table_name],
+                target_suffix=suffix,
+                from_cache=bool(cache_path),
+                journal=journal,
+                zip_names=table_zips[table_name]
+            )
+        finally:
+            sink.close()
+        create_database_indexes(engine, tables=[table_name], suffix=suffix,
+                                columnstore=config['index_columnstore'],
+                                compression=config['index_compression'])
+
+    # Bancos embarcados aceitam um único escritor
+    scheduler = PipelineScheduler({
+        'network': config['download_workers'], 'disk': config['pipeline_disk_tasks'],
+        'cpu': config['pipeline_cpu_tasks'], 'db': 1 if embedded else config['pipeline_db_tasks'],
+    })
+    ordered_tables = sorted(table_zips.items(), key=lambda item: len(item[1]))
+    for table_name, zips in ordered_tables:
+        for zip_name in zips:
+            scheduler.add(f'download:{zip_name}', 'network', download, zip_name)
+            scheduler.add(f'fingerprint:{zip_name}', 'disk', fingerprint, zip_name, depends=[f'download:{zip_name}'])
+    # A carga completa recria o banco (ou as tabelas do banco embarcado): isso só acontece depois
+    # de todos os downloads, para que uma falha de rede não deixe o banco de produção vazio
+    destructive = embedded or not incremental
+    scheduler.add('prepare_db', 'db', prepare_db, depends=[f'download:{z}' for z in zip_names] if destructive else [])
+    for table_name, zips in ordered_tables:
+        scheduler.add(f'plan:{table_name}', None, plan, table_name, depends=[f'fingerprint:{z}' for z in zips])
+        for zip_name in zips:
+            scheduler.add(f'extract:{zip_name}', 'disk', extract, zip_name, table_name, depends=[f'plan:{table_name}'])
+        scheduler.add(f'cache:{table_name}', 'cpu', build_cache, table_name, depends=[f'extract:{z}' for z in zips])
+        scheduler.add(f'load:{table_name}', 'db', load, table_name, depends=['prepare_db', f'cache:{table_name}'])
+
+    try:
+        try:
+            scheduler.run()
+        finally:
+            # Os metadados dos arquivos baixados são gravados mesmo se alguma tarefa falhar
+            update_manifest_files(manifest, remote_files=remote_files, local_files=local_files)
+            save_manifest(output_path, manifest)
+
+        tables_to_load = sorted(table_name for table_name, table_plan in plans.items() if table_plan['load'])
+        if incremental and not tables_to_load:
+            logging.info("Nenhum arquivo mudou desde a última carga.")
+
+        # Índices offline e tabela desnormalizada dependem do cache de todas as tabelas
+        if config['lookup_store_path']:
+            build_lookup_store(cache_path, config['lookup_store_path'])
+        if config['name_index_path']:
+            build_name_index(cache_path, config['name_index_path'])
+        derived_tables, derived_fingerprints = get_derived_tables(config, manifest, incremental)
+        if embedded:
+            if derived_tables:
+                database['sink'].prepare_tables(derived_tables)
+                load_denormalized_table(database['sink'], cache_path)
+        else:
+            load_derived_tables(database['engine'], config, db_name, derived_tables, suffix)
+            if incremental and tables_to_load + derived_tables:
+                swap_staging_tables(database['engine'], tables_to_load + derived_tables, suffix)
+    finally:
+        if 'sink' in database:
+            database['sink'].close()
+        if 'engine' in database:
+            logging.info("Fechando conexão com o banco de dados de destino.")
+            database['engine'].dispose()
+
+    finish_etl(config, manifest, table_fingerprints, tables_to_load, derived_fingerprints, derived_tables,
+               journal, start_time)
+    return True
+
+def get_derived_tables(config, manifest, incremental):
+    """
+    Tabelas derivadas a (re)construir e as suas impressões digitais. A tabela desnormalizada é
+    refeita quando o cache de alguma das tabelas de origem mudou.
+    """
+    if not config['denormalized_table']:
+        return [], {}
+    fingerprint = get_denormalized_fingerprint(config['parquet_cache_path'])
+    if incremental and manifest['tables'].get(DENORMALIZED_TABLE, {}).get('fingerprint') == fingerprint:
+        return [], {}
+    return [DENORMALIZED_TABLE], {DENORMALIZED_TABLE: {'fingerprint': fingerprint}}
+
+def open_target_database(config, db_name, recreate=True):
+    """
+    Prepara o banco de dados de destino no SQL Server (recriado do zero se 'recreate', ou só
+    criado se ainda não existir) e retorna um engine conectado a ele.
+    """
+    logging.info("Iniciando preparação do banco de dados...")
+    master_engine = get_db_engine(config, db_name='master')
+    if recreate:
+        prepare_database(master_engine, db_name)
+    else:
+        ensure_database(master_engine, db_name)
+    master_engine.dispose() # Descarta o engine do master
+    logging.info("Preparação do banco de dados finalizada.")
+
+    # Cria um novo engine conectado diretamente ao banco de dados de destino
+    logging.info(f"Criando nova conexão para o banco de dados '{db_name}'...")
+    return get_db_engine(config, db_name=db_name)
+
+def load_derived_tables(target_engine, config, db_name, derived_tables, suffix=''):
+    """Cria, carrega (a partir do cache) e indexa as tabelas derivadas no SQL Server."""
+    if not derived_tables:
+        return
+    setup_database_tables(target_engine, tables=derived_tables, suffix=suffix)
+    sink = create_sink(config['bulk_sink'], target_engine, config, db_name)
+    try:
+        load_denormalized_table(sink, config['parquet_cache_path'], target_suffix=suffix)
+    finally:
+        sink.close()
+    create_database_indexes(target_engine, tables=derived_tables, suffix=suffix,
+                            compression=config['index_compression'])
+
+def finish_etl(config, manifest, table_fingerprints, tables_to_load, derived_fingerprints, derived_tables,
+               journal, start_time):
+    """Registra as tabelas carregadas no manifesto, encerra o jornal de carga e o processo."""
+    update_manifest_tables(manifest, table_fingerprints, tables_to_load)
+    update_manifest_tables(manifest, derived_fingerprints, derived_tables)
+    save_manifest(config['output_path'], manifest)
+    journal.finish()
+
     total_time = round(time.time() - start_time)
     logging.info(f"--- PROCESSO 100% FINALIZADO EM {total_time} SEGUNDOS! ---")
+    if config['bulk_sink'] in EMBEDDED_SINKS:
+        logging.info(f"Dados carregados no banco embarcado '{config['bulk_sink']}'.")
+        return
     logging.info("Você já pode usar seus dados no SQL Server.")
     logging.info("Contribua com esse projeto em: https://github.com/aphonsoar/Receita_Federal_do_Brasil_-_Dados_Publicos_CNPJ")
 
@@ -0,0 +1,223 @@
+"""
+Busca aproximada de empresas por nome (razão social e nome fantasia) no índice de trigramas
+gerado pelo ETL ('build_name_index'), sem banco de dados e sem LIKE '%...%' sobre milhões de linhas.
+
+Os nomes são normalizados (sem acentos, minúsculos) e quebrados em trigramas; o índice guarda,
+para cada trigrama, a lista ordenada dos nomes que o contêm, mapeada em memória. A consulta
+pega os candidatos nas listas mais raras do termo, conta quantos trigramas do termo cada um
+tem (busca binária nas demais listas) e ordena pela fração encontrada. Erros de digitação e
+acentos custam só alguns trigramas: 'padaira sao jose' ainda encontra 'PADARIA SÃO JOSÉ'.
+
+Uso como biblioteca:
+    search = NameSearch('../NAME_INDEX')
+    search.search('padaria sao jose', limit=10)          # DataFrame
+
+Uso pela linha de comando:
+    python code/cnpj_search.py "padaria sao jose"
+    python code/cnpj_search.py "banco do brasil" --table empresa --limit 5 --min-score 0.8
+    python code/cnpj_search.py --build --cache ../PARQUET
+"""
+import argparse
+import logging
+import math
+import os
+import pathlib
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from cnpj_processor import (
+    NAME_INDEX_CNPJ_FILE, NAME_INDEX_FORMAT_VERSION, NAME_INDEX_GRAM_COUNTS_FILE, NAME_INDEX_NAME_OFFSETS_FILE,
+    NAME_INDEX_NAMES_FILE, NAME_INDEX_OFFSETS_FILE, NAME_INDEX_POSTINGS_FILE, NAME_INDEX_SOURCES, NAME_TRIGRAMS,
+    build_name_index, fold_names, load_name_index_meta, name_trigrams, sorted_unique,
+)
+
+DEFAULT_LIMIT = 20
+# Fração mínima dos trigramas do termo que um nome precisa conter para ser candidato
+DEFAULT_MIN_SCORE = 0.5
+RESULT_COLUMNS = ['cnpj_basico', 'score', 'similaridade', 'nome', 'tabela']
+
+class NameIndexTable:
+    """Subíndice de uma tabela de origem. Os arquivos são mapeados em memória, não carregados."""
+
+    def __init__(self, table_dir, meta):
+        self.meta = meta
+        self.table = meta['table']
+        docs, postings = meta['docs'], meta['postings']
+
+        def open_array(file_name, dtype, size):
+            if not size:
+                return np.empty(0, dtype=dtype)
+            return np.memmap(os.path.join(table_dir, file_name), dtype=dtype, mode='r', shape=(size,))
+
+        self.cnpj_basico = open_array(NAME_INDEX_CNPJ_FILE, '<u4', docs)
+        self.gram_counts = open_array(NAME_INDEX_GRAM_COUNTS_FILE, '<u2', docs)
+        self.name_offsets = open_array(NAME_INDEX_NAME_OFFSETS_FILE, '<u8', docs + 1)
+        self.names = open_array(NAME_INDEX_NAMES_FILE, np.uint8, int(self.name_offsets[-1]))
+        self.offsets = open_array(NAME_INDEX_OFFSETS_FILE, '<u8', NAME_TRIGRAMS + 1)
+        self.postings = open_array(NAME_INDEX_POSTINGS_FILE, '<u4', postings)
+
+    def __len__(self):
+        return len(self.cnpj_basico)
+
+    def name(self, doc):
+        start, end = int(self.name_offsets[doc]), int(self.name_offsets[doc + 1])
+        return self.names[start:end].tobytes().decode('utf-8')
+
+    def match(self, codes, min_score, limit=None):
+        """
+        Nomes que contêm ao menos 'min_score' dos trigramas 'codes' do termo. Quem atinge o
+        mínimo tem ao menos um dos (len(codes) - mínimo + 1) trigramas mais raros do termo;
+        os candidatos saem só dessas listas (as menores), sem percorrer as listas comuns
+        ('ltd', 'com'). Essas listas, e as seguintes enquanto forem curtas, são juntadas e
+        contadas de uma vez; as listas longas restantes são consultadas por busca binária, da
+        menor para a maior, e antes de cada uma saem os candidatos que não alcançam mais o
+        mínimo nem, com 'limit', os 'limit' melhores cnpj_basico já garantidos.
+        Retorna (documentos, trigramas em comum).
+        """
+        starts, ends = self.offsets[codes].astype(np.int64), self.offsets[codes + 1].astype(np.int64)
+        sizes = ends - starts
+        required = max(math.ceil(min_score * len(codes)), 1)
+        order = np.argsort(sizes, kind='stable')
+        merged = len(codes) - required + 1
+        while merged < len(codes) and sizes[order[merged]] <= sizes[order[:merged]].sum():
+            merged += 1
+        docs = np.sort(np.concatenate([self.postings[starts[i]:ends[i]] for i in order[:merged]]))
+        first = np.concatenate(([True], docs[1:] != docs[:-1])) if len(docs) else np.empty(0, dtype=bool)
+        candidates = docs[first]
+        shared = np.diff(np.append(np.flatnonzero(first), len(docs)))
+        for position in range(merged, len(codes)):
+            bound = max(required, self.guaranteed_score(candidates, shared, limit))
+            alive = shared + (len(codes) - position) >= bound
+            candidates, shared = candidates[alive], shared[alive]
+            if not len(candidates):
+                break
+            postings = self.postings[starts[order[position]]:ends[order[position]]]
+            found = np.minimum(np.searchsorted(postings, candidates), len(postings) - 1)
+            shared += postings[found] == candidates
+        keep = shared >= required
+        return candidates[keep], shared[keep]
+
+    def guaranteed_score(self, docs, shared, limit):
+        """
+        Contagem que ao menos 'limit' cnpj_basico distintos já atingiram (0 se não houver);
+        um documento que não chegue a ela não entra nos 'limit' primeiros resultados.
+        """
+        if not limit or len(shared) < limit:
+            return 0
+        kth = np.partition(shared, len(shared) - limit)[len(shared) - limit]
+        if len(sorted_unique(self.cnpj_basico[docs[shared >= kth]])) < limit:
+            return 0
+        return int(kth)
+
+class NameSearch:
+    """Leitor do índice de busca por nome (um subíndice por tabela de NAME_INDEX_SOURCES)."""
+
+    def __init__(self, index_path):
+        self.tables = {}
+        for table_name in NAME_INDEX_SOURCES:
+            table_dir = os.path.join(index_path, table_name)
+            meta = load_name_index_meta(table_dir)
+            if meta is None:
+                continue
+            if meta.get('version') != NAME_INDEX_FORMAT_VERSION:
+                raise ValueError(f"Índice em '{table_dir}' tem a versão {meta.get('version')}; "
+                                 f"esperada {NAME_INDEX_FORMAT_VERSION}. Gere o índice novamente.")
+            self.tables[table_name] = NameIndexTable(table_dir, meta)
+        if not self.tables:
+            raise FileNotFoundError(f"Índice de busca por nome não encontrado em '{index_path}'.")
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables.values())
+
+    @staticmethod
+    def query_trigrams(term):
+        """Trigramas distintos do termo, com a mesma normalização dos nomes indexados."""
+        folded = fold_names(pd.Series([term]))
+        if not folded.iloc[0]:
+            return np.empty(0, dtype=np.int64)
+        _, codes = name_trigrams(folded)
+        return codes
+
+    def search(self, term, limit=DEFAULT_LIMIT, min_score=DEFAULT_MIN_SCORE, tables=None):
+        """
+        Retorna as empresas (cnpj_basico) com nomes parecidos com 'term', as mais parecidas
+        primeiro, em um DataFrame com RESULT_COLUMNS:
+        - score: fração dos trigramas do termo presentes no nome (1.0 = o nome contém o termo);
+        - similaridade: trigramas em comum / trigramas distintos dos dois (1.0 = nome idêntico),
+          que desempata a favor dos nomes mais curtos;
+        - nome e tabela: o nome que casou melhor e a origem (razão social ou nome fantasia).
+        Cada cnpj_basico aparece uma vez, com o seu melhor nome.
+        """
+        codes = self.query_trigrams(term)
+        if not len(codes):
+            return pd.DataFrame(columns=RESULT_COLUMNS)
+        matches = []
+        for table_name, table in self.tables.items():
+            if tables is not None and table_name not in tables or not len(table):
+                continue
+            docs, shared = table.match(codes, min_score, limit)
+            matches.append(pd.DataFrame({
+                'cnpj_basico': table.cnpj_basico[docs],
+                'score': shared / len(codes),
+                'similaridade': shared / (len(codes) + table.gram_counts[docs].astype(np.int64) - shared),
+                'doc': docs,
+                'tabela': table_name,
+            }))
+        if not matches:
+            return pd.DataFrame(columns=RESULT_COLUMNS)
+        result = (pd.concat(matches, ignore_index=True)
+                  .sort_values(['score', 'similaridade', 'cnpj_basico'], ascending=[False, False, True], kind='stable')
+                  .drop_duplicates('cnpj_basico').head(limit).reset_index(drop=True))
+        # Os nomes só são lidos para os resultados retornados
+        result['nome'] = [self.tables[table_name].name(int(doc)) for table_name, doc in zip(result['tabela'], result['doc'])]
+        result['cnpj_basico'] = result['cnpj_basico'].map('{:08d}'.format)
+        return result[RESULT_COLUMNS]
+
+def main():
+    parser = argparse.ArgumentParser(description="Busca aproximada de empresas por razão social e nome fantasia.")
+    parser.add_argument('terms', nargs='*', help="Termos a buscar (um por argumento; use aspas para nomes com espaços).")
+    parser.add_argument('--index', default=None, help="Pasta do índice (padrão: NAME_INDEX_PATH do .env).")
+    parser.add_argument('--table', choices=list(NAME_INDEX_SOURCES), action='append',
+                        help="Busca só nos nomes desta tabela (pode ser repetido; padrão: todas).")
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help=f"Resultados por termo (padrão: {DEFAULT_LIMIT}).")
+    parser.add_argument('--min-score', type=float, default=DEFAULT_MIN_SCORE,
+                        help=f"Fração mínima dos trigramas do termo no nome, entre 0 e 1 (padrão: {DEFAULT_MIN_SCORE}).")
+    parser.add_argument('--build', action='store_true', help="Gera (ou atualiza) o índice a partir do cache Parquet.")
+    parser.add_argument('--cache', help="Pasta do cache Parquet usado no '--build' (padrão: PARQUET_CACHE_PATH do .env).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    # Os caminhos padrão vêm do mesmo .env do ETL, se ele existir
+    load_dotenv(dotenv_path=os.path.join(pathlib.Path(__file__).parent.resolve(), '.env'))
+    index_path = args.index or os.getenv('NAME_INDEX_PATH')
+    if not index_path:
+        logging.error("Informe a pasta do índice com '--index' ou defina NAME_INDEX_PATH no .env.")
+        sys.exit(1)
+    if not 0 < args.min_score <= 1:
+        logging.error("'--min-score' deve estar entre 0 (exclusive) e 1.")
+        sys.exit(1)
+
+    if args.build:
+        cache_path = args.cache or os.getenv('PARQUET_CACHE_PATH')
+        if not cache_path:
+            logging.error("Informe o cache Parquet com '--cache' ou defina PARQUET_CACHE_PATH no .env.")
+            sys.exit(1)
+        build_name_index(cache_path, index_path, tables=args.table)
+        if not args.terms:
+            return
+
+    search = NameSearch(index_path)
+    for term in args.terms:
+        search_start = time.perf_counter()
+        result = search.search(term, limit=args.limit, min_score=args.min_score, tables=args.table)
+        elapsed_ms = (time.perf_counter() - search_start) * 1000
+        logging.info(f"'{term}': {len(result)} resultados em {elapsed_ms:.1f} ms.")
+        result.insert(0, 'consulta', term)
+        result.to_json(sys.stdout, orient='records', lines=True, force_ascii=False)
+
+if __name__ == '__main__':
+    main()
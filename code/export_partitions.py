@@ -0,0 +1,254 @@
+"""
+Exportação particionada dos estabelecimentos em uma única passada sobre os dados.
+
+Generaliza a 'view_empresas_indaiatuba': em vez de uma consulta por município, lê o cache
+Parquet uma vez (junção em fluxo de 'iter_denormalized_partitions') e grava um arquivo por
+UF/município, por CNAE ou por qualquer combinação de colunas, em CSV ou Parquet. As colunas,
+os filtros e as partições vêm do .env (EXPORT_*) e podem ser sobrescritos na linha de comando.
+
+Uso:
+    python code/export_partitions.py
+    python code/export_partitions.py --partition-by uf,municipio --filters "uf=SP;situacao_cadastral=2"
+    python code/export_partitions.py --partition-by cnae_fiscal_principal --format parquet --output ../EXPORT_CNAE
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from cnpj_processor import (
+    DENORMALIZED_CODE_COLUMNS, DERIVED_TABLE_SCHEMAS, DENORMALIZED_TABLE, get_arrow_schema, import_pyarrow,
+    iter_denormalized_partitions, partners_to_json,
+)
+
+EXPORT_FORMATS = ('csv', 'parquet')
+# Padrões equivalentes à 'view_empresas_indaiatuba', particionada por UF e município
+DEFAULT_EXPORT_COLUMNS = [
+    'cnpj', 'cnpj_basico', 'razao_social', 'nome_fantasia', 'logradouro', 'numero', 'complemento', 'bairro',
+    'municipio', 'uf', 'cep', 'ddd_1', 'telefone_1', 'ddd_2', 'telefone_2', 'correio_eletronico',
+]
+DEFAULT_PARTITION_BY = ['uf', 'municipio']
+# Máximo de arquivos abertos ao mesmo tempo; acima disso, uma partição pode gerar mais de um arquivo
+MAX_OPEN_FILES = 900
+# Arquivo que marca uma pasta como gerada por esta exportação (e que por isso pode ser substituída)
+EXPORT_MARKER_FILE = '_export.json'
+
+def get_export_columns_types():
+    """Colunas disponíveis para exportação: as da tabela desnormalizada e os códigos mantidos na junção."""
+    return {col: (col_type, size) for col, col_type, size in DERIVED_TABLE_SCHEMAS[DENORMALIZED_TABLE] + DENORMALIZED_CODE_COLUMNS}
+
+def parse_list(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+def parse_filters(value):
+    """
+    Converte 'coluna=valor1,valor2;coluna2=valor' em {coluna: [valores]}, ainda como texto
+    (ex.: 'situacao_cadastral=2', 'municipio=INDAIATUBA'); 'prepare_filters' os converte para o
+    tipo de cada coluna.
+    """
+    filters = {}
+    for item in (value or '').split(';'):
+        if not item.strip():
+            continue
+        if '=' not in item:
+            raise ValueError(f"Filtro inválido: '{item}'. Use 'coluna=valor1,valor2'.")
+        column, values = item.split('=', 1)
+        filters[column.strip()] = parse_list(values)
+    return filters
+
+def prepare_filters(filters, available):
+    """
+    Converte os valores de cada filtro para o tipo da coluna ('get_export_columns_types'), para
+    que a comparação não dependa da representação em texto: códigos numéricos valem com ou sem
+    zeros à esquerda ('situacao_cadastral=02' ou '=2'), datas são informadas como na Receita
+    Federal (AAAAMMDD) ou em ISO (AAAA-MM-DD) e valores decimais com vírgula ou ponto. Linhas
+    com a coluna nula nunca atendem a um filtro. Filtros sobre os sócios não são suportados.
+    Um valor que não cabe no tipo da coluna gera ValueError.
+    """
+    prepared = {}
+    for column, values in filters.items():
+        col_type = available[column][0]
+        if col_type == 'json':
+            raise ValueError(f"A coluna '{column}' não pode ser usada em filtros.")
+        try:
+            if col_type == 'tinyint':
+                prepared[column] = [int(value) for value in values]
+            elif col_type == 'decimal':
+                prepared[column] = [float(value.replace(',', '.')) for value in values]
+            elif col_type == 'date':
+                prepared[column] = list(pd.to_datetime([value.replace('-', '') for value in values], format='%Y%m%d'))
+            else:
+                prepared[column] = list(values)
+        except ValueError:
+            raise ValueError(f"Valor inválido no filtro de '{column}' ({col_type}): {', '.join(values)}.") from None
+    return prepared
+
+def apply_filters(df, filters):
+    """Mantém as linhas cujas colunas filtradas têm um dos valores informados ('prepare_filters')."""
+    for column, values in filters.items():
+        df = df[df[column].isin(values).to_numpy(dtype=bool, na_value=False)]
+    return df
+
+def safe_path_segment(value):
+    """Valor de partição utilizável como nome de diretório (sem separadores de caminho)."""
+    if value is None or value != value or str(value).strip() == '':
+        return '_'
+    return str(value).strip().replace('/', '-').replace('\\', '-')
+
+def check_export_path(export_path):
+    """
+    Recusa um destino que a exportação não pode substituir: um arquivo ou uma pasta não vazia
+    sem EXPORT_MARKER_FILE (não gerada por esta exportação, que a apagaria ao publicar a nova).
+    """
+    if os.path.exists(export_path) and not os.path.isdir(export_path):
+        raise ValueError(f"O destino '{export_path}' é um arquivo, não uma pasta.")
+    if os.path.isdir(export_path) and os.listdir(export_path) \
+            and not os.path.isfile(os.path.join(export_path, EXPORT_MARKER_FILE)):
+        raise ValueError(f"A pasta '{export_path}' não está vazia e não foi gerada por esta exportação "
+                         f"(sem '{EXPORT_MARKER_FILE}'). Escolha outra pasta ou esvazie-a.")
+
+def publish_export(temp_dir, export_path):
+    """
+    Substitui 'export_path' pela exportação montada em 'temp_dir'. A anterior é movida para um
+    diretório próprio e só é apagada depois da troca; se a troca falhar, ela volta ao lugar.
+    """
+    check_export_path(export_path)
+    old_dir = tempfile.mkdtemp(prefix=f'.{os.path.basename(export_path)}.', suffix='.old',
+                               dir=os.path.dirname(export_path))
+    previous = os.path.join(old_dir, 'previous')
+    try:
+        if os.path.isdir(export_path):
+            os.replace(export_path, previous)
+        try:
+            os.replace(temp_dir, export_path)
+        except OSError:
+            if os.path.isdir(previous):
+                os.replace(previous, export_path)
+            raise
+    finally:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+def export_partitions(cache_path, export_path, columns=None, partition_by=None, filters=None, file_format='csv'):
+    """
+    Exporta os estabelecimentos em arquivos particionados por 'partition_by', em uma única
+    passada pelo cache. Cada partição vira um diretório ('SP/INDAIATUBA/part-0.csv'); as
+    colunas de partição continuam dentro dos arquivos. A exportação é montada em um diretório
+    temporário próprio, ao lado do destino, e substitui a anterior em 'export_path' só ao final;
+    só uma pasta vazia ou de uma exportação anterior (com EXPORT_MARKER_FILE) é substituída.
+    Retorna {'rows': linhas exportadas, 'partitions': quantidade de partições}.
+    """
+    pa, _ = import_pyarrow()
+    import pyarrow.dataset as ds
+
+    columns = columns or DEFAULT_EXPORT_COLUMNS
+    partition_by = partition_by or []
+    filters = filters or {}
+    available = get_export_columns_types()
+    unknown = [col for col in set(columns) | set(partition_by) | set(filters) if col not in available]
+    if unknown:
+        raise ValueError(f"Colunas desconhecidas: {', '.join(sorted(unknown))}. Opções: {', '.join(available)}.")
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Formato inválido: '{file_format}'. Opções: {', '.join(EXPORT_FORMATS)}.")
+    typed_filters = prepare_filters(filters, available)
+    export_path = os.path.abspath(export_path)
+    check_export_path(export_path)
+
+    # O 'write_dataset' remove dos arquivos as colunas usadas nos diretórios; por isso a
+    # partição usa cópias, e as colunas originais continuam dentro dos arquivos
+    partition_fields = [f'__particao_{i}' for i in range(len(partition_by))]
+    arrow_schema = get_arrow_schema({'types': {col: available[col] for col in columns}})
+    for field in partition_fields:
+        arrow_schema = arrow_schema.append(pa.field(field, pa.string()))
+    with_partners = 'socios' in columns
+    stats = {'rows': 0, 'partitions': set()}
+
+    def batches():
+        for key, df in iter_denormalized_partitions(cache_path, partners=with_partners):
+            df = apply_filters(df, typed_filters)
+            if df.empty:
+                continue
+            out = df[columns].copy()
+            if with_partners:
+                out['socios'] = partners_to_json(out['socios'])
+            for field, col in zip(partition_fields, partition_by):
+                out[field] = df[col].map(safe_path_segment)
+            stats['rows'] += len(out)
+            stats['partitions'].update(map(tuple, out[partition_fields].drop_duplicates().values.tolist()))
+            logging.info(f"  Partição do cache {key}: {len(out)} linhas exportadas.")
+            yield from pa.Table.from_pandas(out, schema=arrow_schema, preserve_index=False).to_batches()
+
+    if file_format == 'csv':
+        file_options = ds.CsvFileFormat().make_write_options(delimiter=';')
+    else:
+        file_options = ds.ParquetFileFormat().make_write_options(compression='zstd')
+
+    logging.info(f"--- EXPORTANDO ({file_format.upper()}) POR {', '.join(partition_by) or 'ARQUIVO ÚNICO'} ---")
+    export_start = time.time()
+    parent_dir, export_name = os.path.split(export_path)
+    os.makedirs(parent_dir, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix=f'.{export_name}.', suffix='.tmp', dir=parent_dir)
+    try:
+        ds.write_dataset(
+            batches(), temp_dir, schema=arrow_schema, format=file_format, file_options=file_options,
+            partitioning=ds.partitioning(pa.schema([pa.field(f, pa.string()) for f in partition_fields])) if partition_fields else None,
+            basename_template=f'part-{{i}}.{file_format}', max_open_files=MAX_OPEN_FILES,
+            existing_data_behavior='overwrite_or_ignore',
+        )
+        with open(os.path.join(temp_dir, EXPORT_MARKER_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                'format': file_format, 'columns': columns, 'partition_by': partition_by, 'filters': filters,
+                'rows': stats['rows'], 'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            }, f, indent=2, ensure_ascii=False)
+        publish_export(temp_dir, export_path)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    tempo_export = round(time.time() - export_start)
+    logging.info(f"Exportação finalizada! {stats['rows']} linhas em {len(stats['partitions']) or 1} partições "
+                 f"em {tempo_export}s: {export_path}")
+    return {'rows': stats['rows'], 'partitions': len(stats['partitions']) or 1}
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta os estabelecimentos em arquivos particionados, em uma única passada.")
+    parser.add_argument('--cache', help="Cache Parquet de origem (padrão: PARQUET_CACHE_PATH do .env).")
+    parser.add_argument('--output', help="Pasta de destino (padrão: EXPORT_PATH do .env).")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, help="Formato dos arquivos (padrão: EXPORT_FORMAT ou csv).")
+    parser.add_argument('--columns', help="Colunas exportadas, separadas por vírgula (padrão: EXPORT_COLUMNS).")
+    parser.add_argument('--partition-by', help="Colunas de partição, separadas por vírgula (padrão: EXPORT_PARTITION_BY).")
+    parser.add_argument('--filters', help="Filtros 'coluna=valor1,valor2;coluna2=valor' (padrão: EXPORT_FILTERS).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+    # As configurações padrão vêm do mesmo .env do ETL, se ele existir
+    load_dotenv(dotenv_path=os.path.join(pathlib.Path(__file__).parent.resolve(), '.env'))
+
+    cache_path = args.cache or os.getenv('PARQUET_CACHE_PATH')
+    export_path = args.output or os.getenv('EXPORT_PATH')
+    if not cache_path or not export_path:
+        logging.error("Informe o cache ('--cache' ou PARQUET_CACHE_PATH) e o destino ('--output' ou EXPORT_PATH).")
+        sys.exit(1)
+
+    partition_by = args.partition_by if args.partition_by is not None else os.getenv('EXPORT_PARTITION_BY')
+    try:
+        export_partitions(
+            cache_path, export_path,
+            columns=parse_list(args.columns or os.getenv('EXPORT_COLUMNS')) or None,
+            partition_by=parse_list(partition_by) if partition_by is not None else DEFAULT_PARTITION_BY,
+            filters=parse_filters(args.filters if args.filters is not None else os.getenv('EXPORT_FILTERS')),
+            file_format=(args.format or os.getenv('EXPORT_FORMAT') or 'csv').strip().lower(),
+        )
+    except ValueError as e:
+        logging.error(str(e))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
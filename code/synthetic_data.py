@@ -0,0 +1,224 @@
+"""
+Gerador de dados sintéticos no layout dos arquivos públicos de CNPJ da Receita Federal.
+
+Gera ZIPs com os mesmos nomes de arquivo, a mesma ordem de colunas ('get_table_schemas') e as
+mesmas peculiaridades dos arquivos reais: texto em latin-1 com acentos, aspas escapadas com
+barra invertida, campos vazios e linhas malformadas. Permite medir o ETL sem baixar o conjunto
+real de vários GB.
+
+Uso:
+    python code/synthetic_data.py --output ../SYNTHETIC --companies 100000
+"""
+import argparse
+import logging
+import os
+import sys
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from cnpj_processor import get_table_schemas
+
+# Nome do ZIP e do CSV interno de cada tabela, no padrão dos arquivos da Receita Federal.
+# '{i}' é o número do arquivo nas tabelas divididas em várias partes.
+TABLE_FILES = {
+    'empresa': ('Empresas{i}.zip', 'K3241.K03200Y{i}.D40113.EMPRECSV'),
+    'estabelecimento': ('Estabelecimentos{i}.zip', 'K3241.K03200Y{i}.D40113.ESTABELE'),
+    'socios': ('Socios{i}.zip', 'K3241.K03200Y{i}.D40113.SOCIOCSV'),
+    'simples': ('Simples.zip', 'F.K03200$W.SIMPLES.CSV.D40113'),
+    'cnae': ('Cnaes.zip', 'F.K03200$Z.D40113.CNAECSV'),
+    'moti': ('Motivos.zip', 'F.K03200$Z.D40113.MOTICSV'),
+    'munic': ('Municipios.zip', 'F.K03200$Z.D40113.MUNICCSV'),
+    'natju': ('Naturezas.zip', 'F.K03200$Z.D40113.NATJUCSV'),
+    'pais': ('Paises.zip', 'F.K03200$Z.D40113.PAISCSV'),
+    'quals': ('Qualificacoes.zip', 'F.K03200$Z.D40113.QUALSCSV'),
+}
+SPLIT_TABLES = ('empresa', 'estabelecimento', 'socios')
+
+# Palavras com acentos (latin-1) e aspas, para exercitar a decodificação e o escape
+WORDS = np.array([
+    'COMERCIO', 'SERVICOS', 'INDÚSTRIA', 'AÇÚCAR', 'JOÃO', 'JOSÉ', 'CONSTRUÇÕES', 'ALIMENTAÇÃO',
+    'TRANSPORTES', 'PADARIA', 'SÃO', 'PAULO', 'INFORMÁTICA', 'CAFÉ', 'ÓTICA', 'MÉDICOS',
+    'ASSOCIAÇÃO', 'EMPREENDIMENTOS', 'PARTICIPAÇÕES', 'LTDA', 'ME', 'EIRELI', 'S/A',
+])
+UFS = np.array(['SP', 'RJ', 'MG', 'RS', 'PR', 'SC', 'BA', 'GO', 'PE', 'CE', 'DF', 'ES', 'AM', 'PA', 'EX'])
+STREET_TYPES = np.array(['RUA', 'AVENIDA', 'TRAVESSA', 'ALAMEDA', 'RODOVIA', 'ESTRADA', 'PRAÇA'])
+
+LOOKUP_SIZES = {'cnae': 1300, 'moti': 60, 'munic': 5570, 'natju': 90, 'pais': 250, 'quals': 80}
+LOOKUP_CODE_WIDTHS = {'cnae': 7, 'moti': 2, 'munic': 4, 'natju': 4, 'pais': 3, 'quals': 2}
+
+def random_names(rng, size, min_words=1, max_words=4):
+    """Gera nomes com 1 a 'max_words' palavras; cerca de 1% contém aspas escapadas."""
+    word_counts = rng.integers(min_words, max_words + 1, size)
+    names = pd.Series(WORDS[rng.integers(0, len(WORDS), size)])
+    for extra in range(1, max_words):
+        more = pd.Series(WORDS[rng.integers(0, len(WORDS), size)])
+        names = names.where(word_counts <= extra, names + ' ' + more)
+    quoted = rng.random(size) < 0.01
+    names[quoted] = names[quoted] + ' \\"' + pd.Series(WORDS[rng.integers(0, len(WORDS), size)])[quoted] + '\\"'
+    return names
+
+def random_codes(rng, size, count, width):
+    """Códigos numéricos de 1 a 'count', com zeros à esquerda até 'width' dígitos."""
+    return pd.Series(rng.integers(1, count + 1, size)).astype(str).str.zfill(width)
+
+def random_dates(rng, size, empty_rate=0.1):
+    """Datas AAAAMMDD entre 1970 e 2024; uma fração vem zerada ('0'), como nos arquivos reais."""
+    days = rng.integers(0, 365 * 54, size)
+    dates = pd.Series(pd.Timestamp('1970-01-01') + pd.to_timedelta(days, unit='D')).dt.strftime('%Y%m%d')
+    dates[rng.random(size) < empty_rate] = '0'
+    return dates
+
+def blank(rng, series, rate):
+    """Esvazia uma fração 'rate' dos valores (campos vazios)."""
+    series = series.copy()
+    series[rng.random(len(series)) < rate] = ''
+    return series
+
+def generate_table(table_name, rng, companies, cnpjs):
+    """Gera o DataFrame (todas as colunas como texto) de uma tabela sintética."""
+    if table_name in LOOKUP_SIZES:
+        size = LOOKUP_SIZES[table_name]
+        return pd.DataFrame({
+            'codigo': pd.Series(np.arange(1, size + 1)).astype(str).str.zfill(LOOKUP_CODE_WIDTHS[table_name]),
+            'descricao': random_names(rng, size, 2, 5),
+        })
+
+    if table_name == 'empresa':
+        size = companies
+        return pd.DataFrame({
+            'cnpj_basico': cnpjs,
+            'razao_social': random_names(rng, size, 2, 5),
+            'natureza_juridica': random_codes(rng, size, LOOKUP_SIZES['natju'], 4),
+            'qualificacao_responsavel': random_codes(rng, size, LOOKUP_SIZES['quals'], 2),
+            'capital_social': pd.Series(rng.integers(0, 10_000_000, size)).astype(str) + ','
+                              + pd.Series(rng.integers(0, 100, size)).astype(str).str.zfill(2),
+            'porte_empresa': pd.Series(rng.choice(['00', '01', '03', '05'], size)),
+            'ente_federativo_responsavel': blank(rng, pd.Series(rng.choice(UFS, size)), 0.98),
+        })
+
+    if table_name == 'estabelecimento':
+        # Cada empresa tem a matriz e, às vezes, filiais
+        branches = 1 + rng.poisson(0.5, companies)
+        owners = np.repeat(np.arange(companies), branches)
+        size = len(owners)
+        order = pd.Series(np.concatenate([np.arange(1, n + 1) for n in branches])).astype(str).str.zfill(4)
+        return pd.DataFrame({
+            'cnpj_basico': cnpjs[owners].reset_index(drop=True),
+            'cnpj_ordem': order,
+            'cnpj_dv': pd.Series(rng.integers(0, 100, size)).astype(str).str.zfill(2),
+            'identificador_matriz_filial': pd.Series(np.where(order == '0001', '1', '2')),
+            'nome_fantasia': blank(rng, random_names(rng, size, 1, 3), 0.4),
+            'situacao_cadastral': pd.Series(rng.choice(['01', '02', '03', '04', '08'], size)),
+            'data_situacao_cadastral': random_dates(rng, size),
+            'motivo_situacao_cadastral': random_codes(rng, size, LOOKUP_SIZES['moti'], 2),
+            'nome_cidade_exterior': blank(rng, random_names(rng, size, 1, 2), 0.99),
+            'pais': blank(rng, random_codes(rng, size, LOOKUP_SIZES['pais'], 3), 0.95),
+            'data_inicio_atividade': random_dates(rng, size, 0.0),
+            'cnae_fiscal_principal': random_codes(rng, size, LOOKUP_SIZES['cnae'], 7),
+            'cnae_fiscal_secundaria': blank(rng, random_codes(rng, size, LOOKUP_SIZES['cnae'], 7) + ','
+                                            + random_codes(rng, size, LOOKUP_SIZES['cnae'], 7), 0.5),
+            'tipo_logradouro': pd.Series(rng.choice(STREET_TYPES, size)),
+            'logradouro': random_names(rng, size, 1, 3),
+            'numero': blank(rng, pd.Series(rng.integers(1, 5000, size)).astype(str), 0.1),
+            'complemento': blank(rng, 'SALA ' + pd.Series(rng.integers(1, 999, size)).astype(str), 0.7),
+            'bairro': random_names(rng, size, 1, 2),
+            'cep': pd.Series(rng.integers(1_000_000, 99_999_999, size)).astype(str).str.zfill(8),
+            'uf': pd.Series(rng.choice(UFS, size)),
+            'municipio': random_codes(rng, size, LOOKUP_SIZES['munic'], 4),
+            'ddd_1': pd.Series(rng.integers(11, 99, size)).astype(str),
+            'telefone_1': pd.Series(rng.integers(20_000_000, 99_999_999, size)).astype(str),
+            'ddd_2': blank(rng, pd.Series(rng.integers(11, 99, size)).astype(str), 0.8),
+            'telefone_2': blank(rng, pd.Series(rng.integers(20_000_000, 99_999_999, size)).astype(str), 0.8),
+            'ddd_fax': blank(rng, pd.Series(rng.integers(11, 99, size)).astype(str), 0.95),
+            'fax': blank(rng, pd.Series(rng.integers(20_000_000, 99_999_999, size)).astype(str), 0.95),
+            'correio_eletronico': blank(rng, 'contato' + pd.Series(np.arange(size)).astype(str) + '@exemplo.com.br', 0.5),
+            'situacao_especial': blank(rng, pd.Series(rng.choice(WORDS, size)), 0.99),
+            'data_situacao_especial': blank(rng, random_dates(rng, size, 0.0), 0.99),
+        })
+
+    if table_name == 'socios':
+        partners = rng.poisson(1.2, companies)
+        owners = np.repeat(np.arange(companies), partners)
+        size = len(owners)
+        return pd.DataFrame({
+            'cnpj_basico': cnpjs[owners].reset_index(drop=True),
+            'identificador_socio': pd.Series(rng.choice(['1', '2', '3'], size, p=[0.1, 0.85, 0.05])),
+            'nome_socio_razao_social': random_names(rng, size, 2, 4),
+            'cpf_cnpj_socio': '***' + pd.Series(rng.integers(0, 999_999, size)).astype(str).str.zfill(6) + '**',
+            'qualificacao_socio': random_codes(rng, size, LOOKUP_SIZES['quals'], 2),
+            'data_entrada_sociedade': random_dates(rng, size, 0.0),
+            'pais': blank(rng, random_codes(rng, size, LOOKUP_SIZES['pais'], 3), 0.97),
+            'representante_legal': pd.Series(['***000000**'] * size),
+            'nome_do_representante': blank(rng, random_names(rng, size, 2, 3), 0.95),
+            'qualificacao_representante_legal': pd.Series(['00'] * size),
+            'faixa_etaria': pd.Series(rng.integers(0, 10, size)).astype(str),
+        })
+
+    if table_name == 'simples':
+        size = companies // 2
+        owners = np.sort(rng.choice(companies, size, replace=False))
+        return pd.DataFrame({
+            'cnpj_basico': cnpjs[owners].reset_index(drop=True),
+            'opcao_pelo_simples': pd.Series(rng.choice(['S', 'N'], size)),
+            'data_opcao_simples': random_dates(rng, size, 0.3),
+            'data_exclusao_simples': random_dates(rng, size, 0.7),
+            'opcao_mei': pd.Series(rng.choice(['S', 'N'], size)),
+            'data_opcao_mei': random_dates(rng, size, 0.6),
+            'data_exclusao_mei': random_dates(rng, size, 0.8),
+        })
+
+    raise ValueError(f"Tabela desconhecida: '{table_name}'.")
+
+def to_rfb_lines(df, rng, bad_line_rate=0.0):
+    """
+    Formata um DataFrame como as linhas dos CSVs da Receita: campos entre aspas, separados por
+    ';'. Uma fração 'bad_line_rate' das linhas recebe campos a mais (linha malformada).
+    Retorna (texto, quantidade de linhas válidas).
+    """
+    quoted = ['"' + df[col].fillna('') + '"' for col in df.columns]
+    lines = quoted[0].str.cat(quoted[1:], sep=';')
+    bad = rng.random(len(lines)) < bad_line_rate
+    lines[bad] = lines[bad] + ';"CAMPO";"EXTRA"'
+    return '\n'.join(lines) + '\n', int((~bad).sum())
+
+def generate_synthetic_dataset(output_path, companies=10_000, files_per_table=2, bad_line_rate=0.001, seed=42):
+    """
+    Gera os ZIPs sintéticos de todas as tabelas em 'output_path'. 'companies' define a escala
+    (estabelecimentos, sócios e Simples são derivados dela). Retorna {tabela: linhas válidas}.
+    """
+    os.makedirs(output_path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    schemas = get_table_schemas()
+    cnpjs = pd.Series(np.sort(rng.choice(100_000_000, companies, replace=False))).astype(str).str.zfill(8)
+
+    expected_rows = {}
+    for table_name, (zip_pattern, member_pattern) in TABLE_FILES.items():
+        df = generate_table(table_name, rng, companies, cnpjs)[schemas[table_name]['cols']]
+        parts = files_per_table if table_name in SPLIT_TABLES else 1
+        expected_rows[table_name] = 0
+        for i, part in enumerate(np.array_split(np.arange(len(df)), parts)):
+            content, valid_rows = to_rfb_lines(df.iloc[part].reset_index(drop=True), rng, bad_line_rate)
+            zip_name, member_name = zip_pattern.format(i=i), member_pattern.format(i=i)
+            with zipfile.ZipFile(os.path.join(output_path, zip_name), 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+                zip_ref.writestr(member_name, content.encode('latin-1'))
+            expected_rows[table_name] += valid_rows
+        logging.info(f"  - {table_name}: {expected_rows[table_name]} linhas válidas em {parts} arquivo(s).")
+    return expected_rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera arquivos sintéticos no layout dos dados públicos de CNPJ.")
+    parser.add_argument('--output', required=True, help="Pasta onde os ZIPs serão gravados.")
+    parser.add_argument('--companies', type=int, default=10_000, help="Quantidade de empresas (escala).")
+    parser.add_argument('--files-per-table', type=int, default=2, help="Arquivos de Empresas/Estabelecimentos/Sócios.")
+    parser.add_argument('--bad-line-rate', type=float, default=0.001, help="Fração de linhas malformadas.")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+    logging.info(f"Gerando dados sintéticos para {args.companies} empresas em '{args.output}'...")
+    generate_synthetic_dataset(args.output, args.companies, args.files_per_table, args.bad_line_rate, args.seed)
+
+if __name__ == '__main__':
+    main()
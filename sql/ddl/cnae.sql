@@ -1 +1,4 @@
-CREATE TABLE cnae (codigo VARCHAR(7), descricao VARCHAR(MAX));
+CREATE TABLE cnae (
+    codigo VARCHAR(7),
+    descricao VARCHAR(250)
+);
@@ -0,0 +1,37 @@
+CREATE TABLE cnpj_completo (
+    cnpj VARCHAR(14),
+    cnpj_basico VARCHAR(8),
+    razao_social VARCHAR(200),
+    capital_social DECIMAL(18,2),
+    porte_empresa TINYINT,
+    ente_federativo_responsavel VARCHAR(100),
+    natureza_juridica VARCHAR(250),
+    cnpj_ordem VARCHAR(4),
+    cnpj_dv VARCHAR(2),
+    matriz_filial VARCHAR(6),
+    nome_fantasia VARCHAR(200),
+    situacao_cadastral TINYINT,
+    data_situacao_cadastral DATE,
+    data_inicio_atividade DATE,
+    correio_eletronico VARCHAR(200),
+    tipo_logradouro VARCHAR(20),
+    logradouro VARCHAR(200),
+    numero VARCHAR(20),
+    complemento VARCHAR(200),
+    bairro VARCHAR(100),
+    cep VARCHAR(8),
+    municipio VARCHAR(250),
+    uf VARCHAR(2),
+    ddd_1 VARCHAR(4),
+    telefone_1 VARCHAR(9),
+    ddd_2 VARCHAR(4),
+    telefone_2 VARCHAR(9),
+    cnae_principal VARCHAR(250),
+    opcao_pelo_simples VARCHAR(1),
+    data_opcao_simples DATE,
+    data_exclusao_simples DATE,
+    opcao_mei VARCHAR(1),
+    data_opcao_mei DATE,
+    data_exclusao_mei DATE,
+    socios VARCHAR(MAX)
+);
@@ -1,5 +1,9 @@
 CREATE TABLE empresa (
-    cnpj_basico VARCHAR(8), razao_social VARCHAR(MAX), natureza_juridica VARCHAR(4),
-    qualificacao_responsavel VARCHAR(2), capital_social VARCHAR(50), porte_empresa VARCHAR(2),
-    ente_federativo_responsavel VARCHAR(MAX)
+    cnpj_basico VARCHAR(8),
+    razao_social VARCHAR(200),
+    natureza_juridica VARCHAR(4),
+    qualificacao_responsavel TINYINT,
+    capital_social DECIMAL(18,2),
+    porte_empresa TINYINT,
+    ente_federativo_responsavel VARCHAR(100)
 );
@@ -0,0 +1,6 @@
+CREATE TABLE estabelecimento_cnae_secundaria (
+    cnpj_basico VARCHAR(8),
+    cnpj_ordem VARCHAR(4),
+    cnpj_dv VARCHAR(2),
+    cnae VARCHAR(7)
+);
@@ -1 +1,4 @@
-CREATE TABLE moti (codigo VARCHAR(2), descricao VARCHAR(MAX));
+CREATE TABLE moti (
+    codigo TINYINT,
+    descricao VARCHAR(250)
+);
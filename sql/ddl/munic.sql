@@ -1 +1,4 @@
-CREATE TABLE munic (codigo VARCHAR(4), descricao VARCHAR(MAX));
+CREATE TABLE munic (
+    codigo VARCHAR(4),
+    descricao VARCHAR(250)
+);
@@ -1 +1,4 @@
-CREATE TABLE natju (codigo VARCHAR(4), descricao VARCHAR(MAX));
+CREATE TABLE natju (
+    codigo VARCHAR(4),
+    descricao VARCHAR(250)
+);
@@ -1 +1,4 @@
-CREATE TABLE pais (codigo VARCHAR(3), descricao VARCHAR(MAX));
+CREATE TABLE pais (
+    codigo VARCHAR(3),
+    descricao VARCHAR(250)
+);
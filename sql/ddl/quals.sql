@@ -1 +1,4 @@
-CREATE TABLE quals (codigo VARCHAR(2), descricao VARCHAR(MAX));
+CREATE TABLE quals (
+    codigo TINYINT,
+    descricao VARCHAR(250)
+);
@@ -1,5 +1,9 @@
 CREATE TABLE simples (
-    cnpj_basico VARCHAR(8), opcao_pelo_simples VARCHAR(1), data_opcao_simples VARCHAR(10),
-    data_exclusao_simples VARCHAR(10), opcao_mei VARCHAR(1), data_opcao_mei VARCHAR(10),
-    data_exclusao_mei VARCHAR(10)
+    cnpj_basico VARCHAR(8),
+    opcao_pelo_simples VARCHAR(1),
+    data_opcao_simples DATE,
+    data_exclusao_simples DATE,
+    opcao_mei VARCHAR(1),
+    data_opcao_mei DATE,
+    data_exclusao_mei DATE
 );
@@ -1,6 +1,13 @@
 CREATE TABLE socios (
-    cnpj_basico VARCHAR(8), identificador_socio VARCHAR(1), nome_socio_razao_social VARCHAR(MAX),
-    cpf_cnpj_socio VARCHAR(14), qualificacao_socio VARCHAR(2), data_entrada_sociedade VARCHAR(10),
-    pais VARCHAR(3), representante_legal VARCHAR(14), nome_do_representante VARCHAR(MAX),
-    qualificacao_representante_legal VARCHAR(2), faixa_etaria VARCHAR(1)
+    cnpj_basico VARCHAR(8),
+    identificador_socio TINYINT,
+    nome_socio_razao_social VARCHAR(200),
+    cpf_cnpj_socio VARCHAR(14),
+    qualificacao_socio TINYINT,
+    data_entrada_sociedade DATE,
+    pais VARCHAR(3),
+    representante_legal VARCHAR(14),
+    nome_do_representante VARCHAR(200),
+    qualificacao_representante_legal TINYINT,
+    faixa_etaria TINYINT
 );
@@ -0,0 +1,42 @@
+-- Estabelecimentos por atividade: uma linha por estabelecimento x CNAE (principal ou secundário).
+-- Os CNAEs secundários vêm da tabela-ponte estabelecimento_cnae_secundaria, montada na carga a
+-- partir da lista em estabelecimento.cnae_fiscal_secundaria. Um filtro por CNAE vira um seek nos
+-- índices ix_estabelecimento_cnae e cix_estabelecimento_cnae_secundaria, em vez de um
+-- LIKE '%4781400%' sobre todos os estabelecimentos:
+--     SELECT * FROM view_cnae_estabelecimento WHERE cnae = '4781400' AND situacao_cadastral = 2;
+CREATE OR ALTER VIEW view_cnae_estabelecimento AS
+SELECT
+    est.cnpj_basico,
+    est.cnpj_ordem,
+    est.cnpj_dv,
+    est.cnae_fiscal_principal AS cnae,
+    'PRINCIPAL' AS tipo_cnae,
+    cnae.descricao AS cnae_descricao,
+    est.situacao_cadastral,
+    est.municipio,
+    est.uf
+FROM
+    estabelecimento est
+LEFT JOIN
+    cnae ON est.cnae_fiscal_principal = cnae.codigo
+
+UNION ALL
+
+SELECT
+    sec.cnpj_basico,
+    sec.cnpj_ordem,
+    sec.cnpj_dv,
+    sec.cnae,
+    'SECUNDARIO' AS tipo_cnae,
+    cnae.descricao AS cnae_descricao,
+    est.situacao_cadastral,
+    est.municipio,
+    est.uf
+FROM
+    estabelecimento_cnae_secundaria sec
+JOIN
+    estabelecimento est ON sec.cnpj_basico = est.cnpj_basico
+                       AND sec.cnpj_ordem = est.cnpj_ordem
+                       AND sec.cnpj_dv = est.cnpj_dv
+LEFT JOIN
+    cnae ON sec.cnae = cnae.codigo;
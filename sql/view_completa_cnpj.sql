@@ -1,3 +1,6 @@
+-- Junta estabelecimentos e sócios apenas por cnpj_basico: retorna uma linha por
+-- estabelecimento x sócio. Para uma linha por estabelecimento, com os sócios em um array
+-- JSON, use a tabela cnpj_completo (DENORMALIZED_TABLE=true no .env).
 CREATE OR ALTER VIEW view_completa_cnpj AS
 SELECT
     -- Empresa
@@ -14,8 +17,8 @@ SELECT
     est.cnpj_ordem,
     est.cnpj_dv,
     CASE est.identificador_matriz_filial
-        WHEN '1' THEN 'MATRIZ'
-        WHEN '2' THEN 'FILIAL'
+        WHEN 1 THEN 'MATRIZ'
+        WHEN 2 THEN 'FILIAL'
         ELSE 'OUTRO'
     END AS matriz_filial,
     est.nome_fantasia,
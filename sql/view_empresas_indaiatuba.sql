@@ -1,3 +1,5 @@
+-- Para exportar os estabelecimentos de todos os municípios (ou por CNAE) em arquivos, de uma vez,
+-- use 'code/export_partitions.py' em vez de uma consulta por município.
 CREATE OR ALTER VIEW view_empresas_indaiatuba AS
 SELECT
     e.cnpj_basico,
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os scripts de 'code/' importam uns aos outros pelo nome do módulo
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'code'))
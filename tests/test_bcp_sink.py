@@ -0,0 +1,118 @@
+import contextlib
+import json
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason='o bcp falso é um script executável POSIX')
+
+# 'bcp' falso: registra os argumentos e a entrada padrão e falha depois de "confirmar" um lote
+FAKE_BCP = '''#!{python}
+import json, sys
+with open({log!r}, 'a') as f:
+    f.write(json.dumps({{'argv': sys.argv[1:], 'stdin': sys.stdin.read()}}) + '\\n')
+print('1000 rows sent to SQL Server. Total sent: 1000')
+print('1 rows copied.')
+sys.exit(1)
+'''
+
+
+class FakeEngine:
+    """Registra os comandos SQL enviados pelo sink (não há SQL Server nos testes)."""
+
+    def __init__(self):
+        self.statements = []
+
+    @contextlib.contextmanager
+    def connect(self):
+        yield self
+
+    def execute(self, statement):
+        self.statements.append(str(statement))
+
+    def commit(self):
+        self.statements.append('COMMIT')
+
+
+class RecordingSink(cnpj_processor.BulkSink):
+    name = 'recording'
+
+    def __init__(self, fail=False):
+        super().__init__()
+        self.frames, self.fail = [], fail
+
+    def _write(self, df, table_name):
+        if self.fail:
+            raise RuntimeError('fallback indisponível')
+        self.frames.append((table_name, df))
+
+
+@pytest.fixture
+def bcp_log(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    log = tmp_path / 'bcp.jsonl'
+    script = bin_dir / 'bcp'
+    script.write_text(FAKE_BCP.format(python=sys.executable, log=str(log)))
+    script.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return log
+
+
+def make_sink(tmp_path, fallback):
+    config = {'db_server': 'server', 'db_user': 'etl', 'db_password': 's3cret'}
+    return cnpj_processor.BcpSink(FakeEngine(), config, 'Dados_RFB', str(tmp_path), batch_rows=1000, fallback=fallback)
+
+
+def chunk(start, rows):
+    return pd.DataFrame({'codigo': [str(i) for i in range(start, start + rows)],
+                         'descricao': [f'PAIS {i}' if i % 3 else None for i in range(start, start + rows)]})
+
+
+def test_failed_bcp_replays_the_whole_staging_file(tmp_path, bcp_log):
+    fallback = RecordingSink()
+    sink = make_sink(tmp_path, fallback)
+    committed = []
+    for index in range(3):
+        sink.write(chunk(index * 10, 10), 'pais', on_commit=lambda index=index: committed.append(index))
+    assert committed == []
+    sink.flush()
+
+    # Os três chunks foram reenviados, com os nulos preservados, e só então confirmados
+    replayed = pd.concat([frame for _, frame in fallback.frames], ignore_index=True)
+    expected = pd.concat([chunk(index * 10, 10) for index in range(3)], ignore_index=True)
+    assert replayed.astype(object).where(replayed.notna(), None).equals(expected.astype(object).where(expected.notna(), None))
+    assert committed == [0, 1, 2]
+
+    # O lote confirmado pelo bcp é descartado e a tabela de destino só recebe a tabela de carga inteira
+    load_table = fallback.frames[0][0]
+    statements = sink.engine.statements
+    assert load_table != 'pais'
+    assert statements.index(f'TRUNCATE TABLE {load_table};') < statements.index(
+        f'INSERT INTO pais WITH (TABLOCK) SELECT * FROM {load_table};')
+    assert f'DROP TABLE {load_table};' in statements
+    assert not list(tmp_path.glob('*.bcp'))
+
+
+def test_password_is_not_on_the_command_line(tmp_path, bcp_log):
+    sink = make_sink(tmp_path, RecordingSink())
+    sink.write(chunk(0, 5), 'pais')
+    sink.flush()
+    call = json.loads(bcp_log.read_text().splitlines()[0])
+    assert 's3cret' not in call['argv'] and '-P' not in call['argv']
+    assert call['stdin'] == 's3cret\n'
+
+
+def test_failed_replay_drops_the_load_table_and_keeps_chunks_unconfirmed(tmp_path, bcp_log):
+    sink = make_sink(tmp_path, RecordingSink(fail=True))
+    committed = []
+    sink.write(chunk(0, 5), 'pais', on_commit=lambda: committed.append(0))
+    with pytest.raises(RuntimeError):
+        sink.flush()
+    assert committed == []
+    assert not any(statement.startswith('INSERT INTO pais') for statement in sink.engine.statements)
+    assert 'DROP TABLE' in sink.engine.statements[-2]
@@ -0,0 +1,112 @@
+import importlib.util
+import io
+import json
+
+import pandas as pd
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+
+COLS = ['a', 'b', 'c']
+SCHEMA = {'cols': COLS, 'dtype': {col: str for col in COLS}}
+# O campo terminado em '\' escapa a aspa de fechamento: o registro 02 continua na linha do 03
+QUIRK = b'"01";"ABC"\n"02";"RUA X\\"\n"03";"DEF"\n"04";"GHI"\n"05";"JKL"\n'
+ENGINES = ['pandas', pytest.param('pyarrow', marks=pytest.mark.skipif(
+    importlib.util.find_spec('pyarrow') is None, reason='pyarrow não instalado'))]
+
+
+def read_whole(data):
+    """Leitura de referência: o arquivo inteiro de uma vez pelo read_csv."""
+    return pd.read_csv(io.BytesIO(b';;\n' + data), sep=';', header=None, names=COLS, dtype=str,
+                       encoding='latin-1', quotechar='"', escapechar='\\', on_bad_lines='skip').iloc[1:]
+
+
+def read_blocks(data, engine, lines, read_size=cnpj_processor.CSV_READ_SIZE):
+    chunks, rejected = [], []
+    for _, block in cnpj_processor.iter_line_blocks(io.BytesIO(data), lines, read_size):
+        chunk, block_rejected = cnpj_processor.parse_csv_block(block, SCHEMA, engine)
+        chunks.append(chunk)
+        rejected.extend(cnpj_processor.locate_rejected_lines(block, block_rejected))
+    return pd.concat(chunks, ignore_index=True), rejected
+
+
+def normalize(df):
+    df = df.astype(object).where(df.notna(), None)
+    return df.sort_values(COLS, key=lambda column: column.astype(str)).reset_index(drop=True)
+
+
+def test_blocks_never_split_a_record():
+    blocks = [block for _, block in cnpj_processor.iter_line_blocks(io.BytesIO(QUIRK), 2)]
+    assert blocks == [b'"01";"ABC"\n"02";"RUA X\\"\n"03";"DEF"\n', b'"04";"GHI"\n"05";"JKL"\n']
+
+
+@pytest.mark.parametrize('read_size', [1, 7, 64, 1 << 20])
+def test_blocks_are_independent_of_read_size(read_size):
+    expected = list(cnpj_processor.iter_line_blocks(io.BytesIO(QUIRK), 2))
+    assert list(cnpj_processor.iter_line_blocks(io.BytesIO(QUIRK), 2, read_size)) == expected
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('lines', [1, 2, 3])
+def test_escaped_closing_quote_matches_whole_file(engine, lines):
+    chunk, rejected = read_blocks(QUIRK, engine, lines, read_size=8)
+    assert not rejected
+    assert normalize(chunk).equals(normalize(read_whole(QUIRK)))
+    assert sorted(chunk['b']) == ['ABC', 'GHI', 'JKL', 'RUA X"\n03"']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_short_and_long_records_follow_one_rule(engine):
+    data = b'"01";"ABC";"X"\n"02"\n"03";"DEF";"Y";"EXTRA"\n"04";"GHI";"Z"\n'
+    chunk, rejected = read_blocks(data, engine, 2)
+    assert normalize(chunk).equals(normalize(read_whole(data)))
+    assert chunk.set_index('a').loc['02'].isna().all()
+    assert [(line, text) for _, line, text, _ in rejected] == [(1, b'"03";"DEF";"Y";"EXTRA"')]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_quarantine_records_physical_lines(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(cnpj_processor, 'CSV_OPTIONS', dict(cnpj_processor.CSV_OPTIONS))
+    cnpj_processor.configure_csv_parser(engine, str(tmp_path))
+    schema = cnpj_processor.get_table_schemas()['pais']
+    data = b'"01";"A"\n"02";"B\\"\n"\n"03";"C";"X"\n"04";"D"\n'
+    chunks = list(cnpj_processor.iter_csv_chunks(io.BytesIO(data), schema, chunksize=1,
+                                                 table_name='pais', file_name='F1.PAISCSV'))
+    assert sum(len(chunk) for _, _, chunk in chunks if chunk is not None) == 3
+    with open(tmp_path / 'pais' / 'F1.PAISCSV.jsonl', encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f]
+    assert [(entry['line'], entry['offset'], entry['text']) for entry in entries] == [(4, data.index(b'"03"'), '"03";"C";"X"')]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_oversized_values_are_quarantined_not_truncated(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(cnpj_processor, 'CSV_OPTIONS', dict(cnpj_processor.CSV_OPTIONS))
+    cnpj_processor.configure_csv_parser(engine, str(tmp_path))
+    schema = cnpj_processor.get_table_schemas()['pais']
+    data = b'"01";"BRASIL"\n"0002";"ARGENTINA"\n"03";"CHILE"\n'
+    chunks = [chunk for _, _, chunk in cnpj_processor.iter_csv_chunks(
+        io.BytesIO(data), schema, chunksize=2, table_name='pais', file_name='F1.PAISCSV')]
+    assert pd.concat(chunks)['codigo'].tolist() == ['01', '03']
+    with open(tmp_path / 'pais' / 'F1.PAISCSV.jsonl', encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f]
+    assert [(entry['chunk'], entry['text'], entry['reason'], entry['loaded']) for entry in entries] == [
+        (0, '"0002";"ARGENTINA"', 'codigo: 4 characters, max 3', False)]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_oversized_value_is_nulled_and_row_kept(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(cnpj_processor, 'CSV_OPTIONS', dict(cnpj_processor.CSV_OPTIONS))
+    cnpj_processor.configure_csv_parser(engine, str(tmp_path))
+    schema = cnpj_processor.get_table_schemas()['pais']
+    long_name = 'X' * 251
+    data = f'"01";"BRASIL"\n"02";"{long_name}"\n"03";"CHILE"\n'.encode('latin-1')
+    chunks = [chunk for _, _, chunk in cnpj_processor.iter_csv_chunks(
+        io.BytesIO(data), schema, chunksize=2, table_name='pais', file_name='F1.PAISCSV')]
+    # Só o valor grande demais vira nulo; a linha e os demais campos são carregados
+    df = pd.concat(chunks)
+    assert df['codigo'].tolist() == ['01', '02', '03']
+    assert df['descricao'].isna().tolist() == [False, True, False]
+    with open(tmp_path / 'pais' / 'F1.PAISCSV.jsonl', encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f]
+    assert [(entry['chunk'], entry['text'], entry['reason'], entry['loaded']) for entry in entries] == [
+        (0, f'"02";"{long_name}"', 'descricao: 251 characters, max 250 (set to null)', True)]
@@ -0,0 +1,117 @@
+import json
+
+import pandas as pd
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+cnpj_lookup = pytest.importorskip('cnpj_lookup', exc_type=ImportError)
+pytest.importorskip('pyarrow')
+
+# Uma empresa com 3 estabelecimentos e 4 sócios (a view antiga geraria 12 linhas) e outra sem sócios
+TABLE_LINES = {
+    'empresa': [
+        ['12345678', 'PADARIA EXEMPLO LTDA', '2062', '49', '1000,00', '01', ''],
+        ['87654321', 'MERCADO SEM SOCIOS', '2062', '49', '50,00', '03', ''],
+    ],
+    'estabelecimento': [
+        ['12345678', '0001', '91', '1', 'PADARIA CENTRO', '02', '20200101', '00', '', '', '20100315', '5611201', '',
+         'RUA', 'DAS FLORES', '10', '', 'CENTRO', '01001000', 'SP', '7107', '11', '30000000', '', '', '', '', '', '', ''],
+        ['12345678', '0002', '72', '2', 'PADARIA BAIRRO', '02', '20200101', '00', '', '', '20150101', '5611201', '',
+         'RUA', 'DOS IPES', '20', '', 'JARDIM', '01002000', 'SP', '7107', '', '', '', '', '', '', '', '', ''],
+        ['12345678', '0003', '53', '2', '', '08', '20220101', '01', '', '', '20180101', '5611201', '',
+         'AV', 'PAULISTA', '1000', 'SALA 1', 'BELA VISTA', '01310100', 'SP', '7107', '', '', '', '', '', '', '', '', ''],
+        ['87654321', '0001', '00', '1', '', '02', '20200101', '00', '', '', '20190101', '4711302', '',
+         'RUA', 'UM', '1', '', 'CENTRO', '01001000', 'SP', '7107', '', '', '', '', '', '', '', '', ''],
+    ],
+    'socios': [
+        ['12345678', '2', 'MARIA DA SILVA', '***111111**', '49', '20100315', '', '', '', '00', '5'],
+        ['12345678', '2', 'JOAO DE SOUZA', '***222222**', '22', '20100315', '', '', '', '00', '6'],
+        ['12345678', '2', 'ANA PEREIRA', '***333333**', '22', '20150101', '', '', '', '00', '4'],
+        ['12345678', '1', 'HOLDING EXEMPLO SA', '11222333000181', '22', '', '', '', '', '00', '0'],
+    ],
+    'simples': [['12345678', 'S', '20100315', '', 'N', '', '']],
+    'natju': [['2062', 'SOCIEDADE EMPRESARIA LIMITADA']],
+    'munic': [['7107', 'SAO PAULO']],
+    'cnae': [['5611201', 'RESTAURANTES E SIMILARES'], ['4711302', 'SUPERMERCADOS']],
+    'quals': [['49', 'SOCIO-ADMINISTRADOR'], ['22', 'SOCIO']],
+}
+BRANCHES = ['12345678000191', '12345678000272', '12345678000353']
+
+
+@pytest.fixture(scope='module')
+def cache_path(tmp_path_factory):
+    root = tmp_path_factory.mktemp('denormalized')
+    data_path, cache_path = root / 'data', root / 'cache'
+    data_path.mkdir()
+    schemas = cnpj_processor.get_table_schemas()
+    for table_name, lines in TABLE_LINES.items():
+        file_name = f'{table_name.upper()}.CSV'
+        content = ''.join(';'.join(f'"{value}"' for value in line) + '\n' for line in lines)
+        (data_path / file_name).write_bytes(content.encode('latin-1'))
+        cnpj_processor.build_table_cache(table_name, [file_name], schemas[table_name], str(data_path),
+                                         str(cache_path), 'v1')
+    return str(cache_path)
+
+
+def test_one_row_per_establishment(cache_path):
+    df = pd.concat([frame for _, frame in cnpj_processor.iter_denormalized_partitions(cache_path)], ignore_index=True)
+    assert sorted(df['cnpj']) == BRANCHES + ['87654321000100']
+
+    company = df[df['cnpj_basico'] == '12345678'].set_index('cnpj').loc[BRANCHES]
+    assert company['matriz_filial'].tolist() == ['MATRIZ', 'FILIAL', 'FILIAL']
+    assert set(company['natureza_juridica']) == {'SOCIEDADE EMPRESARIA LIMITADA'}
+    assert set(company['municipio']) == {'SAO PAULO'}
+    assert set(company['cnae_principal']) == {'RESTAURANTES E SIMILARES'}
+    assert set(company['opcao_pelo_simples']) == {'S'}
+    for partners in company['socios']:
+        assert len(partners) == 4
+        assert sorted(partner[2] for partner in partners) == ['SOCIO', 'SOCIO', 'SOCIO', 'SOCIO-ADMINISTRADOR']
+    assert df.loc[df['cnpj_basico'] == '87654321', 'socios'].tolist() == [[]]
+
+
+def test_loaded_table_has_json_partner_arrays(cache_path, tmp_path):
+    sink = cnpj_processor.SqliteSink(str(tmp_path / 'cnpj.sqlite'))
+    try:
+        sink.prepare_tables([cnpj_processor.DENORMALIZED_TABLE])
+        cnpj_processor.load_denormalized_table(sink, cache_path)
+        rows = sink.connection.execute(
+            f"SELECT cnpj, socios FROM {cnpj_processor.DENORMALIZED_TABLE} WHERE cnpj_basico = '12345678' ORDER BY cnpj"
+        ).fetchall()
+    finally:
+        sink.close()
+    assert [cnpj for cnpj, _ in rows] == BRANCHES
+    for _, socios in rows:
+        partners = json.loads(socios)
+        assert len(partners) == 4
+        assert set(partners[0]) == set(cnpj_processor.DENORMALIZED_PARTNER_FIELDS)
+        assert {partner['nome_socio_razao_social'] for partner in partners} == {
+            'MARIA DA SILVA', 'JOAO DE SOUZA', 'ANA PEREIRA', 'HOLDING EXEMPLO SA'}
+    holding = next(partner for partner in json.loads(rows[0][1]) if partner['cpf_cnpj_socio'] == '11222333000181')
+    assert holding['data_entrada_sociedade'] is None
+
+
+def test_lookup_store_round_trip(cache_path, tmp_path):
+    store_path = str(tmp_path / 'store')
+    cnpj_processor.build_lookup_store(cache_path, store_path)
+    with cnpj_lookup.CnpjLookup(store_path) as lookup:
+        assert len(lookup) == 4
+        record = lookup.get('12.345.678/0002-72')
+        assert record['nome_fantasia'] == 'PADARIA BAIRRO'
+        assert record['municipio'] == 'SAO PAULO'
+        assert record['data_inicio_atividade'] == '2015-01-01'
+        assert len(record['socios']) == 4
+        assert {'nome_socio_razao_social': 'MARIA DA SILVA', 'cpf_cnpj_socio': '***111111**',
+                'qualificacao_socio': 'SOCIO-ADMINISTRADOR', 'data_entrada_sociedade': '2010-03-15'} in record['socios']
+        assert lookup.get('12345678000999') is None
+        assert [r['cnpj'] for r in lookup.get_company('12345678')] == BRANCHES
+
+        result = lookup.get_many(BRANCHES[::-1] + ['87654321000100', '00000000000000'])
+        assert result['cnpj'].tolist()[:4] == BRANCHES[::-1] + ['87654321000100']
+        assert result['socios'].map(len, na_action='ignore').tolist()[:4] == [4, 4, 4, 0]
+        assert result['cnpj'].isna().tolist() == [False, False, False, False, True]
+
+    # Sem mudança no cache, o índice não é gerado de novo
+    records_file = tmp_path / 'store' / cnpj_processor.LOOKUP_RECORDS_FILE
+    mtime = records_file.stat().st_mtime_ns
+    cnpj_processor.build_lookup_store(cache_path, store_path)
+    assert records_file.stat().st_mtime_ns == mtime
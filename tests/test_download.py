@@ -0,0 +1,103 @@
+import http.server
+import os
+import threading
+
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+
+PAYLOAD = bytes(range(256)) * 40  # 10240 bytes
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """Servidor de arquivo com suporte a HTTP Range; registra os intervalos pedidos."""
+
+    def log_message(self, *args):
+        pass
+
+    def send_file_headers(self, status, start, end):
+        self.send_response(status)
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('ETag', self.server.etag)
+        if self.server.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{len(PAYLOAD)}')
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.send_file_headers(200, 0, len(PAYLOAD))
+
+    def do_GET(self):
+        header = self.headers.get('Range')
+        self.server.ranges.append(header)
+        if header is None or self.server.ignore_range:
+            self.send_file_headers(200, 0, len(PAYLOAD))
+            self.wfile.write(PAYLOAD)
+            return
+        start, end = header.split('=', 1)[1].split('-')
+        start, end = int(start), int(end) + 1 if end else len(PAYLOAD)
+        self.send_file_headers(206, start, end)
+        self.wfile.write(PAYLOAD[start:end])
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    httpd.ranges, httpd.etag, httpd.accept_ranges, httpd.ignore_range = [], '"v1"', True, False
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def file_url(server):
+    return f'http://127.0.0.1:{server.server_address[1]}/Empresas0.zip'
+
+
+def test_segmented_download(server, tmp_path):
+    local_path = str(tmp_path / 'Empresas0.zip')
+    info = cnpj_processor.download_file(file_url(server), local_path, segments=4, segment_min_bytes=1,
+                                        max_retries=1, delay_seconds=0)
+    assert open(local_path, 'rb').read() == PAYLOAD
+    assert info['etag'] == '"v1"'
+    # O primeiro segmento começa no byte 0 e é pedido sem Range (lido só até o seu fim)
+    assert sorted(server.ranges, key=str) == [None, 'bytes=2560-5119', 'bytes=5120-7679', 'bytes=7680-10239']
+    assert os.listdir(tmp_path) == ['Empresas0.zip']
+
+
+def test_resumes_interrupted_single_download(server, tmp_path):
+    local_path = str(tmp_path / 'Empresas0.zip')
+    (tmp_path / 'Empresas0.zip.part').write_bytes(PAYLOAD[:3000])
+    cnpj_processor.download_file(file_url(server), local_path, segments=4, segment_min_bytes=1,
+                                 max_retries=1, delay_seconds=0)
+    assert open(local_path, 'rb').read() == PAYLOAD
+    # O .part sem segmentos continua como download simples, a partir do byte já gravado
+    assert server.ranges == ['bytes=3000-10239']
+
+
+def test_resumes_interrupted_segment(server, tmp_path):
+    local_path = str(tmp_path / 'Empresas0.zip')
+    (tmp_path / 'Empresas0.zip.part.0-4').write_bytes(PAYLOAD[:2560])
+    (tmp_path / 'Empresas0.zip.part.1-4').write_bytes(PAYLOAD[2560:3000])
+    cnpj_processor.download_file(file_url(server), local_path, segments=4, segment_min_bytes=1,
+                                 max_retries=1, delay_seconds=0)
+    assert open(local_path, 'rb').read() == PAYLOAD
+    assert sorted(server.ranges) == ['bytes=3000-5119', 'bytes=5120-7679', 'bytes=7680-10239']
+
+
+def test_segment_fails_if_server_ignores_range(server, tmp_path):
+    server.ignore_range = True
+    with pytest.raises(IOError, match='Range'):
+        cnpj_processor.download_file(file_url(server), str(tmp_path / 'Empresas0.zip'), segments=4,
+                                     segment_min_bytes=1, max_retries=1, delay_seconds=0)
+
+
+def test_discards_local_copy_when_remote_changed(server, tmp_path):
+    local_path = str(tmp_path / 'Empresas0.zip')
+    (tmp_path / 'Empresas0.zip').write_bytes(b'x' * len(PAYLOAD))
+    cnpj_processor.download_file(file_url(server), local_path, segments=1, max_retries=1, delay_seconds=0,
+                                 known_remote={'etag': '"v0"'})
+    assert open(local_path, 'rb').read() == PAYLOAD
+    assert server.ranges == [None]
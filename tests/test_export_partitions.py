@@ -0,0 +1,126 @@
+import json
+
+import pandas as pd
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+pytest.importorskip('pyarrow')
+export_partitions = pytest.importorskip('export_partitions')
+
+
+def test_refuses_a_folder_it_did_not_create(tmp_path):
+    target = tmp_path / 'documentos'
+    target.mkdir()
+    (target / 'relatorio.txt').write_text('não apagar')
+    with pytest.raises(ValueError, match='não foi gerada por esta exportação'):
+        export_partitions.export_partitions(str(tmp_path / 'cache'), str(target))
+    assert (target / 'relatorio.txt').read_text() == 'não apagar'
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['documentos']
+
+
+def test_publish_replaces_a_previous_export(tmp_path):
+    target = tmp_path / 'export'
+    target.mkdir()
+    (target / export_partitions.EXPORT_MARKER_FILE).write_text('{}')
+    (target / 'antigo.csv').write_text('x')
+    new = tmp_path / 'novo'
+    new.mkdir()
+    (new / export_partitions.EXPORT_MARKER_FILE).write_text('{}')
+    (new / 'part-0.csv').write_text('y')
+
+    export_partitions.publish_export(str(new), str(target))
+    assert sorted(path.name for path in target.iterdir()) == [export_partitions.EXPORT_MARKER_FILE, 'part-0.csv']
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['export']
+
+
+@pytest.mark.parametrize('create', [False, True])
+def test_missing_or_empty_destination_is_accepted(tmp_path, create):
+    target = tmp_path / 'export'
+    if create:
+        target.mkdir()
+    export_partitions.check_export_path(str(target))
+
+
+@pytest.fixture(scope='module')
+def cache_path(tmp_path_factory):
+    synthetic_data = pytest.importorskip('synthetic_data', exc_type=ImportError)
+    root = tmp_path_factory.mktemp('export')
+    zip_path, cache_path = str(root / 'zips'), str(root / 'cache')
+    synthetic_data.generate_synthetic_dataset(zip_path, companies=200, files_per_table=1, bad_line_rate=0.0)
+    local_files = cnpj_processor.fingerprint_local_files(zip_path, {'files': {}, 'tables': {}})
+    table_fingerprints = cnpj_processor.get_table_fingerprints(zip_path, local_files)
+    cnpj_processor.build_parquet_cache(zip_path, cache_path, table_fingerprints,
+                                       list(cnpj_processor.DENORMALIZED_SOURCE_TABLES), from_zip=True)
+    return cache_path
+
+
+@pytest.fixture(scope='module')
+def denormalized(cache_path):
+    return pd.concat(df for _, df in cnpj_processor.iter_denormalized_partitions(cache_path, partners=False))
+
+
+def read_export(export_path):
+    # Um DataFrame por arquivo, com o caminho relativo da partição
+    return {str(path.relative_to(export_path)): pd.read_csv(path, sep=';', dtype=str, keep_default_na=False)
+            for path in sorted(export_path.rglob('*.csv'))}
+
+
+def test_export_partitions_by_uf_and_municipio(cache_path, denormalized, tmp_path):
+    target = tmp_path / 'export'
+    result = export_partitions.export_partitions(
+        cache_path, str(target), columns=['cnpj', 'uf', 'municipio', 'situacao_cadastral'],
+        partition_by=['uf', 'municipio'])
+
+    files = read_export(target)
+    expected = denormalized.groupby(['uf', 'municipio']).size()
+    assert result == {'rows': len(denormalized), 'partitions': len(expected)}
+    assert sorted(files) == sorted(f'{uf}/{export_partitions.safe_path_segment(municipio)}/part-0.csv'
+                                   for uf, municipio in expected.index)
+    for path, df in files.items():
+        uf, municipio = path.split('/')[:2]
+        # As colunas de partição continuam dentro dos arquivos, com os valores do diretório
+        assert list(df.columns) == ['cnpj', 'uf', 'municipio', 'situacao_cadastral']
+        assert set(df['uf']) == {uf}
+        assert {export_partitions.safe_path_segment(value) for value in df['municipio']} == {municipio}
+    assert sum(len(df) for df in files.values()) == len(denormalized)
+    assert sorted(pd.concat(files.values())['cnpj']) == sorted(denormalized['cnpj'])
+    marker = json.loads((target / export_partitions.EXPORT_MARKER_FILE).read_text(encoding='utf-8'))
+    assert marker['rows'] == len(denormalized)
+
+
+def test_filters_follow_the_column_type(cache_path, denormalized, tmp_path):
+    # Uma linha ativa (situação 02, gravada como 2) escolhe a UF e a data de início
+    row = denormalized[(denormalized['situacao_cadastral'] == 2).fillna(False)
+                       & denormalized['data_inicio_atividade'].notna()].iloc[0]
+    uf, started = row['uf'], row['data_inicio_atividade']
+    filters = export_partitions.parse_filters(
+        f"uf={uf},XX;situacao_cadastral=02,8;data_inicio_atividade={started:%Y%m%d}")
+    result = export_partitions.export_partitions(
+        cache_path, str(tmp_path / 'export'), columns=['cnpj', 'uf'], partition_by=['uf'], filters=filters)
+
+    expected = denormalized[(denormalized['uf'] == uf)
+                            & denormalized['situacao_cadastral'].isin([2, 8]).fillna(False)
+                            & (denormalized['data_inicio_atividade'] == started)]
+    files = read_export(tmp_path / 'export')
+    assert result['rows'] == len(expected) > 0
+    assert list(files) == [f'{uf}/part-0.csv']
+    assert sorted(files[f'{uf}/part-0.csv']['cnpj']) == sorted(expected['cnpj'])
+
+
+def test_iso_and_rfb_dates_select_the_same_rows(denormalized):
+    started = denormalized['data_inicio_atividade'].dropna().iloc[0]
+    available = export_partitions.get_export_columns_types()
+    selected = [export_partitions.apply_filters(denormalized, export_partitions.prepare_filters(
+        {'data_inicio_atividade': [value]}, available)) for value in (f'{started:%Y%m%d}', f'{started:%Y-%m-%d}')]
+    assert len(selected[0]) > 0
+    assert selected[0]['cnpj'].tolist() == selected[1]['cnpj'].tolist()
+
+
+@pytest.mark.parametrize('filters, message', [
+    ({'data_inicio_atividade': ['01/02/2020']}, 'Valor inválido'),
+    ({'situacao_cadastral': ['ATIVA']}, 'Valor inválido'),
+    ({'socios': ['x']}, 'não pode ser usada em filtros'),
+])
+def test_rejects_filters_that_do_not_fit_the_column(filters, message):
+    with pytest.raises(ValueError, match=message):
+        export_partitions.prepare_filters(filters, export_partitions.get_export_columns_types())
@@ -0,0 +1,151 @@
+import contextlib
+import os
+import shutil
+import zipfile
+
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+synthetic_data = pytest.importorskip('synthetic_data', exc_type=ImportError)
+
+
+@pytest.fixture(scope='module')
+def synthetic_zips(tmp_path_factory):
+    zip_path = tmp_path_factory.mktemp('synthetic')
+    synthetic_data.generate_synthetic_dataset(str(zip_path), companies=300, files_per_table=1, bad_line_rate=0.0)
+    return zip_path
+
+
+@pytest.fixture
+def output_path(synthetic_zips, tmp_path):
+    path = tmp_path / 'output'
+    shutil.copytree(synthetic_zips, path)
+    return str(path)
+
+
+def fingerprint(output_path, manifest):
+    local_files = cnpj_processor.fingerprint_local_files(output_path, manifest)
+    return local_files, cnpj_processor.get_table_fingerprints(output_path, local_files)
+
+
+def record_load(output_path):
+    """Simula uma carga completa registrada no manifesto; retorna o manifesto relido do disco."""
+    manifest = cnpj_processor.load_manifest(output_path)
+    local_files, table_fingerprints = fingerprint(output_path, manifest)
+    cnpj_processor.update_manifest_files(manifest, local_files=local_files)
+    cnpj_processor.update_manifest_tables(manifest, table_fingerprints, list(table_fingerprints))
+    cnpj_processor.save_manifest(output_path, manifest)
+    return cnpj_processor.load_manifest(output_path)
+
+
+def append_line(output_path, zip_name, line):
+    """Acrescenta uma linha ao CSV de um ZIP (novo tamanho e novo hash)."""
+    zip_file = os.path.join(output_path, zip_name)
+    with zipfile.ZipFile(zip_file) as zip_ref:
+        member = zip_ref.namelist()[0]
+        content = zip_ref.read(member)
+    with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr(member, content + line)
+
+
+def test_unchanged_files_reload_nothing(output_path):
+    manifest = record_load(output_path)
+    _, table_fingerprints = fingerprint(output_path, manifest)
+    assert cnpj_processor.get_changed_tables(table_fingerprints, manifest) == []
+
+
+def test_missing_or_unreadable_manifest_means_full_load(output_path):
+    manifest = cnpj_processor.load_manifest(output_path)
+    assert manifest == {'files': {}, 'tables': {}}
+    _, table_fingerprints = fingerprint(output_path, manifest)
+    assert cnpj_processor.get_changed_tables(table_fingerprints, manifest) == list(table_fingerprints)
+    assert len(table_fingerprints) == len(synthetic_data.TABLE_FILES)
+
+    with open(os.path.join(output_path, cnpj_processor.MANIFEST_FILE_NAME), 'w') as f:
+        f.write('{"tables": {')
+    assert cnpj_processor.load_manifest(output_path) == {'files': {}, 'tables': {}}
+
+
+def test_changed_file_reloads_only_its_table_and_dependents(output_path, tmp_path):
+    manifest = record_load(output_path)
+    _, table_fingerprints = fingerprint(output_path, manifest)
+    cache_path = str(tmp_path / 'cache')
+    tables = list(cnpj_processor.DENORMALIZED_SOURCE_TABLES) + ['pais']
+    cnpj_processor.build_parquet_cache(output_path, cache_path, table_fingerprints, tables, from_zip=True)
+    config = {'denormalized_table': True, 'parquet_cache_path': cache_path}
+    _, derived_fingerprints = cnpj_processor.get_derived_tables(config, manifest, incremental=True)
+    cnpj_processor.update_manifest_tables(manifest, derived_fingerprints, list(derived_fingerprints))
+
+    def reload(zip_name, line):
+        append_line(output_path, zip_name, line)
+        _, table_fingerprints = fingerprint(output_path, manifest)
+        changed = cnpj_processor.get_changed_tables(table_fingerprints, manifest)
+        stale = cnpj_processor.get_stale_cache_tables(cache_path, table_fingerprints, changed)
+        cnpj_processor.build_parquet_cache(output_path, cache_path, table_fingerprints, stale, from_zip=True)
+        derived, _ = cnpj_processor.get_derived_tables(config, manifest, incremental=True)
+        return changed, stale, derived
+
+    # 'pais' não alimenta a tabela desnormalizada
+    assert reload('Paises.zip', b'"999";"PAIS NOVO"\n') == (['pais'], ['pais'], [])
+    # O manifesto não registrou a carga anterior: 'pais' continua pendente
+    assert reload('Municipios.zip', b'"9999";"MUNICIPIO NOVO"\n') == (
+        ['munic', 'pais'], ['munic'], [cnpj_processor.DENORMALIZED_TABLE])
+
+
+def test_remote_change_is_detected_by_etag_or_last_modified():
+    known = {'size': 10, 'etag': '"a"', 'last_modified': 'Mon, 01 Jan 2024 00:00:00 GMT'}
+    assert not cnpj_processor.remote_file_changed(known, dict(known))
+    assert cnpj_processor.remote_file_changed(known, dict(known, etag='"b"'))
+    assert cnpj_processor.remote_file_changed(known, dict(known, last_modified='Tue, 02 Jan 2024 00:00:00 GMT'))
+    # Sem o cabeçalho no servidor, não há como comparar: vale o tamanho e o hash local
+    assert not cnpj_processor.remote_file_changed(known, dict(known, etag=None))
+
+
+class FakeEngine:
+    """Registra os comandos SQL da publicação; falha no comando que contiver 'fail_on'."""
+
+    def __init__(self, fail_on=None):
+        self.statements = []
+        self.fail_on = fail_on
+
+    @contextlib.contextmanager
+    def connect(self):
+        yield self
+
+    def execute(self, statement):
+        statement = str(statement)
+        if self.fail_on and self.fail_on in statement:
+            raise RuntimeError('falha simulada')
+        self.statements.append(statement)
+
+    def commit(self):
+        self.statements.append('COMMIT')
+
+    def rollback(self):
+        self.statements.append('ROLLBACK')
+
+
+def swap_statements(table_name):
+    return [
+        f"IF OBJECT_ID('{table_name}_old', 'U') IS NOT NULL DROP TABLE {table_name}_old;",
+        f"IF OBJECT_ID('{table_name}', 'U') IS NOT NULL EXEC sp_rename '{table_name}', '{table_name}_old';",
+        f"EXEC sp_rename '{table_name}_staging', '{table_name}';",
+        f"IF OBJECT_ID('{table_name}_old', 'U') IS NOT NULL DROP TABLE {table_name}_old;",
+        'COMMIT',
+    ]
+
+
+def test_swap_staging_tables_sql():
+    engine = FakeEngine()
+    cnpj_processor.swap_staging_tables(engine, ['estabelecimento', 'pais'])
+    # A tabela-ponte é publicada junto com a tabela de origem, cada troca em uma transação
+    assert engine.statements == (swap_statements('estabelecimento')
+                                 + swap_statements('estabelecimento_cnae_secundaria')
+                                 + swap_statements('pais'))
+
+
+def test_swap_failure_rolls_back_and_stops():
+    engine = FakeEngine(fail_on="sp_rename 'pais_staging'")
+    with pytest.raises(RuntimeError):
+        cnpj_processor.swap_staging_tables(engine, ['pais', 'munic'])
+    assert engine.statements == swap_statements('pais')[:2] + ['ROLLBACK']
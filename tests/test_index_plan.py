@@ -0,0 +1,94 @@
+import contextlib
+
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+
+
+def plan_by_name(**kwargs):
+    return {index['name']: index for index in cnpj_processor.get_index_plan(**kwargs)}
+
+
+def test_clustered_cnpj_key():
+    plan = plan_by_name(tables=['estabelecimento'])
+    statement = cnpj_processor.build_index_statement(plan['cix_estabelecimento'], 'estabelecimento')
+    assert statement == ("CREATE CLUSTERED INDEX cix_estabelecimento ON estabelecimento "
+                         "(cnpj_basico, cnpj_ordem, cnpj_dv) WITH (SORT_IN_TEMPDB = ON, DATA_COMPRESSION = NONE);")
+
+
+def test_covering_include_lists():
+    plan = plan_by_name(tables=['estabelecimento'])
+    municipio = cnpj_processor.build_index_statement(plan['ix_estabelecimento_municipio'], 'estabelecimento_staging')
+    assert municipio.startswith("CREATE NONCLUSTERED INDEX ix_estabelecimento_municipio ON estabelecimento_staging "
+                                "(municipio) INCLUDE (nome_fantasia, situacao_cadastral, logradouro, ")
+    assert 'correio_eletronico, cnae_fiscal_principal)' in municipio
+    cnae = cnpj_processor.build_index_statement(plan['ix_estabelecimento_cnae'], 'estabelecimento')
+    assert "(cnae_fiscal_principal) INCLUDE (municipio, uf, situacao_cadastral)" in cnae
+
+
+def test_plan_is_ordered_by_phase_and_covers_bridge_tables():
+    plan = cnpj_processor.get_index_plan(tables=['estabelecimento'])
+    kinds = [index['kind'] for index in plan]
+    assert kinds == sorted(kinds, key=cnpj_processor.INDEX_PHASES.index)
+    assert {index['table'] for index in plan} == {'estabelecimento', 'estabelecimento_cnae_secundaria'}
+    # As tabelas derivadas só entram quando pedidas
+    assert 'cix_cnpj_completo' not in plan_by_name()
+    assert 'cix_cnpj_completo' in plan_by_name(tables=['cnpj_completo'])
+
+
+def test_columnstore_replaces_the_clustered_key():
+    plan = plan_by_name(tables=['estabelecimento'], columnstore=True)
+    assert 'cix_estabelecimento' not in plan
+    assert (cnpj_processor.build_index_statement(plan['ccix_estabelecimento'], 'estabelecimento', 'PAGE')
+            == "CREATE CLUSTERED COLUMNSTORE INDEX ccix_estabelecimento ON estabelecimento;")
+    assert plan['ix_estabelecimento_cnpj']['columns'] == ['cnpj_basico', 'cnpj_ordem', 'cnpj_dv']
+    assert [index['kind'] for index in cnpj_processor.get_index_plan(tables=['estabelecimento'], columnstore=True)][:2] \
+        == ['clustered', 'clustered columnstore']
+
+
+@pytest.mark.parametrize('compression', ['ROW', 'PAGE'])
+def test_compression_is_applied(compression):
+    plan = plan_by_name(tables=['socios'])
+    statement = cnpj_processor.build_index_statement(plan['cix_socios'], 'socios', compression)
+    assert statement.endswith(f"WITH (SORT_IN_TEMPDB = ON, DATA_COMPRESSION = {compression});")
+
+
+@pytest.mark.parametrize('compression', ['page', 'ZSTD', 'NONE; DROP TABLE socios'])
+def test_invalid_compression_is_rejected(compression):
+    plan = plan_by_name(tables=['socios'])
+    with pytest.raises(ValueError, match='Compressão de índice inválida'):
+        cnpj_processor.build_index_statement(plan['cix_socios'], 'socios', compression)
+
+
+class FakeConnection:
+    """Nenhum índice existe; registra os CREATE INDEX enviados."""
+
+    def __init__(self):
+        self.statements = []
+
+    @contextlib.contextmanager
+    def connect(self):
+        yield self
+
+    def execution_options(self, **options):
+        return self
+
+    def execute(self, statement, params=None):
+        self.statements.append(str(statement))
+        return self
+
+    def first(self):
+        return None
+
+
+def test_create_database_indexes_honours_columnstore_and_compression():
+    engine = FakeConnection()
+    cnpj_processor.create_database_indexes(engine, tables=['estabelecimento'], suffix='_staging',
+                                           columnstore=True, compression='ROW')
+    created = [statement for statement in engine.statements if statement.startswith('CREATE')]
+    assert created[0] == ("CREATE CLUSTERED INDEX cix_estabelecimento_cnae_secundaria ON "
+                          "estabelecimento_cnae_secundaria_staging (cnae, cnpj_basico, cnpj_ordem, cnpj_dv) "
+                          "WITH (SORT_IN_TEMPDB = ON, DATA_COMPRESSION = ROW);")
+    assert created[1] == "CREATE CLUSTERED COLUMNSTORE INDEX ccix_estabelecimento ON estabelecimento_staging;"
+    assert all(statement.endswith('DATA_COMPRESSION = ROW);') for statement in created[2:])
+    assert len(created) == len(cnpj_processor.get_index_plan(tables=['estabelecimento'], columnstore=True))
@@ -0,0 +1,81 @@
+import os
+
+import pandas as pd
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+
+
+class MemorySink(cnpj_processor.BulkSink):
+    """Guarda os chunks em memória; falha nas próximas 'failures' escritas."""
+    name = 'memory'
+
+    def __init__(self, failures=0):
+        super().__init__()
+        self.failures = failures
+        self.tables = {}
+
+    def _write(self, df, table_name):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('falha simulada')
+        self.tables.setdefault(table_name, []).append(df)
+
+
+def load(journal, sink, index):
+    chunk = pd.DataFrame({'codigo': [index], 'descricao': [f'PAIS {index}']})
+    position = {'row': index, 'offset': (index + 1) * 100}
+    return cnpj_processor.load_chunk(sink, chunk, 'pais', 'F1.PAISCSV', index, position, journal=journal)
+
+
+def test_resume_after_interruption(tmp_path):
+    journal = cnpj_processor.LoadJournal(str(tmp_path))
+    journal.start(['pais'], False, '', {'pais': 'v1'})
+    assert load(journal, MemorySink(), 0)
+    # Interrupção durante a gravação do chunk 1: fica só o evento 'pending'
+    journal.record_chunk('pending', {'table': 'pais', 'file': 'F1.PAISCSV', 'chunk': 1, 'rows': 1})
+    journal.close()
+
+    resumed = cnpj_processor.LoadJournal(str(tmp_path))
+    assert resumed.load()
+    assert resumed.run['fingerprints'] == {'pais': 'v1'}
+    resumed.resume()
+    assert resumed.skip_chunks('pais', 'F1.PAISCSV') == {0}
+    assert load(resumed, MemorySink(), 1)
+    resumed.record_file('pais', 'F1.PAISCSV', 2)
+    assert resumed.is_file_done('pais', 'F1.PAISCSV')
+    resumed.check_complete({'pais': ['F1.PAISCSV']})
+    resumed.finish()
+
+    assert not cnpj_processor.LoadJournal(str(tmp_path)).load()
+
+
+def test_ignores_truncated_last_line(tmp_path):
+    journal = cnpj_processor.LoadJournal(str(tmp_path))
+    journal.start(['pais'], False, '', {'pais': 'v1'})
+    assert load(journal, MemorySink(), 0)
+    journal.close()
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"event": "commi')
+
+    resumed = cnpj_processor.LoadJournal(str(tmp_path))
+    assert resumed.load()
+    assert resumed.skip_chunks('pais', 'F1.PAISCSV') == {0}
+
+
+def test_failed_chunk_goes_to_retry_queue(tmp_path):
+    journal = cnpj_processor.LoadJournal(str(tmp_path))
+    journal.start(['pais'], False, '', {'pais': 'v1'})
+    assert not load(journal, MemorySink(failures=1), 0)
+    journal.record_file('pais', 'F1.PAISCSV', 1)
+    # O chunk enfileirado não é lido de novo, mas a carga não está completa
+    assert journal.skip_chunks('pais', 'F1.PAISCSV') == {0}
+    with pytest.raises(RuntimeError, match='fila de retentativa'):
+        journal.check_complete({'pais': ['F1.PAISCSV']})
+
+    sink = MemorySink()
+    cnpj_processor.replay_retry_queue(sink, journal)
+    assert pd.concat(sink.tables['pais'])['codigo'].tolist() == [0]
+    assert os.listdir(journal.retry_path) == []
+    journal.check_complete({'pais': ['F1.PAISCSV']})
+    journal.finish()
@@ -0,0 +1,58 @@
+import json
+import math
+
+import pandas as pd
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+cnpj_lookup = pytest.importorskip('cnpj_lookup', exc_type=ImportError)
+
+
+def test_rejects_store_in_old_format(tmp_path):
+    # Índice vazio gravado no formato da versão 1 (campos da view antiga)
+    (tmp_path / cnpj_processor.LOOKUP_META_FILE).write_text(json.dumps({
+        'version': 1, 'fingerprint': 'x', 'rows': 0, 'fields': ['cnpj'], 'partner_fields': [],
+    }))
+    (tmp_path / cnpj_processor.LOOKUP_KEYS_FILE).write_bytes(b'')
+    (tmp_path / 'offsets.u64').write_bytes(b'\0' * 8)
+    (tmp_path / 'records.bin').write_bytes(b'')
+    with pytest.raises(ValueError, match='Gere o índice novamente'):
+        cnpj_lookup.CnpjLookup(str(tmp_path))
+
+
+@pytest.fixture(scope='module')
+def store_path(tmp_path_factory):
+    pytest.importorskip('pyarrow')
+    synthetic_data = pytest.importorskip('synthetic_data', exc_type=ImportError)
+    root = tmp_path_factory.mktemp('lookup')
+    zip_path, cache_path, store_path = str(root / 'zips'), str(root / 'cache'), str(root / 'store')
+    synthetic_data.generate_synthetic_dataset(zip_path, companies=300, files_per_table=1, bad_line_rate=0.0)
+    local_files = cnpj_processor.fingerprint_local_files(zip_path, {'files': {}, 'tables': {}})
+    table_fingerprints = cnpj_processor.get_table_fingerprints(zip_path, local_files)
+    cnpj_processor.build_parquet_cache(zip_path, cache_path, table_fingerprints,
+                                       list(cnpj_processor.DENORMALIZED_SOURCE_TABLES), from_zip=True)
+    cnpj_processor.build_lookup_store(cache_path, store_path)
+    return store_path
+
+
+def normalize(value):
+    # Campos nulos: None no registro isolado, NaN no DataFrame do lote
+    return None if value is pd.NA or isinstance(value, float) and math.isnan(value) else value
+
+
+def test_get_many_matches_get(store_path):
+    with cnpj_lookup.CnpjLookup(store_path) as lookup:
+        cnpjs = [f'{int(key):014d}' for key in lookup.keys]
+        # Fora de ordem, com pontuação, repetido, inexistente e inválido
+        batch = [cnpjs[7], '99999999999999', cnpjs[0], 'abc',
+                 f'{cnpjs[3][:2]}.{cnpjs[3][2:5]}.{cnpjs[3][5:8]}/{cnpjs[3][8:12]}-{cnpjs[3][12:]}', cnpjs[7]]
+        result = lookup.get_many(batch)
+        assert result['consulta'].tolist() == batch
+        assert result.columns.tolist() == ['consulta'] + lookup.fields
+        assert result['cnpj'].isna().tolist() == [False, True, False, True, False, False]
+        for row, cnpj in zip(result.to_dict('records'), batch):
+            record = lookup.get(cnpj)
+            if record is None:
+                continue
+            assert {field: normalize(row[field]) for field in lookup.fields} == record
+        assert all(len(record['cnpj']) == 14 for record in lookup.get_company(cnpjs[0][:8]))
@@ -0,0 +1,102 @@
+import json
+import pickle
+import re
+
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+
+PREFIX = cnpj_processor.METRIC_PREFIX
+SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_prometheus(path):
+    """Lê o textfile como {(nome, labels ordenados): valor}, verificando o formato de cada linha."""
+    samples, types = {}, {}
+    with open(path, encoding='utf-8') as f:
+        for line in f.read().splitlines():
+            if line.startswith('# TYPE '):
+                _, _, name, kind = line.split(' ')
+                types[name] = kind
+                continue
+            if line.startswith('#'):
+                continue
+            match = SAMPLE.match(line)
+            assert match, line
+            name, label_text, value = match.groups()
+            labels = tuple(sorted(LABEL.findall(label_text or '')))
+            samples[(name, labels)] = float(value)
+    return samples, types
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = cnpj_processor.MetricsRegistry()
+    registry.configure(jsonl_path=str(tmp_path / 'metrics.jsonl'), prometheus_path=str(tmp_path / 'metrics.prom'))
+    yield registry
+    registry.close()
+
+
+def test_prometheus_textfile(registry):
+    registry.record('parse', 0.003, rows=10, size_bytes=100, table_name='empresa')
+    registry.record('parse', 0.3, rows=5, table_name='socios')
+    registry.record('insert', 400, rows=7, table_name='tabela "nova"\\x')
+    with pytest.raises(ValueError):
+        with registry.stage('insert', 'empresa'):
+            raise ValueError('falha')
+    registry.write_prometheus()
+    samples, types = parse_prometheus(registry.prometheus_path)
+
+    assert types[f'{PREFIX}_operation_seconds'] == 'histogram'
+    assert types[f'{PREFIX}_stage_rows_total'] == 'counter'
+
+    def bucket(stage, le):
+        return samples[(f'{PREFIX}_operation_seconds_bucket', (('le', le), ('stage', stage)))]
+
+    # Buckets cumulativos: 0.003 cai no primeiro, 0.3 no de 0.5 e 400 só no +Inf
+    assert bucket('parse', '0.005') == 1
+    assert bucket('parse', '0.25') == 1
+    assert bucket('parse', '0.5') == 2
+    assert bucket('parse', '+Inf') == 2
+    assert bucket('insert', '300') == 0
+    assert bucket('insert', '+Inf') == 1
+    assert samples[(f'{PREFIX}_operation_seconds_sum', (('stage', 'parse'),))] == pytest.approx(0.303)
+    assert samples[(f'{PREFIX}_operation_seconds_count', (('stage', 'parse'),))] == 2
+
+    assert samples[(f'{PREFIX}_stage_rows_total', (('stage', 'parse'), ('table', 'empresa')))] == 10
+    assert samples[(f'{PREFIX}_stage_bytes_total', (('stage', 'parse'), ('table', 'empresa')))] == 100
+    assert samples[(f'{PREFIX}_stage_errors_total', (('stage', 'insert'), ('table', 'empresa')))] == 1
+    # Aspas e barras invertidas do valor do label são escapadas
+    assert samples[(f'{PREFIX}_stage_rows_total', (('stage', 'insert'), ('table', 'tabela \\"nova\\"\\\\x')))] == 7
+
+
+def test_jsonl_events(registry):
+    with registry.stage('convert', 'empresa', file='F1.EMPRECSV') as event:
+        event['rows'] = 3
+    registry.record_error('download', file='Empresas0.zip', error='timeout')
+    registry.close()
+    with open(registry.jsonl_path, encoding='utf-8') as f:
+        events = [json.loads(line) for line in f]
+    assert [(e['event'], e['stage'], e['table']) for e in events] == [
+        ('operation', 'convert', 'empresa'), ('error', 'download', None)]
+    assert events[0]['rows'] == 3 and events[0]['file'] == 'F1.EMPRECSV'
+    assert events[1]['error'] == 'timeout'
+    assert all('pid' in e and 'ts' in e for e in events)
+
+
+def test_merge_snapshot_from_other_process(registry):
+    worker = cnpj_processor.MetricsRegistry()
+    worker.record('parse', 0.02, rows=100, table_name='empresa')
+    worker.record('parse', 2, rows=50, table_name='empresa')
+    registry.record('parse', 0.02, rows=1, table_name='empresa')
+    # O snapshot viaja pela fila dos processos de parsing, serializado com pickle
+    registry.merge(pickle.loads(pickle.dumps(worker.snapshot())))
+
+    totals = registry.snapshot()['stages'][('parse', 'empresa')]
+    assert totals['rows'] == 151
+    assert totals['operations'] == 3
+    assert totals['seconds'] == pytest.approx(2.04)
+    assert sum(totals['buckets']) == 3
+    assert totals['buckets'][cnpj_processor.LATENCY_BUCKETS.index(0.025)] == 2
+    assert totals['buckets'][cnpj_processor.LATENCY_BUCKETS.index(2.5)] == 1
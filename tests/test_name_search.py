@@ -0,0 +1,107 @@
+import logging
+
+import pandas as pd
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+cnpj_search = pytest.importorskip('cnpj_search', exc_type=ImportError)
+pytest.importorskip('pyarrow')
+
+
+def establishment(cnpj_basico, ordem, dv, nome_fantasia):
+    return [cnpj_basico, ordem, dv, '1', nome_fantasia, '02', '20200101', '00', '', '', '20100315', '5611201', '',
+            'RUA', 'DAS FLORES', '10', '', 'CENTRO', '01001000', 'SP', '7107', '', '', '', '', '', '', '', '', '']
+
+
+# A padaria aparece pela razão social e pelo nome fantasia (em dois estabelecimentos)
+TABLE_LINES = {
+    'empresa': [
+        ['11111111', 'PADARIA SAO JOSE LTDA', '2062', '49', '1000,00', '01', ''],
+        ['22222222', 'MERCADO BOA VISTA LTDA', '2062', '49', '50,00', '03', ''],
+        ['33333333', 'PADARIA CENTRAL ME', '2062', '49', '10,00', '01', ''],
+    ],
+    'estabelecimento': [
+        establishment('11111111', '0001', '01', 'PADARIA SÃO JOSÉ'),
+        establishment('11111111', '0002', '02', 'PADARIA SÃO JOSÉ'),
+        establishment('22222222', '0001', '03', 'BOA VISTA'),
+        establishment('33333333', '0001', '04', ''),
+    ],
+}
+
+
+def build_cache(data_path, cache_path, table_name, lines, fingerprint='v1'):
+    data_path.mkdir(exist_ok=True)
+    file_name = f'{table_name.upper()}.CSV'
+    content = ''.join(';'.join(f'"{value}"' for value in line) + '\n' for line in lines)
+    (data_path / file_name).write_bytes(content.encode('latin-1'))
+    cnpj_processor.build_table_cache(table_name, [file_name], cnpj_processor.get_table_schemas()[table_name],
+                                     str(data_path), str(cache_path), fingerprint)
+
+
+@pytest.fixture(scope='module')
+def index_path(tmp_path_factory):
+    root = tmp_path_factory.mktemp('name_search')
+    for table_name, lines in TABLE_LINES.items():
+        build_cache(root / 'data', root / 'cache', table_name, lines)
+    cnpj_processor.build_name_index(str(root / 'cache'), str(root / 'index'))
+    return str(root / 'index')
+
+
+def test_fold_names_removes_accents_and_punctuation():
+    names = pd.Series(['PADARIA SÃO JOSÉ', '  Açaí & Cia. ', 'ÁGUA-VIVA  Nº 2'])
+    assert cnpj_processor.fold_names(names).tolist() == ['padaria sao jose', 'acai cia', 'agua viva no 2']
+
+
+def test_name_trigrams_pad_each_name():
+    positions, codes = cnpj_processor.name_trigrams(pd.Series(['ab', 'abc']))
+    alphabet = cnpj_processor.NAME_ALPHABET
+
+    def decode(code):
+        return ''.join(alphabet[code // len(alphabet) ** power % len(alphabet)] for power in (2, 1, 0))
+
+    grams = sorted((int(position), decode(int(code))) for position, code in zip(positions, codes))
+    assert grams == [(0, ' ab'), (0, 'ab '), (1, ' ab'), (1, 'abc'), (1, 'bc ')]
+
+
+def test_typo_and_missing_accents_still_match(index_path):
+    result = cnpj_search.NameSearch(index_path).search('padaira sao jose')
+    best = result.iloc[0]
+    assert (best['cnpj_basico'], best['nome'], best['tabela']) == ('11111111', 'PADARIA SÃO JOSÉ', 'estabelecimento')
+    assert 0.5 <= best['score'] < 1
+
+
+def test_each_company_appears_once(index_path):
+    result = cnpj_search.NameSearch(index_path).search('padaria sao jose', min_score=0.3)
+    assert result['cnpj_basico'].is_unique
+    # Razão social e nome fantasia contêm o termo; fica o nome mais curto (maior similaridade)
+    assert result.iloc[0][['cnpj_basico', 'score', 'nome']].tolist() == ['11111111', 1.0, 'PADARIA SÃO JOSÉ']
+
+
+def test_min_score_cuts_partial_matches(index_path):
+    search = cnpj_search.NameSearch(index_path)
+    loose = search.search('padaria sao jose', min_score=0.3)
+    strict = search.search('padaria sao jose', min_score=0.9)
+    assert set(loose['cnpj_basico']) == {'11111111', '33333333'}
+    assert strict['cnpj_basico'].tolist() == ['11111111']
+    assert (loose['score'] >= 0.3).all()
+    assert search.search('padaria sao jose', tables=['empresa'])['nome'].iloc[0] == 'PADARIA SAO JOSE LTDA'
+
+
+def test_rebuild_skips_unchanged_tables(tmp_path, caplog):
+    cache_path, index_path = tmp_path / 'cache', tmp_path / 'index'
+    for table_name, lines in TABLE_LINES.items():
+        build_cache(tmp_path / 'data', cache_path, table_name, lines)
+    cnpj_processor.build_name_index(str(cache_path), str(index_path))
+    built = {table_name: (index_path / table_name / cnpj_processor.NAME_INDEX_META_FILE).read_text()
+             for table_name in cnpj_processor.NAME_INDEX_SOURCES}
+
+    # Só o cache dos estabelecimentos muda: o subíndice das empresas é mantido como estava
+    build_cache(tmp_path / 'data', cache_path, 'estabelecimento',
+                TABLE_LINES['estabelecimento'] + [establishment('44444444', '0001', '05', 'SORVETERIA POLO NORTE')], 'v2')
+    with caplog.at_level(logging.INFO):
+        cnpj_processor.build_name_index(str(cache_path), str(index_path))
+    assert 'Índice de busca por nome de EMPRESA já está atualizado' in caplog.text
+    assert 'ESTABELECIMENTO já está atualizado' not in caplog.text
+    assert (index_path / 'empresa' / cnpj_processor.NAME_INDEX_META_FILE).read_text() == built['empresa']
+    assert (index_path / 'estabelecimento' / cnpj_processor.NAME_INDEX_META_FILE).read_text() != built['estabelecimento']
+    assert cnpj_search.NameSearch(str(index_path)).search('sorveteria polo norte')['cnpj_basico'].tolist() == ['44444444']
@@ -0,0 +1,79 @@
+import logging
+import re
+
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+synthetic_data = pytest.importorskip('synthetic_data', exc_type=ImportError)
+
+TABLES = ['empresa', 'pais', 'natju']
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    zip_path = tmp_path / 'zips'
+    expected = synthetic_data.generate_synthetic_dataset(str(zip_path), companies=2000, bad_line_rate=0.0)
+    return str(zip_path), {table_name: expected[table_name] for table_name in TABLES}
+
+
+@pytest.fixture
+def sink(tmp_path):
+    sink = cnpj_processor.SqliteSink(str(tmp_path / 'cnpj.sqlite'))
+    sink.prepare_tables(TABLES)
+    yield sink
+    sink.close()
+
+
+def count_rows(sink):
+    return {table_name: sink.connection.execute(f'SELECT COUNT(*) FROM {table_name}').fetchone()[0]
+            for table_name in TABLES}
+
+
+def test_parallel_load_counts_rows_per_table(dataset, sink, caplog):
+    zip_path, expected = dataset
+    with caplog.at_level(logging.INFO):
+        cnpj_processor.process_and_load_data(sink, zip_path, from_zip=True, parse_workers=2, queue_chunks=1,
+                                             tables=TABLES)
+    assert count_rows(sink) == expected
+    for table_name, rows in expected.items():
+        assert f'Tabela {table_name.upper()} finalizada! {rows} linhas inseridas' in caplog.text
+
+
+class FailingSink(cnpj_processor.SqliteSink):
+    def _write(self, df, table_name):
+        raise RuntimeError('falha simulada')
+
+
+def test_failed_chunks_are_not_counted_as_inserted(dataset, tmp_path, caplog):
+    zip_path, expected = dataset
+    sink = FailingSink(str(tmp_path / 'falha.sqlite'))
+    journal = cnpj_processor.LoadJournal(str(tmp_path))
+    journal.start(TABLES, False, '', {})
+    try:
+        with caplog.at_level(logging.INFO), pytest.raises(RuntimeError, match='Carga incompleta'):
+            cnpj_processor.process_and_load_data(sink, zip_path, from_zip=True, parse_workers=2, queue_chunks=1,
+                                                 tables=TABLES, journal=journal)
+    finally:
+        journal.close()
+        sink.close()
+    assert re.search(rf"Tabela PAIS finalizada! 0 linhas inseridas em \d+s; {expected['pais']} linhas na fila de retentativa",
+                     caplog.text)
+
+
+class BrokenJournal(cnpj_processor.LoadJournal):
+    """Jornal cuja gravação falha (disco cheio): o erro acontece no escritor, fora do sink."""
+
+    def record_chunk(self, event, entry, **extra):
+        raise OSError('disco cheio')
+
+
+def test_writer_failure_ends_the_run_with_an_error(dataset, sink, tmp_path):
+    zip_path, _ = dataset
+    journal = BrokenJournal(str(tmp_path))
+    journal.start(TABLES, False, '', {})
+    try:
+        with pytest.raises(OSError, match='disco cheio'):
+            cnpj_processor.process_and_load_data(sink, zip_path, from_zip=True, parse_workers=2, queue_chunks=1,
+                                                 tables=TABLES, journal=journal)
+    finally:
+        journal.close()
@@ -0,0 +1,20 @@
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+pytest.importorskip('pyarrow')
+
+
+def test_failed_file_keeps_previous_cache(tmp_path):
+    data_path, cache_path = tmp_path / 'data', tmp_path / 'cache'
+    data_path.mkdir()
+    (data_path / 'F1.PAISCSV').write_bytes(b'"1";"BRASIL"\n"2";"ARGENTINA"\n')
+    schema = cnpj_processor.get_table_schemas()['pais']
+    cnpj_processor.build_table_cache('pais', ['F1.PAISCSV'], schema, str(data_path), str(cache_path), 'v1')
+    assert cnpj_processor.get_cache_fingerprint(str(cache_path), 'pais') == 'v1'
+
+    # O segundo arquivo não existe: a geração falha sem gravar um cache parcial
+    with pytest.raises(RuntimeError):
+        cnpj_processor.build_table_cache('pais', ['F1.PAISCSV', 'F2.PAISCSV'], schema,
+                                         str(data_path), str(cache_path), 'v2')
+    assert cnpj_processor.get_cache_fingerprint(str(cache_path), 'pais') == 'v1'
+    assert sorted(path.name for path in cache_path.iterdir()) == ['pais']
@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+
+LIMITS = {'network': 2, 'disk': 2, 'cpu': 2, 'db': 1}
+
+
+class Recorder:
+    """Etapas falsas: registram início e fim e o pico de tarefas simultâneas por recurso."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.running = {}
+        self.peak = {}
+
+    def stage(self, name, resource, seconds=0.05, error=None):
+        with self.lock:
+            self.events.append(('start', name))
+            self.running[resource] = self.running.get(resource, 0) + 1
+            self.peak[resource] = max(self.peak.get(resource, 0), self.running[resource])
+        time.sleep(seconds)
+        with self.lock:
+            self.running[resource] -= 1
+            self.events.append(('end', name))
+        if error is not None:
+            raise error
+        return name
+
+    def index(self, kind, name):
+        return self.events.index((kind, name))
+
+
+def test_load_waits_for_download_and_extract():
+    recorder = Recorder()
+    scheduler = cnpj_processor.PipelineScheduler(LIMITS)
+    download = scheduler.add('download', 'network', recorder.stage, 'download', 'network')
+    extract = scheduler.add('extract', 'disk', recorder.stage, 'extract', 'disk', depends=[download])
+    other = scheduler.add('download_outro', 'network', recorder.stage, 'download_outro', 'network')
+    scheduler.add('load', 'db', recorder.stage, 'load', 'db', depends=[extract, other])
+
+    results = scheduler.run()
+    assert results == {name: name for name in ('download', 'extract', 'download_outro', 'load')}
+    assert recorder.index('end', 'download') < recorder.index('start', 'extract')
+    assert recorder.index('end', 'extract') < recorder.index('start', 'load')
+    assert recorder.index('end', 'download_outro') < recorder.index('start', 'load')
+    # Downloads independentes correm juntos
+    assert recorder.index('start', 'download_outro') < recorder.index('end', 'download')
+
+
+def test_failed_download_skips_its_dependents(caplog):
+    recorder = Recorder()
+    scheduler = cnpj_processor.PipelineScheduler(LIMITS)
+    download = scheduler.add('download', 'network', recorder.stage, 'download', 'network', 0.01, IOError('rede'))
+    extract = scheduler.add('extract', 'disk', recorder.stage, 'extract', 'disk', depends=[download])
+    scheduler.add('load', 'db', recorder.stage, 'load', 'db', depends=[extract])
+    scheduler.add('independente', 'cpu', recorder.stage, 'independente', 'cpu')
+
+    with caplog.at_level(logging.ERROR), pytest.raises(IOError, match='rede'):
+        scheduler.run()
+    started = {name for kind, name in recorder.events if kind == 'start'}
+    assert started == {'download', 'independente'}
+    assert ('end', 'independente') in recorder.events
+    # Só a causa é registrada, não as tarefas puladas
+    assert "Tarefa 'download' do pipeline falhou" in caplog.text
+    assert "Tarefa 'load'" not in caplog.text
+
+
+def test_unknown_dependency_is_rejected():
+    scheduler = cnpj_processor.PipelineScheduler(LIMITS)
+    with pytest.raises(ValueError, match='inexistentes'):
+        scheduler.add('load', 'db', print, depends=['download'])
+
+
+def test_resource_limits_are_respected():
+    recorder = Recorder()
+    scheduler = cnpj_processor.PipelineScheduler(LIMITS)
+    for i in range(6):
+        scheduler.add(f'extract_{i}', 'disk', recorder.stage, f'extract_{i}', 'disk')
+        scheduler.add(f'load_{i}', 'db', recorder.stage, f'load_{i}', 'db', 0.02)
+    scheduler.run()
+    assert recorder.peak == {'disk': 2, 'db': 1}
@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+
+LOCAL_FILES = {'Estabelecimentos0.zip': {'sha256': 'abc'}}
+
+
+def test_bridge_schema_changes_the_source_table_fingerprint(monkeypatch):
+    before = cnpj_processor.get_table_fingerprint('estabelecimento', ['Estabelecimentos0.zip'], LOCAL_FILES)
+    bridge = cnpj_processor.DERIVED_TABLE_SCHEMAS['estabelecimento_cnae_secundaria']
+    monkeypatch.setitem(cnpj_processor.DERIVED_TABLE_SCHEMAS, 'estabelecimento_cnae_secundaria',
+                        bridge[:-1] + [('cnae', 'varchar', 8)])
+    after = cnpj_processor.get_table_fingerprint('estabelecimento', ['Estabelecimentos0.zip'], LOCAL_FILES)
+    assert before['fingerprint'] != after['fingerprint']
+
+
+def test_tables_without_bridges_keep_their_fingerprint(monkeypatch):
+    before = cnpj_processor.get_table_fingerprint('empresa', ['Estabelecimentos0.zip'], LOCAL_FILES)
+    monkeypatch.setattr(cnpj_processor, 'BRIDGE_TABLES', {})
+    assert cnpj_processor.get_table_fingerprint('empresa', ['Estabelecimentos0.zip'], LOCAL_FILES) == before
+
+
+def test_malformed_codes_are_rejected_not_truncated(caplog):
+    chunk = pd.DataFrame({
+        'cnpj_basico': ['00000001', '00000002'], 'cnpj_ordem': ['0001', '0001'], 'cnpj_dv': ['01', '02'],
+        'cnae_fiscal_secundaria': ['4781400, 4789099,4781400', '47814001,47X9099,,6201501'],
+    })
+    bridge = cnpj_processor.explode_secondary_cnaes(chunk)
+    assert bridge[['cnpj_basico', 'cnae']].values.tolist() == [
+        ['00000001', '4781400'], ['00000001', '4789099'], ['00000002', '6201501']]
+    assert '2 códigos de CNAE secundário inválidos' in caplog.text
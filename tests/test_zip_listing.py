@@ -0,0 +1,16 @@
+import zipfile
+
+import pytest
+
+cnpj_processor = pytest.importorskip('cnpj_processor', exc_type=ImportError)
+
+
+def test_listing_is_limited_to_the_given_zips(tmp_path):
+    with zipfile.ZipFile(tmp_path / 'Paises.zip', 'w') as zip_ref:
+        zip_ref.writestr('F.K03200$Z.D40113.PAISCSV', b'"1";"BRASIL"\n')
+    # ZIP de outra tabela ainda sendo baixado (parcial): não pode ser aberto
+    (tmp_path / 'Estabelecimentos0.zip').write_bytes(b'PK\x03\x04 parcial')
+
+    mappings = cnpj_processor.classify_files(str(tmp_path), from_zip=True, zip_names=['Paises.zip'])
+    assert mappings['pais'] == ['Paises.zip::F.K03200$Z.D40113.PAISCSV']
+    assert mappings['estabelecimento'] == []